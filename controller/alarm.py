@@ -4,10 +4,27 @@ import math
 import numpy as np
 import time
 import atexit
+import http.client
 import json
 import subprocess
 import os
 from threading import Thread
+from queue import Queue, Empty
+from collections import deque
+from framereader import FrameReader
+import codec
+from eventstore import EventStore
+from deadlines import DeadlineScheduler
+from denon import DenonClient
+from audiocache import AudioCache
+from txqueue import TransmitQueue
+from powersequencer import PowerSequencer
+from outputmanager import OutputManager
+from groups import GroupDirectory, GROUP_ADDRESS, GROUP_REPORTS
+import metrics
+from tracing import Tracer
+from capture import CaptureWriter
+from clock import SystemClock
 
 debug = False
 LISTEN_PORT=8080
@@ -19,10 +36,13 @@ garageDoorOpenerId = 0xD0
 garageDoorSensorId = 0x30
 exceptMissingDevices = {hex(denonId): True, hex(garageDoorOpenerId): True}
 denonPlayThread = 0
-lastSentMessageTimeMsec = 0
 homeBaseId = 0x14 #interdependent with deviceDictionary
 broadcastId = 0x00
-pastEvents = []
+eventStore = None #EventStore, opened by run()
+eventsDbPath = os.path.dirname(__file__) + '/events.db'
+pastEventsMaxAgeSec = 90*24*60*60 #retention of the events db: by age...
+pastEventsMaxCount = 100000 #...and by number of events
+pastEventsPageSize = 200 #most events sent to a client per GET-PAST-EVENTS request
 alarmed = False
 alarmedDevicesInCurrentArmCycle = {}
 missingDevicesInCurrentArmCycle = {}
@@ -31,6 +51,7 @@ currentlyAlarmedDevices = {} #map of {string hex id:int alarmTimeSec}
 currentlyMissingDevices = []
 everMissingDevices = {}
 lastAlarmTime = 0
+lastAlarmClockSec = 0 #clock.monotonicNs() of lastAlarmTime, in seconds - what the alarm length is timed from
 armed = False #initial condition
 lastArmedTogglePressed = 0
 deviceAbsenceThresholdSec = 7
@@ -38,16 +59,48 @@ firstPowerCommandNeedsToBeSent = True
 timeAllottedToBuildOutMembersSec = 2
 initWaitSeconds = 5
 alarmReason = ""
-sendTimeoutMsec = 500
-lastCheckedMissingDevicesMsec = 0
-checkForMissingDevicesEveryMsec = 750
+checkEveryMsec = 500 #longest the engine loop waits on a silent bus before re-running its timed checks (alarm timeout, output keepalives)
+alarmOutputKeepaliveSec = {0x03: 2, 0x04: 2, 0x10: 5} #device type -> how often an alarm output's unchanged on/off state is repeated
+defaultAlarmOutputKeepaliveSec = 3 #other device types, and broadcast
+lastCheckedMissingDevicesMsec = 0 #monotonic, see clock
+checkForMissingDevicesEveryMsec = 750 #while devices are missing, how often the missing-device alarm is re-evaluated
+memberDeadlines = DeadlineScheduler() #member id -> monotonic time (see clock) it counts as missing if it isn't heard from again
+memberLastHeardClockSec = {} #member id -> getClockSec() when it was last heard from, for the metrics - lastSeen is wall clock
+missingMembers = {} #member id -> time its deadline passed; cleared when it is heard from again
 currentAlarmProfile = 0 # 0 = default
 threadShouldTerminate = False
+engineQueue = None #single queue the main loop blocks on: web server requests and CAN frames from serialReaderThreadMain
+serialReaderThread = 0
+frameReader = None
+loopIterationTime = metrics.Histogram(metrics.LOOP_BUCKETS_SEC) #engine loop: handling one frame or request, or one round of the timed checks
+triggerToOutputTime = metrics.Histogram(metrics.OUTPUT_BUCKETS_SEC) #from the frame (or missed deadline) that sets off an alarm to its first 0xBB on the wire
+alarmTriggeredTimeNs = None #monotonic time the alarm went off, until its first 0xBB frame is written
+framesPerSender = [0] * 256 #frames handled, by sender id
+tracer = Tracer(capacity=4096, enabled=False) #spans of the alarm path from frame to siren and announcement, see tracing.py; exported by GET-TRACES
+frameTraces = {} #tuple(frame) -> trace that queued it, for its span on the transmit thread (only while tracing)
+clock = SystemClock() #the engine's time, see clock.py; set a clock.VirtualClock before run() to play out its timeouts faster than real time
+readableTimeCache = (None, "") #(timestamp, text) of the last getReadableTimeFromTimestamp - every frame within a second asks for the same one
+statusVersion = time.time_ns() // 1000 #incremented every time the published status changes. Starts at the engine's start time in
+#microseconds, so a restarted engine's versions carry on above the last one's and a client never takes one for the other
+statusListeners = [] #callables taking (statusVersion, status json string, delta json string or None), called on the alarm thread whenever the status changes
+lastPublishedStatusSignature = None
+statusSnapshot = {} #rebuilt and serialized once per status change, see publishStatusIfChanged
+statusSnapshotJson = "{}"
+statusDeltaJson = None #changes from the previous version to statusVersion
+statusHistory = deque(maxlen=32) #(version, snapshot) of recent statuses, to build deltas against
 canDebugMessage = ""
 shouldSendDebugRepeatedly = False
 shouldSendDebugMessage = False
 alwaysKeepOnSet = {"0x30", "0x31", "0x40", "0x50"} #set of devices to always keep powered on (active). This should be limited to non-emitting sensors. #TODO: removing this logic inhibited the intended operation of the garage door sensor when disarmed. It makes sense to always have non-relay devices transmitting and not respond to base power commands, with base filtering the.
 avrSoundChannel = "SAT/CBL"
+denonClient = DenonClient("denonoffice.lan") #keep-alive http to the AVR, see denon.py
+denonPowerOnTimeoutSec = 8 #longest wait for the AVR to report on with avrSoundChannel before playing anyway
+denonInputSwitchTimeoutSec = 3 #same, when it was on already and only the input changes
+useBinaryFraming = False #compact binary serial frames instead of hex text, see codec.py. Must match BINARY_FRAMING in controller.ino
+captureFile = None #e.g. "captures/%Y%m%d-%H%M%S.cap": record every serial frame received and sent, for benchmarks/replay.py. See capture.py
+capture = None #CaptureWriter while capturing
+useGroupAddressing = False #alarm outputs and power-off by CAN group, see groups.py. Only once every node runs firmware that knows groups
+groupDirectory = GroupDirectory(homeBaseId) #groups are allocated as the profiles are compiled below
 
 
 deviceDictionary = {
@@ -83,8 +136,43 @@ def getThisDirAddress():
     return os.path.dirname(__file__)
 
 
+def getDeviceIdTable(deviceIds): #list of hex ids, None for all devices -> 256 bools indexed by integer device id
+    if (deviceIds is None):
+        return (True,) * 256
+    ids = {int(deviceId, 16) for deviceId in deviceIds}
+    return tuple(i in ids for i in range(256))
+
+
+def compileAlarmProfile(profile):
+    #the profile's device lists as lookup tables, so per-frame decisions are one index instead of a key check and a list search
+    sensors = frozenset(hex(int(deviceId, 16)) for deviceId in profile["sensorsThatTriggerAlarm"]) if "sensorsThatTriggerAlarm" in profile else None
+    outputs = tuple(int(deviceId, 16) for deviceId in profile["alarmOutputDevices"]) if "alarmOutputDevices" in profile else None
+    canOutputs = frozenset(output for output in outputs or () if output != denonId) #the denon isn't on the bus
+    return {
+        "triggers": getDeviceIdTable(profile.get("sensorsThatTriggerAlarm")),
+        "missingTriggers": getDeviceIdTable(profile.get("missingDevicesThatTriggerAlarm")),
+        "sensors": sensors,
+        "outputs": outputs,
+        #groups: the outputs (when there's more than one on the bus), and everything powered off while armed under this profile
+        "outputGroup": groupDirectory.getGroupId(("outputs", canOutputs)) if len(canOutputs) > 1 else None,
+        "offGroup": groupDirectory.getGroupId(("off", sensors | alwaysKeepOnSet)) if sensors is not None else None
+    }
+
+
+def getDeviceGroupIds(deviceId): #the groups a device belongs in, under all profiles
+    groupIds = set()
+    for profile in compiledAlarmProfiles:
+        if (profile["outputGroup"] is not None and int(deviceId, 16) in profile["outputs"]):
+            groupIds.add(profile["outputGroup"])
+        if (profile["offGroup"] is not None and deviceId not in profile["sensors"] and deviceId not in alwaysKeepOnSet):
+            groupIds.add(profile["offGroup"])
+    return groupIds
+
+
 with open(getThisDirAddress() + '/alarmProfiles.json', 'r') as file:
     alarmProfiles = json.loads(file.read())
+compiledAlarmProfiles = [compileAlarmProfile(profile) for profile in alarmProfiles] #same indexes as alarmProfiles
+audioCache = AudioCache(getThisDirAddress(), maxAnnouncements=16) #decoded announcement clips, see audiocache.py
 
 ###################### MESSAGES #######################
 # 0xBB - alarm on signal
@@ -97,10 +185,18 @@ with open(getThisDirAddress() + '/alarmProfiles.json', 'r') as file:
 # 0xB0 - sending over to home base arduino (address 0xFF) the address of the no longer alarmed device
 # 0xC0 - sending over to home base arduino (address 0xFF) stop alarm signal
 # 0xEE - arm toggle button on unit pressed
+# 0xE1 - join group (group id in the device type byte)
+# 0xE2 - leave group (group id in the device type byte)
+# 0xE3 - clear all groups
+# 0xE4 - ask a device which groups it is in
+# 0xE5 - from a device - in the group in the device type byte
+# 0xE6 - from a device - not in the group in the device type byte
+# 0xE7 - from a device - end of its groups, how many in the device type byte
 
 ###################### ADDRESSES ######################
 #0x00 - broadcast
 #0xFF - code for home base's arduino. Message isn't forwarded by arduino to CANBUS.
+#0xF0 - group; the group id is sent in place of the device type. See groups.py
 #0x80 - garage, commercial type (high emmissions, long range)
 #0x75 - inside, consumer type (short range)
 #0x14 - home base
@@ -131,9 +227,16 @@ with open(getThisDirAddress() + '/alarmProfiles.json', 'r') as file:
 #name of ARDUINO tty device
 #on mac: /dev/tty.usbserial-10
 #on linux: /dev/ttyUSB0
+#or anything pyserial's serial_for_url takes: a pty of a simulated bus (benchmarks/fleetsim.py), loop:// to hear ourselves
+serialPort = '/dev/ttyUSB0'
+ser = None #opened from serialPort by run(), unless one is handed in before it (alarm.ser = ...)
+
+def openSerialPort():
+    global ser
+    if (ser is None):
+        ser = serial.serial_for_url(serialPort, baudrate=115200, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=.25) #quarter second timeout so that the serial reader thread doesn't block forever if no message(s) on CAN
+    print("Arduino: serial connection with PI established")
 
-ser = serial.Serial('/dev/ttyUSB0', baudrate=115200, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=.25) #quarter second timeout so that Serial.readLine() doesn't block if no message(s) on CAN
-print("Arduino: serial connection with PI established")
 np.set_printoptions(formatter={'int':hex})
 
 #NEW DEVICES POWER FUNCTION
@@ -143,17 +246,19 @@ def setDevicesPower():
     onDevices = []
     # if not armed, send OFF to all
     # if armed, send OFF or ON to all depending on whether the device is in the profile's sensorsthattrigger
+    # the frames are sent by powerSequencer in the background, power-on ones staggered - see powersequencer.py
     if not armed:
-        sendPowerCommand([], True, False)
-        sendPowerCommand(list(alwaysKeepOnSet), False, True)
+        frames = getPowerCommandFrames([], True, False) + getPowerCommandFrames(list(alwaysKeepOnSet), False, True)
     else:
         offDevices, onDevices = getDevicesPowerStateLists()
-        sendPowerCommand(offDevices, False, False)
-        sendPowerCommand(onDevices, False, True)
+        frames = getPowerCommandFrames(offDevices, False, False, compiledAlarmProfiles[currentAlarmProfile]["offGroup"]) + getPowerCommandFrames(onDevices, False, True)
+    print(f">>>> POWER SEQUENCE {[f'{hex(frame[1])}:' + ('ON' if frame[2] == 0x0F else 'OFF') for frame in frames]}")
+    powerSequencer.start(frames)
 
 def getDevicesPowerStateLists(): #devices per current profile
     oldProfilesSet = set(memberDevices)
-    newProfilesSet = set(alarmProfiles[currentAlarmProfile]['sensorsThatTriggerAlarm']) if 'sensorsThatTriggerAlarm' in alarmProfiles[currentAlarmProfile] else set(memberDevices)
+    sensors = compiledAlarmProfiles[currentAlarmProfile]["sensors"]
+    newProfilesSet = set(memberDevices if sensors is None else sensors) #None: no sensorsThatTriggerAlarm, all of them. [] is none
 
     newProfilesSet = newProfilesSet.union(alwaysKeepOnSet)
 
@@ -174,20 +279,24 @@ def setCurrentAlarmProfile(profileNumber): #-1 means no profile set. All devices
         
         currentAlarmProfile = profileNumber
         setDevicesPower()
-        sendMessage([homeBaseId, 0x00, 0xCC, 0x01]) #turn off all alarms as part of this change
+        outputManager.send(0x00, 0xCC) #turn off all alarms as part of this change
         print("SETTING ALARM PROFILE " + str(profileNumber) + " - " + getProfileName(profileNumber))
         addEvent({
             "event": "SET PROFILE : " + str(profileNumber) + " - " + getProfileName(profileNumber),
             "time": getReadableTimeFromTimestamp(getTimeSec()),
-            "method": "WEB API"
+            "timestamp": getTimeSec(),
+            "method": "WEB API",
+            "profileNumber": profileNumber,
+            "profile": getProfileName(profileNumber)
         })
     else:
         print(">>>> PROFILE NUMBER OUT OF RANGE [0," + str(len(alarmProfiles)-1) + "] : " + str(profileNumber))
 
 
 def addEvent(event):
-    global pastEvents
-    pastEvents.append(event)
+    #event: "event" type, readable "time", numeric "timestamp", and "devices" - the hex ids it is about, indexed for searchEvents
+    if (eventStore):
+        eventStore.add(event)
 
 
 def getArmedStatus():
@@ -203,11 +312,13 @@ def toggleArmed(now, method):
     global alarmedDevicesInCurrentArmCycle
     global missingDevicesInCurrentArmCycle
     global currentlyAlarmedDevices
+    global alarmTriggeredTimeNs
     
     lastArmedTogglePressed = now
+    alarmTriggeredTimeNs = None #an alarm disarmed before its first 0xBB went out has no trigger to output time
     if (armed == True):
         print(f">>>>>>>>TURNING OFF ALARM AT {getReadableTimeFromTimestamp(now)} PER {method}<<<<<<<<<")
-        addEvent({"event": "DISARMED", "time": getReadableTimeFromTimestamp(now), "method": method})
+        addEvent({"event": "DISARMED", "time": getReadableTimeFromTimestamp(now), "timestamp": now, "method": method})
         armed = False #TODO: add logging of event and source
         alarmed = False #reset alarmed state
         everTriggeredWithinAlarmCycle = {}
@@ -216,7 +327,7 @@ def toggleArmed(now, method):
         missingDevicesInCurrentArmCycle = {}
     else:
         print(f">>>>>>>>TURNING ON ALARM AT {getReadableTimeFromTimestamp(now)} PER {method}<<<<<<<<<")
-        addEvent({"event": "ARMED", "time": getReadableTimeFromTimestamp(now), "method": method})
+        addEvent({"event": "ARMED", "time": getReadableTimeFromTimestamp(now), "timestamp": now, "method": method})
         armed = True #TODO: add logging of event and source
         alarmed = False #reset alarmed state
         everTriggeredWithinAlarmCycle = {}
@@ -230,6 +341,11 @@ def toggleArmed(now, method):
 
 def resetMemberDevices():
     global memberDevices
+    global missingMembers
+    memberDeadlines.clear()
+    memberLastHeardClockSec.clear()
+    memberLastHeardClockSec[hex(denonId)] = getClockSec()
+    missingMembers = {}
     memberDevices = {
         hex(denonId): {
             'id': hex(denonId),
@@ -243,39 +359,47 @@ def resetMemberDevices():
     }
 
 
-def decodeLine(line):
-    try:
-        msg = line.split("-")
-        msg[3] = msg[3].rstrip('\n')
-        msg = [int(i, 16) for i in msg]
-    except:
-        print(f">>>>ERROR DECODING UTF8 LINE {msg}<<<<<")
-        raise("PARSE-ERROR")
-    return msg
+def decodeFrame(frame): #raw bytes of one frame -> [sender, receiver, message, deviceType]
+    return codec.decodeBinaryFrame(frame) if useBinaryFraming else codec.decodeTextFrame(frame)
 
 
-def encodeLine(message): #[myCanId, addressee, message, myDeviceType]
-    printableArr = message.copy()
-    printableArr.append(getTimeSec())
-    #print("SENDING ", np.array(printableArr)); #TODO: uncomment
-    return (hex(message[0]) + "-" + hex(message[1]) + "-" + hex(message[2]) + "-" + hex(message[3]) + "-\n")
+def encodeFrame(message): #[myCanId, addressee, message, myDeviceType]
+    return codec.encodeBinaryFrame(message) if useBinaryFraming else codec.encodeTextFrame(message)
 
 
-def sendMessage(messageArray): 
-    global lastSentMessageTimeMsec
+def sendMessage(messageArray, pauseBeforeSec = 0): #queued for the transmit thread, see txqueue.py
     global denonPlayThread
     # global everTriggeredWithinAlarmCycle
     # global mp3AlarmDictionary
     # global currentlyAlarmedDevices
 
-    outgoing = encodeLine(messageArray)
-    ser.write(bytearray(outgoing, 'ascii'))
-    ser.flushOutput()
-    lastSentMessageTimeMsec = getTimeMsec()
-    if (messageArray[1] == denonId or messageArray[1] == 0x00):
-        if (messageArray[2] == 0xBB and not (denonPlayThread and denonPlayThread.is_alive())):            
-            denonPlayThread = Thread(target = playDenonThreadMain, args = (currentlyAlarmedDevices, everTriggeredWithinAlarmCycle, mp3AlarmDictionary))
-            denonPlayThread.start()
+    with tracer.span("sendMessage", receiver=codec.HEX_IDS[messageArray[1]], message=codec.HEX_IDS[messageArray[2]]):
+        if (tracer.enabled):
+            frameTraces[tuple(messageArray)] = tracer.getTrace()
+        txQueue.send(messageArray, pauseBeforeSec)
+        if (messageArray[1] == denonId or messageArray[1] == 0x00):
+            if (messageArray[2] == 0xBB and not (denonPlayThread and denonPlayThread.is_alive())):            
+                denonPlayThread = Thread(target = playDenonThreadMain, args = (currentlyAlarmedDevices, everTriggeredWithinAlarmCycle, mp3AlarmDictionary, tracer.getTrace()))
+                denonPlayThread.start()
+
+
+def writeFrame(messageArray): #on the transmit thread
+    global alarmTriggeredTimeNs
+    if (tracer.enabled):
+        tracer.setTrace(frameTraces.pop(tuple(messageArray), None))
+    with tracer.span("writeFrame", receiver=codec.HEX_IDS[messageArray[1]], message=codec.HEX_IDS[messageArray[2]]):
+        frame = encodeFrame(messageArray)
+        ser.write(frame)
+        ser.flush() #wait until it is out, so the spacing between frames is spacing on the wire
+    if (capture):
+        capture.recordSent(frame if useBinaryFraming else frame.rstrip(b"-\n")) #as received frames are recorded: no separator
+    triggeredTimeNs = alarmTriggeredTimeNs
+    if (triggeredTimeNs is not None and messageArray[2] == 0xBB):
+        alarmTriggeredTimeNs = None
+        triggerToOutputTime.observe((time.monotonic_ns() - triggeredTimeNs) / 1e9)
+
+
+txQueue = TransmitQueue(writeFrame)
 
 
 def getCurrentProfileSoundByteData():
@@ -298,7 +422,7 @@ def getCurrentProfileSoundByteData():
 
 
 def getTime():
-    return datetime.now().timestamp()
+    return clock.wallTime()
     #return math.floor(datetime.now(timezone('US/Pacific')).timestamp())
 
 
@@ -315,20 +439,37 @@ def getReadableTime():
 
 
 def getReadableTimeFromTimestamp(timestamp):
-    return f"{datetime.fromtimestamp(timestamp).strftime('%c')} LOCAL TIME"
+    global readableTimeCache
+    if (readableTimeCache[0] != timestamp):
+        readableTimeCache = (timestamp, f"{datetime.fromtimestamp(timestamp).strftime('%c')} LOCAL TIME")
+    return readableTimeCache[1]
+
 
+def getClockSec(): #monotonic seconds of the engine's clock, for timing rather than showing
+    return clock.monotonicNs() / 1e9
 
-def possiblyAddMember(msg):
+
+def possiblyAddMember(msg, now, clockSec):
+    #now - wall clock seconds, for lastSeen and the event; clockSec - getClockSec() of the same loop iteration, for the deadline
     global memberDevices
-    now = getTimeSec()
+    global currentlyMissingDevices
     if (msg[0] != homeBaseId):
-        readableTimestamp = getReadableTime()
-
-        if (hex(msg[0]) not in memberDevices) :
-            print(f"Adding new device to members list {hex(msg[0])} at {readableTimestamp}")
-            addEvent({"event": "NEW_MEMBER", "trigger": hex(msg[0]), "time": readableTimestamp})
-            memberDevices[hex(msg[0])] = {
-                'id': hex(msg[0]),
+        readableTimestamp = getReadableTimeFromTimestamp(now)
+        deviceId = codec.HEX_IDS[msg[0]]
+        memberLastHeardClockSec[deviceId] = clockSec
+
+        if (deviceId not in exceptMissingDevices):
+            memberDeadlines.set(deviceId, clockSec + deviceAbsenceThresholdSec) #missing once not heard from for deviceAbsenceThresholdSec
+            if (missingMembers.pop(deviceId, None) is not None):
+                print(f"Removing missing device {deviceId} at {readableTimestamp}.")
+                currentlyMissingDevices = list(missingMembers)
+                groupDirectory.forget(deviceId) #it may have been reset or swapped while away
+
+        if (deviceId not in memberDevices) :
+            print(f"Adding new device to members list {deviceId} at {readableTimestamp}")
+            addEvent({"event": "NEW_MEMBER", "trigger": deviceId, "devices": [deviceId], "time": readableTimestamp, "timestamp": now})
+            memberDevices[deviceId] = {
+                'id': deviceId,
                 'firstSeen': now,
                 'firstSeenReadable': readableTimestamp,
                 'deviceType': msg[3],
@@ -337,13 +478,20 @@ def possiblyAddMember(msg):
                 'friendlyName': getFriendlyDeviceName(msg[0])
             }
         else :
-            memberDevices[hex(msg[0])]['lastSeen'] = now
-            memberDevices[hex(msg[0])]['lastSeenReadable'] = readableTimestamp
-            # if (hex(msg[0]) in currentlyMissingDevices):
-            #     print(f"Removing missing device {hex(msg[0])} at {getReadableTime()}.")
+            memberDevices[deviceId]['lastSeen'] = now
+            memberDevices[deviceId]['lastSeenReadable'] = readableTimestamp
+
+        if (useGroupAddressing):
+            sendGroupFrames(deviceId, clockSec)
 
 
-def playDenonThreadMain(currentlyAlarmedDevices, everAlarmedDuringAlarm, mp3AlarmDictionary):
+def sendGroupFrames(deviceId, clockSec): #whatever deviceId still has to be asked or told about its groups, see groups.py
+    for frame in groupDirectory.getJoinFrames(deviceId, getDeviceGroupIds(deviceId), clockSec): #nothing once it is up to date
+        sendMessage(frame)
+
+
+def playDenonThreadMain(currentlyAlarmedDevices, everAlarmedDuringAlarm, mp3AlarmDictionary, traceId = None):
+    tracer.setTrace(traceId) #the trace of the frame that set off the alarm
     cwd = getThisDirAddress()
     playCommandArray = ["/usr/bin/mpg123"]
     volume = "55" #default
@@ -355,12 +503,24 @@ def playDenonThreadMain(currentlyAlarmedDevices, everAlarmedDuringAlarm, mp3Alar
     #fall back to saying the sensors that are activated
 
     playCommandArray, volume = determineStuffToPlay(playCommandArray, volume, everAlarmedDuringAlarm, currentlyAlarmedDevices)
-    startPowerStatus, startChannelStatus, startVolume = getDenonInitialState(cwd)
+    announcement = audioCache.startAnnouncement([os.path.normpath(fileName) for fileName in playCommandArray[1:]]) #decoded, if it isn't cached, while the denon turns on
+    with tracer.span("denon.stateQuery"):
+        startPowerStatus, startChannelStatus, startVolume = getDenonInitialState()
     if (startPowerStatus == False and startChannelStatus == False and startVolume == False):
         return
-    setDenonPlayState(startPowerStatus, startChannelStatus, volume, cwd)
-    playDenonSounds(playCommandArray, cwd)
-    setDenonOriginalState(startPowerStatus, startChannelStatus, startVolume, cwd)
+    try:
+        setDenonPlayState(startPowerStatus, startChannelStatus, volume)
+        announcement = announcement.result()
+        with tracer.span("denon.playback", cached=announcement is not None):
+            playDenonSounds(playCommandArray, cwd, announcement)
+    except (OSError, http.client.HTTPException) as e: #the AVR going away mid-alarm, or answering with an error
+        print(f">>>>DENON ERROR {e}")
+    finally: #whatever happened above, don't leave it on the alarm input at alarm volume
+        try:
+            with tracer.span("denon.restore"):
+                setDenonOriginalState(startPowerStatus, startChannelStatus, startVolume)
+        except (OSError, http.client.HTTPException) as e:
+            print(f">>>>DENON ERROR RESTORING ITS STATE {e}")
 
 
 def determineStuffToPlay(playCommandArray, volume, everAlarmedDuringAlarm, currentlyAlarmedDevices):
@@ -395,62 +555,60 @@ def determineStuffToPlay(playCommandArray, volume, everAlarmedDuringAlarm, curre
     return playCommandArray, volume
 
 
-def playDenonSounds(playCommandArray, cwd):
-    #play sound(s) 
+def playDenonSounds(playCommandArray, cwd, announcement = None):
+    #play sound(s) - the cached pcm if there is one, otherwise decode the mp3s with mpg123 as they play. mpg123 only
+    #if out123 couldn't start - not after it has played some or all of the announcement
+    if (announcement is not None and audioCache.play(announcement)):
+        print(f">>>>PLAYED CACHED ANNOUNCEMENT, AUDIO CACHE {audioCache.getCounters()}")
+        return
     subprocess.run(
         playCommandArray, 
         cwd=cwd
     )
 
 
-def setDenonPlayState(startPowerStatus, startChannelStatus, volume, cwd):
+def getAnnouncementFileNames(): #every clip determineStuffToPlay can pick, to decode ahead of the first alarm
+    fileNames = ["alert.mp3", "thisisatest.mp3", "checkyourphones.mp3"] + list(mp3AlarmDictionary.values())
+    fileNames += [profile["playSound"] for profile in alarmProfiles if profile.get("playSound")]
+    return list(dict.fromkeys(fileNames))
+
+
+def setDenonPlayState(startPowerStatus, startChannelStatus, volume):
     #turn on and switch to $avrSoundChannel if previously off OR previously channel isn't $avrSoundChannel;
-    #then sleep the appropriate number of seconds to let denon get ready 
+    #then wait until denon reports it is ready (at most the time it used to be given unconditionally)
     if (startPowerStatus != 'ON' or startChannelStatus != avrSoundChannel):
-        subprocess.run("./denonon.sh", cwd=cwd)
-        time.sleep(8 if startPowerStatus != 'ON' else 3)
+        with tracer.span("denon.powerOn", wasOn=startPowerStatus == 'ON') as span:
+            denonClient.powerOn(avrSoundChannel)
+            if (not denonClient.waitUntilReady(avrSoundChannel, denonPowerOnTimeoutSec if startPowerStatus != 'ON' else denonInputSwitchTimeoutSec)):
+                print('>>>>DENON NOT READY IN TIME, PLAYING ANYWAY')
+                span.set(timedOut=True)
     
     #set volume
-    subprocess.run(["./denonvol.sh", str(volume)], cwd=str(cwd))
+    with tracer.span("denon.volume"):
+        denonClient.setVolume(volume)
 
 
-def setDenonOriginalState(startPowerStatus, startChannelStatus, startVolume, cwd):
+def setDenonOriginalState(startPowerStatus, startChannelStatus, startVolume):
     #turn off if was off before
     if (startPowerStatus != 'ON'): #TODO: add condition: and the alarm has been canceled
-        subprocess.run(os.path.dirname(__file__) + "/denonoff.sh", cwd=cwd)
+        denonClient.powerOff()
     #otherwise, set volume to old volume
     else :
-        subprocess.run(["./denonvol.sh", startVolume], cwd=cwd)
+        denonClient.setVolume(startVolume)
         if (startChannelStatus != avrSoundChannel):
-            subprocess.run(["./denonchannel.sh", startChannelStatus], cwd=cwd)
+            denonClient.setInput(startChannelStatus)
 
 
-def getDenonInitialState(cwd):
-    #store original power status
-    startPowerStatus = str(
-        subprocess.run("./denonpowerstatus.sh", cwd=cwd, stderr=None, capture_output=True).stdout
-        ).translate({ord(c): None for c in 'b\\n\''})
+def getDenonInitialState():
+    #store original power status, channel and volume
+    state = denonClient.getState()
 
     #if cannot find denon, cannot play -> exit thread
-    if (startPowerStatus == ''):
+    if (not state or not state["power"]):
         print('>>>>DENON NOT FOUND')
         return False, False, False #signals quit now
 
-    #store original channel
-    startChannelStatus = str(
-        subprocess.run("./denonchannelstatus.sh", cwd=cwd, stderr=None, capture_output=True).stdout
-        ).translate({ord(c): None for c in 'b\\n\''})
-
-    #store original volume    
-    tempvol = str(
-        subprocess.run("./denonvolumestatus.sh", cwd=cwd, stderr=None, capture_output=True).stdout
-        ).translate({ord(c): None for c in 'b\\n\''})
-    if (tempvol == '--'):
-        tempvol = '0'
-
-    startVolume = str(int(float(tempvol)+81))
-
-    return startPowerStatus, startChannelStatus, startVolume
+    return state["power"], state["input"], state["volume"]
 
 
 def getFriendlyDeviceName(address):
@@ -468,19 +626,38 @@ def getFriendlyDeviceNamesFromDeviceDictionary(dict):
     return friendlyDeviceNames;
 
 
-def checkMembersOnline():
-    now = getTimeSec()
+def isMissingDevicesCheckDue(now, clockSec):
+    #a member's deadline has just passed, or devices are still missing and it's time to re-evaluate the alarm for them
+    newlyMissing = False
+    for memberId in memberDeadlines.popExpired(clockSec):
+        if (memberId in memberDevices):
+            print(f"Adding missing device {memberId} at {getReadableTimeFromTimestamp(now)}. missing for {(now-memberDevices[memberId]['lastSeen'])} seconds")
+            missingMembers[memberId] = now
+            newlyMissing = True
+    return newlyMissing or (len(missingMembers) > 0 and lastCheckedMissingDevicesMsec + checkForMissingDevicesEveryMsec < clockSec * 1000)
+
+
+def checkMembersOnline(now, clockSec):
     global lastCheckedMissingDevicesMsec
     global missingDevicesInCurrentArmCycle
-    lastCheckedMissingDevicesMsec = getTimeMsec()
-    missingMembers = []
-    for memberId in memberDevices :
-        if (not memberId in exceptMissingDevices and memberDevices[memberId]['lastSeen'] + deviceAbsenceThresholdSec < now) :
-            print(f"Adding missing device {memberId} at {getReadableTime()}. missing for {(getTimeSec()-memberDevices[memberId]['lastSeen'])} seconds")
-            missingMembers.append(memberId)
-            everMissingDevices[memberId] = True;
-            missingDevicesInCurrentArmCycle[memberId] = now
-    return missingMembers
+    lastCheckedMissingDevicesMsec = clockSec * 1000
+    for memberId in missingMembers:
+        everMissingDevices[memberId] = True;
+        missingDevicesInCurrentArmCycle[memberId] = now
+    return list(missingMembers)
+
+
+def getSecondsUntilNextCheck():
+    #how long the engine loop may wait for a frame or request: until the next member deadline, and at most
+    #the next alarm output keepalive, and at most checkEveryMsec so alarm timeouts run on a silent bus too
+    nextDeadline = memberDeadlines.nextDeadline()
+    nextRefreshSec = outputManager.secondsUntilNextRefresh()
+    timeoutSec = checkEveryMsec / 1000
+    if (nextDeadline is not None):
+        timeoutSec = min(timeoutSec, nextDeadline - getClockSec())
+    if (nextRefreshSec is not None):
+        timeoutSec = min(timeoutSec, nextRefreshSec)
+    return max(0, timeoutSec)
 
 
 def sendArmedLedSignal():
@@ -493,36 +670,47 @@ def sendArmedLedSignal():
     sendMessage(messageToSend)
 
 
-#by default, sends to all members of current profile, unless overridden with at most 1 of the first 2 params
-def sendPowerCommand(devicesOverrideArray, shouldBroadcast, powerState): #two op
-    # global memberDevices
-    # global currentAlarmProfile
-    # global alarmProfiles
-    
-    devicesToSendTo = devicesOverrideArray if devicesOverrideArray else memberDevices if shouldBroadcast else alarmProfiles[currentAlarmProfile]["sensorsThatTriggerAlarm"] if "sensorsThatTriggerAlarm" in alarmProfiles[currentAlarmProfile] else memberDevices
-
+#power frames for the given devices, or one broadcast frame - stand up power - 0x0F enabled / 0x01 disabled
+def getPowerCommandFrames(devices, shouldBroadcast, powerState, groupId = None):
+    #groupId - one frame for the devices that are in that group and one each for the rest. Not for power on: a group
+    #would come on all at once, which is what the staggering in powersequencer.py is there to avoid
     if (shouldBroadcast):
-         messageToSend = [homeBaseId, broadcastId, 0x0F if powerState else 0x01, 0x01]
-         sendMessage(messageToSend)
-         print(f">>>> SENDING POWER {'ON' if powerState else 'OFF'} SIGNAL TO ALL {np.array(messageToSend)}")
-    else: 
-        for member in devicesToSendTo:
-            intMemberId = int(member, 16)
-            messageToSend = [homeBaseId, intMemberId, 0x0F if powerState else 0x01, 0x01]
-            sendMessage(messageToSend) #stand up power - 0x0F enabled / 0x01 disabled
-            print(f">>>> SENDING POWER {'ON' if powerState else 'OFF'} SIGNAL {np.array(messageToSend)}")
-            time.sleep(.07) #in seconds represented as double - to not have a voltage drop from multiple relay-gated PIR/mwave devices powering on (and charging capacitor) simultaneously
+        return [[homeBaseId, broadcastId, 0x0F if powerState else 0x01, 0x01]]
+    frames = []
+    if (useGroupAddressing and groupId is not None):
+        members, devices = groupDirectory.split(groupId, devices)
+        if (members):
+            frames.append([homeBaseId, GROUP_ADDRESS, 0x0F if powerState else 0x01, groupId])
+    return frames + [[homeBaseId, int(member, 16), 0x0F if powerState else 0x01, 0x01] for member in devices]
+
+
+def onPowerSequenceProgress(progress): #on the sequencer thread - hand over to the engine loop, which owns status and events
+    if (engineQueue):
+        engineQueue.put({"request": "POWER-SEQUENCE-PROGRESS", "progress": progress})
+
+
+def sendPowerFrame(messageArray, pauseBeforeSec): #for the power sequencer: queued, and back once it is written
+    txQueue.sendAndWait(messageArray, pauseBeforeSec, timeoutSec=5) #a stuck port holds up the plan, not the sequencer for good
+
+
+powerSequencer = PowerSequencer(sendPowerFrame, onPowerSequenceProgress) #runs the power frames planned by setDevicesPower
 
 
 def exitSteps():
     print(f"\n\nEXITING AT {getReadableTime()}")
+    powerSequencer.cancel()
     print("BROADCASTING QUIET-ALL-ALARMS SIGNAL")
     sendMessage([homeBaseId, 0x00, 0xCC, 0x01]) #reset all devices (broadcast)
     print("BROADCASTING ALL-SENSOR-DEVICES-OFF SIGNAL")
     sendMessage([homeBaseId, 0x00, 0x01, 0x01]) #all devices off (broadcast)
-    print("\nPAST EVENTS LIST FOLLOWS:")
-    for line in pastEvents:
-        print(f"\t{line}")    
+    txQueue.drain(2)
+    if (capture):
+        capture.close()
+    if (eventStore):
+        print("\nLAST 100 PAST EVENTS FOLLOW:")
+        for line in eventStore.getEvents(limit=100): #LIMIT in the query, not the whole history loaded and cut
+            print(f"\t{line}")
+        eventStore.close()
 
 
 def arrayToString(array):
@@ -532,14 +720,15 @@ def arrayToString(array):
     return string
 
 
-def handleMessage(msg):
+def handleMessage(msg, now, clockSec, receivedTimeNs = None):
+    #now, clockSec - the loop iteration's wall clock seconds and getClockSec(), read once for everything it does
     if (debug):
         print(f"SENDER {hex(msg[0])} RECEIVER {hex(msg[1])} MESSAGE {hex(msg[2])} DEVICE-TYPE {hex(msg[3])}")
 
-    possiblyAddMember(msg)
     global alarmed
     global homeBaseId
     global lastAlarmTime
+    global lastAlarmClockSec
     global armed
     global lastArmedTogglePressed
     global alarmReason
@@ -551,7 +740,15 @@ def handleMessage(msg):
     global shouldSendDebugRepeatedly
     global shouldSendDebugMessage
 
-    now = getTimeSec()
+    if (msg[1] == homeBaseId and msg[2] in GROUP_REPORTS): #a node answering about its groups, not a state frame
+        if (msg[0] != homeBaseId):
+            if (useGroupAddressing):
+                groupDirectory.onReport(codec.HEX_IDS[msg[0]], msg[2], msg[3])
+            #heard from, so not missing - and sent whatever the report leaves to ask or tell it. With its device type
+            #as known: the report has a group id in its place
+            possiblyAddMember(msg[:3] + [memberDevices.get(codec.HEX_IDS[msg[0]], {}).get('deviceType', 0x00)], now, clockSec)
+        return
+    possiblyAddMember(msg, now, clockSec)
 
     #if we are faking output from a certain device, ignore all messages from that device and replace with 
     if (shouldSendDebugMessage and msg[0] == canDebugMessage[0]):
@@ -560,36 +757,40 @@ def handleMessage(msg):
             shouldSendDebugMessage = False
             canDebugMessage = []
 
+    deviceId = codec.HEX_IDS[msg[0]] #device ids are keyed as hex strings in the status dicts
+
     #for some messages - handle special cases intended for this unit from arduino, and return; if not, drop down to handle general case logic block
     if (msg[0]==homeBaseId and msg[1]==homeBaseId and msg[2]==0xEE and lastArmedTogglePressed < now): 
         toggleArmed(now, "ARDUINO")
         return
 
     #alarm message coming in from a device that isn't in the currentlyAlarmedDevices list
-    if ((msg[1]==homeBaseId or msg[1]==broadcastId) and msg[2]==0xAA and hex(msg[0]) not in currentlyAlarmedDevices) :
-        currentlyAlarmedDevices[hex(msg[0])] = now;
-        if (not "sensorsThatTriggerAlarm" in alarmProfiles[currentAlarmProfile] or ("sensorsThatTriggerAlarm" in alarmProfiles[currentAlarmProfile] and hex(msg[0]) in alarmProfiles[currentAlarmProfile]["sensorsThatTriggerAlarm"])): #either all alarms trigger (sensorsThatTriggerAlarm missing from profile) OR current device ID in sensorsThatTriggerAlarm
-            print(f">>>>>>>>>>>>>>>>>RECEIVED TRIGGER SIGNAL FROM {hex(msg[0])} AT {getReadableTime()}<<<<<<<<<<<<<<<<<<")
+    if ((msg[1]==homeBaseId or msg[1]==broadcastId) and msg[2]==0xAA and deviceId not in currentlyAlarmedDevices) :
+        currentlyAlarmedDevices[deviceId] = now;
+        if (compiledAlarmProfiles[currentAlarmProfile]["triggers"][msg[0]]): #either all alarms trigger (sensorsThatTriggerAlarm missing from profile) OR current device ID in sensorsThatTriggerAlarm
+            print(f">>>>>>>>>>>>>>>>>RECEIVED TRIGGER SIGNAL FROM {deviceId} AT {getReadableTimeFromTimestamp(now)}<<<<<<<<<<<<<<<<<<")
             if (armed): 
+                startTriggerToOutputTimer(receivedTimeNs)
                 alarmed = True
                 lastAlarmTime = now;
-                alarmedDevicesInCurrentArmCycle[hex(msg[0])] = now;
-                everTriggeredWithinAlarmCycle[hex(msg[0])] = now;
+                lastAlarmClockSec = clockSec
+                alarmedDevicesInCurrentArmCycle[deviceId] = now;
+                everTriggeredWithinAlarmCycle[deviceId] = now;
                 updateCurrentlyTriggeredDevices();
-                addEvent({"event": "TRIGGERED-ALARM", "trigger": alarmReason, "time": getReadableTimeFromTimestamp(lastAlarmTime)})
+                addEvent({"event": "TRIGGERED-ALARM", "trigger": alarmReason, **getAlarmReasonFields(), "time": getReadableTimeFromTimestamp(lastAlarmTime), "timestamp": lastAlarmTime})
                 print (f">>>>>currentAlarmProfile {currentAlarmProfile}")
                 sendMessage([homeBaseId, 0xFF, 0xA0, msg[0]]) #send to the home base's arduino a non-forwardable message with the ID of the alarm-generating device to be added to the list
             else:
-                addEvent({"event": "TRIGGERED-NO-ALARM", "trigger": hex(msg[0]), "time": getReadableTimeFromTimestamp(now)})
+                addEvent({"event": "TRIGGERED-NO-ALARM", "trigger": deviceId, "devices": [deviceId], "time": getReadableTimeFromTimestamp(now), "timestamp": now})
         else:
-            addEvent({"event": "TRIGGERED-NO-ALARM", "trigger": hex(msg[0]), "time": getReadableTimeFromTimestamp(now)})
+            addEvent({"event": "TRIGGERED-NO-ALARM", "trigger": deviceId, "devices": [deviceId], "time": getReadableTimeFromTimestamp(now), "timestamp": now})
 
     #a no-alarm message is coming in from a device that is in the alarmed device list
-    elif ((msg[1]==homeBaseId or msg[1]==broadcastId) and msg[2]==0x00 and hex(msg[0]) in currentlyAlarmedDevices):
-        print(f"DEVICE {hex(msg[0])} NO LONGER IN currentlyAlarmedDevices - MESSAGE TO REMOVE FROM OLED")
+    elif ((msg[1]==homeBaseId or msg[1]==broadcastId) and msg[2]==0x00 and deviceId in currentlyAlarmedDevices):
+        print(f"DEVICE {deviceId} NO LONGER IN currentlyAlarmedDevices - MESSAGE TO REMOVE FROM OLED")
         #home base's arduino should not show this device's ID as one that is currently alarmed
-        currentlyAlarmedDevices.pop(hex(msg[0]))
-        addEvent({"event": "TRIGGER-STOPPED", "trigger": hex(msg[0]), "time": getReadableTimeFromTimestamp(now)})
+        currentlyAlarmedDevices.pop(deviceId)
+        addEvent({"event": "TRIGGER-STOPPED", "trigger": deviceId, "devices": [deviceId], "time": getReadableTimeFromTimestamp(now), "timestamp": now})
         sendMessage([homeBaseId, 0xFF, 0xB0, msg[0]])
         updateCurrentlyTriggeredDevices();
 
@@ -607,6 +808,15 @@ def updateCurrentlyTriggeredDevices():
     if (debug): print("Updated alarm reason to: " + alarmReason)
 
 
+def getAlarmReasonFields():
+    #alarmReason in structured form for events
+    return {
+        "tripped": list(currentlyAlarmedDevices),
+        "missing": list(currentlyMissingDevices),
+        "devices": list(currentlyMissingDevices) + [id for id in currentlyAlarmedDevices if id not in currentlyMissingDevices]
+    }
+
+
 def getProfilesJsonString():
     global alarmProfiles
 
@@ -619,30 +829,187 @@ def getProfilesJsonString():
     return strReturn
 
 
+def buildStatusSnapshot():
+    return {
+        "version": statusVersion,
+        "armStatus": "ARMED" if armed else "DISARMED",
+        "alarmStatus": "ALARM" if alarmed else "NORMAL",
+        "garageOpen": hex(garageDoorSensorId) in currentlyAlarmedDevices,
+        "profile": alarmProfiles[currentAlarmProfile]["name"],
+        "profileNumber": str(currentAlarmProfile),
+        "currentTriggeredDevices": list(currentlyAlarmedDevices),
+        "currentMissingDevices": list(currentlyMissingDevices),
+        "everTriggeredWithinAlarmCycle": list(everTriggeredWithinAlarmCycle),
+        "everTriggeredWithinArmCycle": list(alarmedDevicesInCurrentArmCycle),
+        "everMissingWithinArmCycle": list(missingDevicesInCurrentArmCycle),
+        "everMissingDevices": list(everMissingDevices),
+        "memberCount": len(memberDevices),
+        "memberDevices": list(memberDevices),
+        "memberDevicesReadable": getFriendlyDeviceNamesFromDeviceDictionary(memberDevices),
+        "powerSequence": getPowerSequenceStatus()
+    }
+
+
+def getPowerSequenceStatus(): #progress of the last power plan, for the status snapshot
+    progress = powerSequencer.getProgress()
+    return {"running": progress["running"], "done": progress["done"], "total": progress["total"]}
+
+
+def getPowerSequenceSignature():
+    #a plan starting or finishing changes the status, each frame of it doesn't - powering up a fleet would push a
+    #status to every client per device. "done" in the snapshot is as of the last status change
+    progress = powerSequencer.getProgress()
+    return (progress["planId"], progress["running"])
+
+
 def getStatusJsonString():
-    strAlarmedStatus = "ALARM" if alarmed else "NORMAL"
-    outgoingMessage = '{"armStatus": "' + ("ARMED" if armed else "DISARMED") + '",'
-    outgoingMessage += '"alarmStatus": "' + strAlarmedStatus + '",'
-    outgoingMessage += '"garageOpen": ' + ('true' if hex(garageDoorSensorId) in currentlyAlarmedDevices else 'false') + ','
-    outgoingMessage += '"profile": "' + alarmProfiles[currentAlarmProfile]["name"] + '",'
-    outgoingMessage += '"profileNumber": "' + str(currentAlarmProfile) + '",'
-    outgoingMessage += '"currentTriggeredDevices": ' + str(list(currentlyAlarmedDevices.keys())).replace("'","\"") + ","
-    outgoingMessage += '"currentMissingDevices": ' + str(currentlyMissingDevices).replace("'","\"") + ','
-    outgoingMessage += '"everTriggeredWithinAlarmCycle": ' + str(list(everTriggeredWithinAlarmCycle.keys())).replace("'","\"") + ","
-    outgoingMessage += '"everTriggeredWithinArmCycle": ' + str(list(alarmedDevicesInCurrentArmCycle.keys())).replace("'","\"") + ","
-    outgoingMessage += '"everMissingWithinArmCycle": ' + str(list(missingDevicesInCurrentArmCycle.keys())).replace("'","\"") + ","
-    outgoingMessage += '"everMissingDevices": ' + str(list(everMissingDevices.keys())).replace("'","\"") + ","
-    outgoingMessage += '"memberCount": ' + str(len(memberDevices)) + ','
-    outgoingMessage += '"memberDevices": ' + str(list(memberDevices.keys())).replace("'","\"") + ','
-    outgoingMessage += '"memberDevicesReadable": ' + str(getFriendlyDeviceNamesFromDeviceDictionary(list(memberDevices.keys()))).replace("'","\"")
-    outgoingMessage += '}'
-    return outgoingMessage
-
-
-def getPastEventsJsonString():
-    outgoingMessage = '{"pastEvents": ' + str(pastEvents).replace("'","\"")
-    outgoingMessage += '}'
-    return outgoingMessage
+    publishStatusIfChanged()
+    return statusSnapshotJson
+
+
+def getStatusDeltaJsonString(sinceVersion): #only the fields that changed after sinceVersion; None if that version is too old to diff against
+    publishStatusIfChanged()
+    return statusDeltaJson if sinceVersion == statusVersion - 1 else buildStatusDeltaJsonString(sinceVersion)
+
+
+def buildStatusDeltaJsonString(sinceVersion):
+    for version, snapshot in statusHistory:
+        if (version == sinceVersion):
+            changed = {key: value for key, value in statusSnapshot.items() if key != "version" and snapshot.get(key) != value}
+            return json.dumps({"version": statusVersion, "since": sinceVersion, "changed": changed})
+    return None
+
+
+def getFrameReaderCounters():
+    return frameReader.getCounters() if frameReader else {}
+
+
+def getTransmitQueueCounters():
+    return txQueue.getCounters()
+
+
+def getAudioCacheCounters():
+    return audioCache.getCounters()
+
+
+def getOutputManagerCounters(): #alarm output frames and estimated bus load, and the same for the old resend every checkEveryMsec
+    return outputManager.getCounters()
+
+
+def startTriggerToOutputTimer(triggeredTimeNs):
+    #when an alarm goes off - not for more triggers while it's on, their 0xBB frames are only keepalives
+    global alarmTriggeredTimeNs
+    if (not alarmed):
+        alarmTriggeredTimeNs = triggeredTimeNs if triggeredTimeNs is not None else time.monotonic_ns()
+        tracer.record("alarmTriggered", alarmTriggeredTimeNs, alarmTriggeredTimeNs, tracer.getTrace()) #marks the trace, for export(containing="alarmTriggered")
+
+
+def getMetricsText(): #the engine's metrics in prometheus text format; called on a web thread, only reads
+    clockSec = getClockSec()
+    frameCounters = getFrameReaderCounters()
+    lastHeard = dict(memberLastHeardClockSec) #a copy, the engine thread adds to it
+    return "".join([
+        metrics.renderMetric("alarm_loop_iteration_seconds", "histogram", "Engine loop time handling one frame or request, or one round of timed checks.", loopIterationTime),
+        metrics.renderMetric("alarm_frames_received_total", "counter", "CAN frames handled, by sender id.",
+            [({"sender": codec.HEX_IDS[sender]}, count) for sender, count in enumerate(framesPerSender) if count]),
+        metrics.renderMetric("alarm_serial_frames_dropped_total", "counter", "Serial frames dropped as too long.", [(None, frameCounters.get("framesDropped", 0))]),
+        metrics.renderMetric("alarm_serial_frames_malformed_total", "counter", "Serial frames that could not be decoded.", [(None, frameCounters.get("framesMalformed", 0))]),
+        metrics.renderMetric("alarm_engine_queue_depth", "gauge", "Web requests and CAN frames waiting for the engine loop.", [(None, engineQueue.qsize() if engineQueue else 0)]),
+        metrics.renderMetric("alarm_tx_queue_depth", "gauge", "Frames waiting to be written to the serial port.", [(None, getTransmitQueueCounters()["queueDepth"])]),
+        metrics.renderMetric("alarm_output_bus_load_ratio", "gauge", "Estimated share of the CAN bus taken by alarm output frames.", [(None, getOutputManagerCounters()["busLoad"])]),
+        metrics.renderMetric("alarm_trigger_to_output_seconds", "histogram", "From the trigger frame or missed deadline that sets off an alarm to its first 0xBB frame written.", triggerToOutputTime),
+        metrics.renderMetric("alarm_member_last_seen_seconds", "gauge", "Seconds since each member device was last heard from.",
+            [({"member": memberId}, max(0, clockSec - lastHeardSec)) for memberId, lastHeardSec in lastHeard.items()]),
+        metrics.renderMetric("alarm_armed", "gauge", "1 while armed.", [(None, int(armed))]),
+        metrics.renderMetric("alarm_alarmed", "gauge", "1 while alarmed.", [(None, int(alarmed))])
+    ])
+
+
+def addStatusListener(listener):
+    statusListeners.append(listener)
+
+
+def getStatusSignature(): #cheap to compute on every loop iteration, changes whenever buildStatusSnapshot() would
+    return (armed, alarmed, currentAlarmProfile, tuple(currentlyAlarmedDevices), tuple(currentlyMissingDevices),
+        tuple(everTriggeredWithinAlarmCycle), tuple(alarmedDevicesInCurrentArmCycle), tuple(missingDevicesInCurrentArmCycle),
+        tuple(everMissingDevices), tuple(memberDevices), getPowerSequenceSignature())
+
+
+def publishStatusIfChanged():
+    global statusVersion
+    global lastPublishedStatusSignature
+    global statusSnapshot
+    global statusSnapshotJson
+    global statusDeltaJson
+
+    signature = getStatusSignature()
+    if (signature == lastPublishedStatusSignature):
+        return
+    lastPublishedStatusSignature = signature
+    statusVersion += 1
+    statusSnapshot = buildStatusSnapshot()
+    statusSnapshotJson = json.dumps(statusSnapshot)
+    statusHistory.append((statusVersion, statusSnapshot))
+    statusDeltaJson = buildStatusDeltaJsonString(statusVersion - 1)
+    for listener in statusListeners:
+        try:
+            listener(statusVersion, statusSnapshotJson, statusDeltaJson)
+        except Exception as e:
+            print(f">>>>ERROR IN STATUS LISTENER {e}<<<<<")
+
+
+def getRequestNumber(value, name, convert = int):
+    #a number from a web request, None if left out; ValueError naming the parameter for anything else the client sent
+    if (value is None or value == ""):
+        return None
+    try:
+        number = convert(value) if not isinstance(value, bool) else None #json true isn't 1
+    except (TypeError, ValueError, OverflowError):
+        number = None
+    if (number is None):
+        raise ValueError(f"{name} must be a number, not {json.dumps(value)}")
+    if (not math.isfinite(number) or abs(number) >= 2**63): #what sqlite takes
+        raise ValueError(f"{name} is out of range")
+    return number
+
+
+def getPageLimit(limit): #a client's page size, at most pastEventsPageSize
+    limit = getRequestNumber(limit, "limit")
+    return max(1, min(limit, pastEventsPageSize)) if limit else pastEventsPageSize
+
+
+def getPastEventsJsonString(since = None, before = None, limit = None):
+    #a page of past events: the oldest ones after seq since (new ones - more says there are further pages of them),
+    #or those before seq before (scrolling back)
+    try:
+        page = eventStore.getEventsPage(getRequestNumber(since, "since"), getRequestNumber(before, "before"), getPageLimit(limit))
+    except ValueError as e:
+        return json.dumps({"pastEvents": [], "error": str(e)})
+    return ('{"pastEvents": [' + ",".join(page["eventsJson"]) + '],' #events are stored as json already
+        + '"latestSeq": ' + json.dumps(page["latestSeq"]) + ',"oldestSeq": ' + json.dumps(page["oldestSeq"])
+        + ',"reset": ' + json.dumps(page["reset"]) + ',"more": ' + json.dumps(page["more"]) + '}')
+
+
+def searchEventsJsonString(device = None, eventType = None, start = None, end = None, before = None, limit = None):
+    #past events by device id, event type and/or time range [start, end) in epoch seconds, newest page first; before pages back.
+    #What the client typed goes straight in here - anything that doesn't make a query gets an empty page with an error
+    try:
+        if (device):
+            try:
+                deviceNumber = int(str(device).strip(), 16)
+            except ValueError:
+                deviceNumber = -1
+            if (deviceNumber not in range(256)):
+                raise ValueError(f"device must be an id like 0x50, not {json.dumps(device)}")
+            device = codec.HEX_IDS[deviceNumber] #"0x50", "0X50", "50" are all stored as "0x50"
+        if (eventType is not None and not isinstance(eventType, str)):
+            raise ValueError(f"event must be an event name like TRIGGERED-ALARM, not {json.dumps(eventType)}")
+        page = eventStore.search(device or None, eventType or None, getRequestNumber(start, "from", float), getRequestNumber(end, "to", float),
+            getRequestNumber(before, "before"), getPageLimit(limit))
+    except ValueError as e:
+        return json.dumps({"events": [], "oldestSeq": None, "more": False, "error": str(e)})
+    return ('{"events": [' + ",".join(page["eventsJson"]) + '],'
+        + '"oldestSeq": ' + json.dumps(page["oldestSeq"]) + ',"more": ' + json.dumps(page["more"]) + '}')
 
 
 def stopAlarm():
@@ -651,9 +1018,11 @@ def stopAlarm():
     global everTriggeredWithinAlarmCycle
     global currentlyAlarmedDevices
     global homeBaseId
+    global alarmTriggeredTimeNs
 
     alarmed = False
-    addEvent({"event": "FINISHED_ALARM", "time": getReadableTimeFromTimestamp(lastAlarmTime)})
+    alarmTriggeredTimeNs = None #nor one that ran out before it; a later 0xBB (a test, a keepalive) isn't its output
+    addEvent({"event": "FINISHED_ALARM", "time": getReadableTimeFromTimestamp(lastAlarmTime), "timestamp": lastAlarmTime})
     everTriggeredWithinAlarmCycle = {}
     currentlyAlarmedDevices = {}
     updateCurrentlyTriggeredDevices()
@@ -666,17 +1035,17 @@ def run(webserver_message_queue):
     global currentlyAlarmedDevices
     global everTriggeredWithinAlarmCycle
     global homeBaseId
-    global pastEvents
+    global eventStore
     global alarmed
     global lastAlarmTime
+    global lastAlarmClockSec
     global armed
     global lastArmedTogglePressed
     global deviceAbsenceThresholdSec
     global firstPowerCommandNeedsToBeSent
     global timeAllottedToBuildOutMembersSec
     global initWaitSeconds
-    global lastSentMessageTimeMsec
-    global sendTimeoutMsec
+    global checkEveryMsec
     global currentlyMissingDevices
     global checkForMissingDevicesEveryMsec
     global lastCheckedMissingDevicesMsec
@@ -684,6 +1053,16 @@ def run(webserver_message_queue):
     global currentAlarmProfile
     global alwaysKeepOnSet #TODO: this should not be a thing. All non-relay-gated devices should not respond in any way to power messages, and should always output their sensor status. Home base decides what to do with this.
     global testAlarmId
+    global engineQueue
+    global serialReaderThread
+    global frameReader
+    global capture
+    openSerialPort()
+    if (captureFile and capture is None):
+        capture = CaptureWriter(captureFile, binaryFraming=useBinaryFraming)
+        print(f"CAPTURING SERIAL TRAFFIC TO {capture.path}")
+    eventStore = EventStore(eventsDbPath, maxAgeSec=pastEventsMaxAgeSec, maxEvents=pastEventsMaxCount)
+    audioCache.preload(getAnnouncementFileNames())
     resetMemberDevices()
 
     atexit.register(exitSteps)
@@ -693,130 +1072,191 @@ def run(webserver_message_queue):
 
     ser.flushOutput()
     ser.flushInput()
-    sendMessage([homeBaseId, 0x00, 0xCC, 0x01]) #reset all devices (broadcast)
+    outputManager.send(0x00, 0xCC) #reset all devices (broadcast)
     sendArmedLedSignal()
-    firstTurnedOnTimestamp = getTimeSec()
+    firstTurnedOnClockSec = getClockSec()
+
+    engineQueue = webserver_message_queue if webserver_message_queue else Queue()
+    frameReader = FrameReader(ser, decodeFrame, lambda msg, receivedTimeNs: engineQueue.put({"request": "CAN-FRAME", "msg": msg, "receivedTimeNs": receivedTimeNs}), binaryFraming=useBinaryFraming, onRawFrame=capture.recordReceived if capture else None)
+    serialReaderThread = Thread(target = serialReaderThreadMain, daemon = True)
+    serialReaderThread.start()
 
     while True:
-        line = ser.readline()
-        if not webserver_message_queue.empty():
-            message = webserver_message_queue.get()
-            #print(f"GOT MESSAGE: {message}")
-            if (message['request'] == "ENABLE-ALARM" and getArmedStatus() == False) :
-                toggleArmed(getTimeSec(), "WEB API")
-            elif (message['request'] == "DISABLE-ALARM" and getArmedStatus() == True) :
-                toggleArmed(getTimeSec(), "WEB API")
-            elif (message['request'] == "ALARM-STATUS") :
-                message['responseQueue'].put({"response": getStatusJsonString(), "uuid": message['uuid'] })
-            elif (message['request'].startswith("SET-ALARM-PROFILE-")):
-                profileNumber = int(message['request'].split("SET-ALARM-PROFILE-",1)[1])
-                setCurrentAlarmProfile(profileNumber)
-            elif (message['request'] == "GET-ALARM-PROFILES") :
-                message['responseQueue'].put({"response": getProfilesJsonString(), "uuid": message['uuid'] })
-            elif (message['request'] == "FORCE-ALARM-SOUND-ON") :
-                currentlyAlarmedDevices[hex(testAlarmId)] = getTimeSec();
-                sendAlarmMessage(True, True)
-                time.sleep(.15)
-                sendAlarmMessage(False, False)
-            elif (message['request'] == "TOGGLE-GARAGE-DOOR-STATE") :
-                sendMessage([homeBaseId, garageDoorOpenerId, 0x0D, 0x00])
-            elif (message['request'] == "CLEAR-OLD-DATA") :
-                clearOldData()
-            elif (message['request'] == "ALERT-CHECK-PHONES") :
-                currentlyAlarmedDevices[hex(checkPhonesId)] = getTimeSec();
-                saveProfile = currentAlarmProfile;
-                currentAlarmProfile = 0;
-                sendAlarmMessage(True, True)
-                time.sleep(.1)
-                sendAlarmMessage(False, False)
-                currentAlarmProfile = saveProfile;
-            elif (message['request'].startswith("CAN-REPEATEDLY-SEND-")) :
-                sendcan(message['request'].split('CAN-REPEATEDLY-SEND-')[1], True)
-            elif (message['request'].startswith("CAN-SINGLE-SEND-")) :
-                sendcan(message['request'].split('CAN-SINGLE-SEND-')[1], False)
-            elif (message['request'] == "CAN-STOP-SENDING") :
-                stopsendingcan()
-            elif (message['request'] == "GET-PAST-EVENTS") :
-                message['responseQueue'].put({"response": getPastEventsJsonString(), "uuid": message["uuid"] })
-
-
-        if (not line): continue #nothing on CAN -> repeat while loop (since web server message is already taken care of above)
-        
-        ser.flushInput()
+        try:
+            message = engineQueue.get(timeout = clock.toRealSec(getSecondsUntilNextCheck())) #a web server request, a CAN frame, or time for the checks below
+        except Empty:
+            message = None
+        iterationStartNs = time.monotonic_ns() #real time, for the loop's own metrics whatever the clock
+        clockSec = getClockSec() #the iteration's one reading of each clock: what it times by...
+        now = math.floor(getTime()) #...and what it shows and stores
+        tracer.startTrace() #everything this iteration sets off, on this thread and the ones it hands frames and sound to
+        if (message and message['request'] != "CAN-FRAME"):
+            if (capture and 'uuid' in message and 'call' not in message): #from the web server; those with an answer only read state
+                capture.recordCommand(json.dumps(message))
+            try:
+                handleWebserverMessage(message)
+            except Exception as e: #a bad request mustn't take the engine down; a call left unanswered times out at the caller
+                print(f">>>>ERROR HANDLING WEB REQUEST {message.get('request')}: {e!r}<<<<<")
+            updateAlarmOutputs(clockSec)
+            publishStatusIfChanged()
+            loopIterationTime.observe((time.monotonic_ns() - iterationStartNs) / 1e9)
+            continue
 
-        if (firstPowerCommandNeedsToBeSent and getTimeSec() > firstTurnedOnTimestamp + timeAllottedToBuildOutMembersSec):
+        if (firstPowerCommandNeedsToBeSent and clockSec > firstTurnedOnClockSec + timeAllottedToBuildOutMembersSec):
             firstPowerCommandNeedsToBeSent = False
-            print(f"Members array built at {getReadableTimeFromTimestamp(getTimeSec())} as:")
+            print(f"Members array built at {getReadableTimeFromTimestamp(now)} as:")
             for member in memberDevices:
                 print(f"{member} : {memberDevices[member]}")
             print("\n\n\n")
             setDevicesPower()
-        try:
-            decodedLine = line.decode('utf-8')
-        except:
-            print(f">>>>>ERROR ON BUS WHILE PARSING MESSAGE //// SKIPPING THIS MESSAGE<<<<<<")
-            continue
-        if (decodedLine.startswith(">>>")): #handle debug lines over serial without crashing
-            #print(line.decode('utf-8'))
-            continue
-        try:
-            msg = decodeLine(decodedLine)
-        except:
-            print(f"ERROR WITH PARSING LINE, CONTINUING LOOP<<<<<")
-            continue
-        msg.append(getTimeSec())
-        #print("GETTING", np.array(msg)) #TODO: uncomment
 
-        handleMessage(msg)
+        if (message):
+            msg = message['msg']
+            msg.append(now)
+            #print("GETTING", np.array(msg)) #TODO: uncomment
+            framesPerSender[msg[0]] += 1
+            if (tracer.enabled):
+                tracer.record("engineQueue", message['receivedTimeNs'], iterationStartNs, tracer.getTrace(), sender=codec.HEX_IDS[msg[0]])
+
+            with tracer.span("handleMessage", sender=codec.HEX_IDS[msg[0]], message=codec.HEX_IDS[msg[2]]):
+                handleMessage(msg, now, clockSec, message['receivedTimeNs'])
 
 
-        if (lastCheckedMissingDevicesMsec+checkForMissingDevicesEveryMsec < getTimeMsec()):  #do a check for missing devices
+        if (isMissingDevicesCheckDue(now, clockSec)):  #do a check for missing devices
             if (debug): 
-                print(f">>>Checking for missing devices at {getTimeMsec()}")
-            currentlyMissingDevices = checkMembersOnline()
+                print(f">>>Checking for missing devices at {getReadableTimeFromTimestamp(now)}")
+            currentlyMissingDevices = checkMembersOnline(now, clockSec)
 
             if (armed and len(currentlyMissingDevices) > 0):
                 updateCurrentlyTriggeredDevices()
-                print(f">>>>>>>>>>>>>>>>>>>> ADDING MISSING DEVICES {arrayToString(currentlyMissingDevices)} at {getReadableTime()}<<<<<<<<<<<<<<<<<<<")
+                print(f">>>>>>>>>>>>>>>>>>>> ADDING MISSING DEVICES {arrayToString(currentlyMissingDevices)} at {getReadableTimeFromTimestamp(now)}<<<<<<<<<<<<<<<<<<<")
                 shouldSetNewAlarm = False;
                 for missingDevice in currentlyMissingDevices:
-                    if (not "missingDevicesThatTriggerAlarm" in alarmProfiles[currentAlarmProfile] or missingDevice in alarmProfiles[currentAlarmProfile]["missingDevicesThatTriggerAlarm"]):
+                    if (compiledAlarmProfiles[currentAlarmProfile]["missingTriggers"][codec.HEX_IDS_VALUES[missingDevice]]):
                         shouldSetNewAlarm = True
                         break;
                 if (shouldSetNewAlarm):
+                    startTriggerToOutputTimer(time.monotonic_ns())
                     alarmed = True
-                    lastAlarmTime = getTimeSec()
-                    addEvent({"event": "DEVICE-MISSING-ALARM", "trigger": alarmReason, "time": getReadableTimeFromTimestamp(lastAlarmTime)})
+                    lastAlarmTime = now
+                    lastAlarmClockSec = clockSec
+                    addEvent({"event": "DEVICE-MISSING-ALARM", "trigger": alarmReason, **getAlarmReasonFields(), "time": getReadableTimeFromTimestamp(lastAlarmTime), "timestamp": lastAlarmTime})
                 else :
-                    addEvent({"event": "DEVICE-MISSING-NOALARM", "trigger": alarmReason, "time": getReadableTimeFromTimestamp(lastAlarmTime)})
+                    addEvent({"event": "DEVICE-MISSING-NOALARM", "trigger": alarmReason, **getAlarmReasonFields(), "time": getReadableTimeFromTimestamp(now), "timestamp": now}) #not lastAlarmTime - no alarm went off
 
         #if currently alarmed and there are no missing or alarmed devices and it's been long enough that alarmTimeLengthSec has run out, DISABLE ALARM FLAG
-        if (alarmed and getCurrentProfileAlarmTime() > -1 and lastAlarmTime + getCurrentProfileAlarmTime() < getTimeSec() and len(currentlyMissingDevices) == 0 and len(currentlyAlarmedDevices) == 0):
+        if (alarmed and getCurrentProfileAlarmTime() > -1 and lastAlarmClockSec + getCurrentProfileAlarmTime() < clockSec and len(currentlyMissingDevices) == 0 and len(currentlyAlarmedDevices) == 0):
             stopAlarm()
             updateCurrentlyTriggeredDevices()
 
         else:
             updateCurrentlyTriggeredDevices()
 
-        #possibly send a message (if it's been sendTimeoutMsec)
-        if (getTimeMsec() > (lastSentMessageTimeMsec+sendTimeoutMsec)):
-            sendAlarmMessage(armed, alarmed)
+        updateAlarmOutputs(clockSec) #on a change of state, or when an output's keepalive is due
 
+        publishStatusIfChanged()
+        loopIterationTime.observe((time.monotonic_ns() - iterationStartNs) / 1e9)
 
-def sendAlarmMessage(armed, alarmed):
+
+def handleWebserverMessage(message):
     global currentAlarmProfile
-    global alarmProfiles
-    global homeBaseId
-    if ("alarmOutputDevices" in alarmProfiles[currentAlarmProfile] and armed and alarmed): #send alarms to chosen devices under this profile (non-default profile)
-        for deviceToBeAlarmed in alarmProfiles[currentAlarmProfile]["alarmOutputDevices"]:
-            sendMessage([homeBaseId, int(deviceToBeAlarmed, 16), 0xBB , 0x01])
-            time.sleep(5/100) #bugfix - can't send in immediate rapid succession, or can fails
-    elif ("alarmOutputDevices" in alarmProfiles[currentAlarmProfile]): #send cancel alarms to all devices under this profile (non-default profile)
-        for deviceToBeAlarmed in alarmProfiles[currentAlarmProfile]["alarmOutputDevices"]:
-            sendMessage([homeBaseId, int(deviceToBeAlarmed, 16), 0xCC , 0x01])
-            time.sleep(5/100) #bugfix - can't send in immediate rapid succession, or can fails
-    else: # for profiles missing alarmOutputDevices - broadcast alarm on or off
-        sendMessage([homeBaseId, 0x00, 0xBB if armed and alarmed else 0xCC, 0x01])
+    global currentlyAlarmedDevices
+
+    #print(f"GOT MESSAGE: {message}")
+    if (message.get('call') and message['call'].cancelled()): #timed out or its client went away - nobody to answer
+        return
+    if (message['request'] == "ENABLE-ALARM" and getArmedStatus() == False) :
+        toggleArmed(getTimeSec(), "WEB API")
+    elif (message['request'] == "DISABLE-ALARM" and getArmedStatus() == True) :
+        toggleArmed(getTimeSec(), "WEB API")
+    elif (message['request'] == "ALARM-STATUS") :
+        delta = getStatusDeltaJsonString(message['sinceVersion']) if message.get('sinceVersion') is not None else None
+        message['call'].respond({"response": delta if delta else getStatusJsonString(), "isDelta": delta is not None})
+    elif (message['request'].startswith("SET-ALARM-PROFILE-")):
+        profileNumber = int(message['request'].split("SET-ALARM-PROFILE-",1)[1])
+        setCurrentAlarmProfile(profileNumber)
+    elif (message['request'] == "GET-ALARM-PROFILES") :
+        message['call'].respond({"response": getProfilesJsonString()})
+    elif (message['request'] == "FORCE-ALARM-SOUND-ON") :
+        currentlyAlarmedDevices[hex(testAlarmId)] = getTimeSec();
+        sendAlarmMessage(True, True)
+        sendAlarmMessage(False, False, .15)
+    elif (message['request'] == "TOGGLE-GARAGE-DOOR-STATE") :
+        sendMessage([homeBaseId, garageDoorOpenerId, 0x0D, 0x00])
+    elif (message['request'] == "CLEAR-OLD-DATA") :
+        clearOldData()
+    elif (message['request'] == "ALERT-CHECK-PHONES") :
+        currentlyAlarmedDevices[hex(checkPhonesId)] = getTimeSec();
+        saveProfile = currentAlarmProfile;
+        currentAlarmProfile = 0;
+        sendAlarmMessage(True, True)
+        sendAlarmMessage(False, False, .1)
+        currentAlarmProfile = saveProfile;
+    elif (message['request'].startswith("CAN-REPEATEDLY-SEND-")) :
+        sendcan(message['request'].split('CAN-REPEATEDLY-SEND-')[1], True)
+    elif (message['request'].startswith("CAN-SINGLE-SEND-")) :
+        sendcan(message['request'].split('CAN-SINGLE-SEND-')[1], False)
+    elif (message['request'] == "CAN-STOP-SENDING") :
+        stopsendingcan()
+    elif (message['request'] == "GET-PAST-EVENTS") :
+        message['call'].respond({"response": getPastEventsJsonString(message.get('since'), message.get('before'), message.get('limit'))})
+    elif (message['request'] == "POWER-SEQUENCE-PROGRESS") :
+        progress = message['progress']
+        if (not progress['running'] and progress['planId'] == powerSequencer.getProgress()['planId'] and progress['total'] > 0):
+            addEvent({"event": "POWER-SEQUENCE-DONE", "devices": [hex(frame[1]) for frame in powerSequencer.plan], "frames": progress['total'], "time": getReadableTimeFromTimestamp(getTimeSec()), "timestamp": getTimeSec()})
+    elif (message['request'] == "GET-TRACES") :
+        message['call'].respond({"response": json.dumps({"enabled": tracer.enabled, "traces": tracer.export(message.get('containing'))})})
+    elif (message['request'] == "SEARCH-EVENTS") :
+        message['call'].respond({"response": searchEventsJsonString(message.get('device'), message.get('event'), message.get('from'), message.get('to'), message.get('before'), message.get('limit'))})
+
+
+def serialReaderThreadMain():
+    #reads CAN frames forwarded by the arduino and hands them to the main loop via the same queue the web server uses,
+    #so that neither source waits on the other's timeout. Every frame queued by the arduino is kept - see FrameReader
+    while not threadShouldTerminate:
+        frameReader.readAvailable()
+
+
+def getAlarmOutputStates(armed, alarmed): #{output device id or (GROUP_ADDRESS, group id): 0xBB/0xCC} under the current profile
+    profile = compiledAlarmProfiles[currentAlarmProfile]
+    outputDevices = profile["outputs"]
+    message = 0xBB if armed and alarmed else 0xCC
+    if (outputDevices is None): # for profiles missing alarmOutputDevices - broadcast alarm on or off
+        return {0x00: message}
+    states = {}
+    if (useGroupAddressing and profile["outputGroup"] is not None): #one frame for the outputs in the group, one each for the rest
+        members, rest = groupDirectory.split(profile["outputGroup"], [hex(deviceToBeAlarmed) for deviceToBeAlarmed in outputDevices])
+        if (members):
+            states[(GROUP_ADDRESS, profile["outputGroup"])] = message
+            outputDevices = [int(deviceToBeAlarmed, 16) for deviceToBeAlarmed in rest]
+    states.update({deviceToBeAlarmed: message for deviceToBeAlarmed in outputDevices})
+    return states
+
+
+def sendAlarmMessage(armed, alarmed, pauseBeforeSec = 0): #pauseBeforeSec - gap on the bus before the first of these frames
+    #sends to every output now, changed or not - for one-off sequences like the alarm test
+    #frames can't go in immediate rapid succession, or can fails - the transmit queue spaces them
+    with tracer.span("sendAlarmMessage", armed=armed, alarmed=alarmed):
+        for index, (deviceToBeAlarmed, message) in enumerate(getAlarmOutputStates(armed, alarmed).items()):
+            outputManager.send(deviceToBeAlarmed, message, pauseBeforeSec if index == 0 else 0)
+
+
+def updateAlarmOutputs(clockSec=None):
+    with tracer.span("updateAlarmOutputs"):
+        outputManager.update(getAlarmOutputStates(armed, alarmed), now=clockSec)
+
+
+def getAlarmOutputKeepaliveSec(deviceId):
+    if (isinstance(deviceId, tuple)): #a group - as often as the most often refreshed type
+        return min(alarmOutputKeepaliveSec.values())
+    member = memberDevices.get(hex(deviceId))
+    deviceType = member['deviceType'] if member else None
+    if (isinstance(deviceType, str)): #the denon's entry is made up here, with its type as a hex string
+        deviceType = int(deviceType, 16)
+    return alarmOutputKeepaliveSec.get(deviceType, defaultAlarmOutputKeepaliveSec)
+
+
+outputManager = OutputManager(sendMessage, homeBaseId, getAlarmOutputKeepaliveSec, checkEveryMsec / 1000, getNow=getClockSec)
 
 
 def getCurrentProfileAlarmTime():
@@ -836,14 +1276,13 @@ def clearOldData():
     global missingDevicesInCurrentArmCycle
     global everMissingDevices
     global currentlyMissingDevices
-    global pastEvents
 
     everTriggeredWithinAlarmCycle = {}
     alarmedDevicesInCurrentArmCycle = {}
     missingDevicesInCurrentArmCycle = {}
     everMissingDevices = {}
     currentlyMissingDevices = []
-    pastEvents = []
+    eventStore.clear()
     resetMemberDevices()
 
 
@@ -862,6 +1301,7 @@ def stopsendingcan():
     addEvent({
         "event": "STOPPING SENDING DEBUG CAN MESSAGE FROM UI",
         "time": getReadableTimeFromTimestamp(getTimeSec()),
+        "timestamp": getTimeSec(),
         "method": "WEB API"
     })
 
@@ -885,7 +1325,10 @@ def sendcan(message, repeatedly):
             addEvent({
                 "event": "STARTING SENDING DEBUG CAN MESSAGE " + str(arrCanDebugMessage) + " FROM UI" + (" REPEATEDLY" if repeatedly else ""),
                 "time": getReadableTimeFromTimestamp(getTimeSec()),
-                "method": "WEB API"
+                "timestamp": getTimeSec(),
+                "method": "WEB API",
+                "devices": [hex(arrCanDebugMessage[0])],
+                "message": [hex(i) for i in arrCanDebugMessage]
             })
             canDebugMessage = arrCanDebugMessage
             shouldSendDebugRepeatedly = True if repeatedly else False
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import threading
+from urllib.parse import parse_qs
+from queue import Queue
+from uuid import uuid4
+import socketio
+import uvicorn
+import rpc
+import payloads
+import engineprocess
+import metrics
+
+# The web tier of server.py on asyncio: a python-socketio AsyncServer under uvicorn instead of Flask-SocketIO in
+# threading mode on the Werkzeug dev server. Same socket.io events both ways, so the frontend doesn't know which one
+# it is talking to. A connected client is a socket on the event loop rather than a thread, and a call to the engine
+# is awaited (see rpc.py) without holding anything else up. Run instead of server.py:
+#   python3 asyncserver.py
+
+webserver_message_queue = Queue() # to the alarm engine, as in server.py
+rpcBridge = rpc.RpcBridge(webserver_message_queue)
+clientCalls = {} # client sid -> futures of its calls still in flight, cancelled if it disconnects
+clientFormats = {} # client sid -> the payload format it asked for on connect, see payloads.py
+eventLoop = None # the loop uvicorn runs the app on, for pushes from the engine thread
+corsAllowedOrigins = ["https://bobik.lan:5020", "https://192.168.2.100", "https://192.168.2.100:443", "https://192.168.2.100:5020", "https://192.168.2.100:5010", "http://192.168.2.100:3000", "https://bobik.lan","https://192.168.99.5"] # same as server.py
+sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins=corsAllowedOrigins, ping_timeout=11, ping_interval=5)
+thisDir = os.path.dirname(os.path.abspath(__file__))
+serverKeysDir = thisDir + "/server-keys"
+separateEngineProcess = False # as in server.py: True to talk to python3 engineprocess.py instead of running the engine here
+
+# socket.io event -> engine request, for the events that don't get an answer
+engineRequests = {
+    'arm': lambda message: "ENABLE-ALARM",
+    'disarm': lambda message: "DISABLE-ALARM",
+    'alarmSoundOn': lambda message: "FORCE-ALARM-SOUND-ON",
+    'clearOldData': lambda message: "CLEAR-OLD-DATA",
+    'checkPhones': lambda message: "ALERT-CHECK-PHONES",
+    'toggleGarageDoorState': lambda message: "TOGGLE-GARAGE-DOOR-STATE",
+    'cansendrepeatedly': lambda message: "CAN-REPEATEDLY-SEND-" + message['message'],
+    'cansendsingle': lambda message: "CAN-SINGLE-SEND-" + message['message'],
+    'canstopsending': lambda message: "CAN-STOP-SENDING",
+    'setAlarmProfile': lambda message: "SET-ALARM-PROFILE-" + str(message['message'])
+}
+
+
+def makeEngineRequestHandler(getRequest):
+    async def handler(sid, message = None):
+        webserver_message_queue.put({"request": getRequest(message), "uuid": uuid4().hex})
+    return handler
+
+
+for eventName, getRequest in engineRequests.items():
+    sio.on(eventName, makeEngineRequestHandler(getRequest))
+
+
+@sio.event
+async def connect(sid, environ, auth = None):
+    print('Client connected')
+    clientFormats[sid] = payloads.getPayloadFormat(auth)
+    await sio.enter_room(sid, payloads.getRoom(clientFormats[sid]))
+    await sendAlarmStatus(sid) # the new client only gets pushes from the next change on, so send it the current status now
+
+
+@sio.event
+async def disconnect(sid, reason = None):
+    print('Disconnected')
+    clientFormats.pop(sid, None)
+    rpcBridge.cancel(clientCalls.pop(sid, set()))
+
+
+@sio.event
+async def getPastEvents(sid, message):
+    # message may carry {since, before, limit}: events after seq since (new ones) or before seq before (older page)
+    cursor = getMessageDict(message)
+    await callEngine(sid, rpc.GET_PAST_EVENTS, lambda response: 'postPastEvents', since=cursor.get('since'), before=cursor.get('before'), limit=cursor.get('limit'))
+
+
+@sio.event
+async def searchEvents(sid, message):
+    # message carries any of {device, event, from, to} (from/to in epoch seconds) plus before/limit for paging
+    query = getMessageDict(message)
+    await callEngine(sid, rpc.SEARCH_EVENTS, lambda response: 'postEventSearch', **{key: query.get(key) for key in rpc.SEARCH_EVENTS.params})
+
+
+@sio.event
+async def getStatus(sid, message):
+    # message may carry the status version the client already has, to only get what changed since
+    await sendAlarmStatus(sid, message.get('message') if isinstance(message, dict) else None)
+
+
+@sio.event
+async def getAlarmProfiles(sid, message):
+    await callEngine(sid, rpc.GET_ALARM_PROFILES, lambda response: 'postAlarmProfiles')
+
+
+def getMessageDict(message):
+    message = message.get('message') if isinstance(message, dict) else None
+    return message if isinstance(message, dict) else {}
+
+
+async def sendAlarmStatus(sid, sinceVersion = None):
+    # current status (or the delta from sinceVersion) to the client that asked
+    await callEngine(sid, rpc.ALARM_STATUS, lambda response: 'postStatusDelta' if response["isDelta"] else 'postStatus', sinceVersion=sinceVersion)
+
+
+async def callEngine(sid, command, getEventName, **args):
+    # the engine's response goes to the client that asked, as the event getEventName(response) names. A call that
+    # times out gets that client an 'rpcError' instead of nothing; one cancelled by a disconnect just ends
+    future = rpcBridge.call(command, **args)
+    clientCalls.setdefault(sid, set()).add(future)
+    try:
+        response = await asyncio.wrap_future(future)
+    except TimeoutError as e:
+        print(">>>>" + str(e))
+        await sio.emit('rpcError', {'message': {'request': command.request, 'error': str(e)}}, to=sid)
+        return
+    except asyncio.CancelledError:
+        return
+    finally:
+        clientCalls.get(sid, set()).discard(future)
+    await sio.emit(getEventName(response), {'message': payloads.encodePayload(response["response"], clientFormats.get(sid, payloads.LEGACY))}, to=sid)
+
+
+def publishStatus(version, status, delta):
+    # called on the alarm thread whenever the engine's status changes; only hands the push to the event loop, which
+    # encodes it once per payload format in use and emits it (emitStatus)
+    if (eventLoop is None):
+        return
+    print("Sending status version " + str(version) + " to connected clients")
+    eventName, payload = ('postStatusDelta', delta) if delta else ('postStatus', status)
+    asyncio.run_coroutine_threadsafe(emitStatus(eventName, payload), eventLoop)
+
+
+async def emitStatus(eventName, payload):
+    for payloadFormat in set(clientFormats.values()):
+        await sio.emit(eventName, {'message': payloads.encodePayload(payload, payloadFormat)}, to=payloads.getRoom(payloadFormat))
+
+
+async def onStartup():
+    global eventLoop
+    eventLoop = asyncio.get_running_loop()
+
+
+async def getMetricsText():
+    # as /metrics in server.py
+    engineMetrics = ""
+    try:
+        if (separateEngineProcess):
+            engineMetrics = (await asyncio.wrap_future(rpcBridge.call(rpc.GET_METRICS, timeoutSec=2)))["response"]
+        else:
+            import alarm
+            engineMetrics = alarm.getMetricsText()
+    except TimeoutError as e:
+        print(">>>>" + str(e))
+    return engineMetrics + metrics.renderWebMetrics(rpcBridge.getCounters(), len(clientFormats), engineMetrics != "")
+
+
+async def getTraces(containing):
+    # as /traces in server.py -> (http status, body)
+    try:
+        return 200, (await asyncio.wrap_future(rpcBridge.call(rpc.GET_TRACES, containing=containing)))["response"].encode()
+    except TimeoutError as e:
+        return 504, json.dumps({"error": str(e)}).encode()
+
+
+async def statusApp(scope, receive, send):
+    # plain http next to socket.io: the /status health check of server.py, /metrics and /traces
+    if (scope['type'] != 'http'):
+        return
+    found = scope['path'] in ('/status', '/metrics', '/traces') and scope['method'] == 'GET'
+    status = 200 if found else 404
+    contentType = 'application/json'
+    body = b''
+    if (found and scope['path'] == '/metrics'):
+        contentType = metrics.CONTENT_TYPE
+        body = (await getMetricsText()).encode()
+    elif (found and scope['path'] == '/traces'):
+        status, body = await getTraces(parse_qs(scope.get('query_string', b'').decode()).get('containing', [None])[0])
+    elif (found):
+        body = json.dumps({"status": "ok"}).encode()
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', contentType.encode()),
+        (b'cache-control', b'no-cache, no-store, must-revalidate, max-age=0'),
+        (b'pragma', b'no-cache'),
+        (b'expires', b'0')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=statusApp, on_startup=onStartup)
+
+
+def main():
+    print("Main program started.")
+    if (separateEngineProcess):
+        engineprocess.EngineLink(webserver_message_queue, rpcBridge, publishStatus).start()
+    else:
+        import alarm # only when serving for real - benchmarks/fanoutbench.py runs the app without the engine
+        alarm.addStatusListener(publishStatus)
+        alarm_thread = threading.Thread(target=alarm.run, args=(webserver_message_queue, ), daemon=True)
+        alarm_thread.start()
+    uvicorn.run(app, host='0.0.0.0', port=8080, ssl_certfile=serverKeysDir+'/bobik-cert.pem', ssl_keyfile=serverKeysDir+'/bobik-key.pem')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import os
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock, Thread
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+#every clip is decoded to the same raw format, so an announcement is the clips' bytes one after the other
+DECODE_COMMAND = ["/usr/bin/mpg123", "-q", "-s", "-r", str(SAMPLE_RATE), "--stereo", "-e", "s16"]
+PLAY_COMMAND = ["/usr/bin/out123", "-q", "-r", str(SAMPLE_RATE), "-c", str(CHANNELS), "-e", "s16"] #raw pcm on stdin
+
+
+class AudioCache:
+    #Announcement clips decoded once to PCM, and the concatenated announcement for each combination of clips played
+    #(the alert, then one clip per triggered device), kept in LRU order up to maxAnnouncements. Playing an announcement
+    #that is cached is writing it to the audio output - no mp3 is opened or decoded between the trigger and the sound.
+
+    def __init__(self, directory, maxAnnouncements=16):
+        self.directory = directory
+        self.maxAnnouncements = maxAnnouncements
+        self.clips = {} #file name -> pcm bytes
+        self.announcements = OrderedDict() #tuple of file names -> pcm bytes, least recently used first
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.decodeFailures = 0
+
+    def preload(self, fileNames, background=True): #decode clips ahead of the first alarm
+        if (background):
+            Thread(target=self.preload, args=(list(fileNames), False), daemon=True).start()
+            return
+        for fileName in fileNames:
+            self.getClip(fileName)
+
+    def getClip(self, fileName): #pcm of one clip, decoded on first use; None if it can't be decoded
+        with self.lock:
+            if (fileName in self.clips):
+                return self.clips[fileName]
+        path = os.path.join(self.directory, fileName)
+        try:
+            pcm = subprocess.run(DECODE_COMMAND + [path], capture_output=True, check=True).stdout
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f">>>>COULD NOT DECODE {path}: {e}")
+            with self.lock:
+                self.decodeFailures += 1
+            return None
+        with self.lock:
+            self.clips[fileName] = pcm
+        return pcm
+
+    def getAnnouncement(self, fileNames): #pcm of the clips played one after the other; None if any of them can't be decoded
+        key = tuple(fileNames)
+        with self.lock:
+            if (key in self.announcements):
+                self.hits += 1
+                self.announcements.move_to_end(key)
+                return self.announcements[key]
+            self.misses += 1
+        clips = [self.getClip(fileName) for fileName in key]
+        if (None in clips):
+            return None
+        pcm = b"".join(clips)
+        with self.lock:
+            self.announcements[key] = pcm
+            while (len(self.announcements) > self.maxAnnouncements):
+                self.announcements.popitem(last=False)
+        return pcm
+
+    def startAnnouncement(self, fileNames): #-> Future of getAnnouncement(fileNames), decoded on a thread of its own
+        future = Future()
+        def decode():
+            try:
+                future.set_result(self.getAnnouncement(fileNames))
+            except Exception as e:
+                future.set_exception(e)
+        Thread(target=decode, daemon=True).start()
+        return future
+
+    def play(self, pcm):
+        #blocks until played; False only if there is no audio output to play it on. Once out123 has started, some of
+        #the announcement may have been heard, so a failure after that is reported but not worth playing it again for
+        try:
+            player = subprocess.Popen(PLAY_COMMAND, stdin=subprocess.PIPE)
+        except OSError as e:
+            print(f">>>>COULD NOT START AUDIO OUTPUT: {e}")
+            return False
+        try:
+            player.stdin.write(pcm)
+            player.stdin.close()
+        except BrokenPipeError:
+            pass
+        returnCode = player.wait()
+        if (returnCode != 0):
+            print(f">>>>AUDIO OUTPUT EXITED WITH {returnCode}")
+        return True
+
+    def getCounters(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0,
+                "clips": len(self.clips),
+                "announcements": len(self.announcements),
+                "pcmBytes": sum(len(pcm) for pcm in self.clips.values()) + sum(len(pcm) for pcm in self.announcements.values()),
+                "decodeFailures": self.decodeFailures
+            }
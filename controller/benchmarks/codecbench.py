@@ -0,0 +1,56 @@
+# Frames per second through the serial codec (codec.py) compared with the string parsing alarm.py used before it.
+# Doesn't need the arduino. Run from the controller directory:
+#   python3 benchmarks/codecbench.py [frames]
+import math
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import codec
+
+
+#previous implementation, as it was in alarm.py (decode also needed the bytes decoded to str first)
+def legacyDecodeLine(line):
+    msg = line.split("-")
+    msg[3] = msg[3].rstrip('\n')
+    msg = [int(i, 16) for i in msg]
+    msg.append(math.floor(datetime.now().timestamp()))
+    return msg
+
+
+def legacyEncodeLine(message):
+    printableArr = message.copy()
+    printableArr.append(math.floor(datetime.now().timestamp()))
+    return bytearray(hex(message[0]) + "-" + hex(message[1]) + "-" + hex(message[2]) + "-" + hex(message[3]) + "-\n", 'ascii')
+
+
+def framesPerSecond(function, frames):
+    start = time.perf_counter()
+    for frame in frames:
+        function(frame)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def report(name, legacyFps, newFps):
+    print(f"{name:<14} legacy {legacyFps:>12,.0f} frames/s   codec {newFps:>12,.0f} frames/s   x{newFps / legacyFps:.1f}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    messages = [[0x50 + i % 0x30, 0x14, 0xAA if i % 7 == 0 else 0x00, 0x05] for i in range(count)]
+    #what the arduino actually prints: upper case, no leading zeros
+    textFrames = [("0x%X-0x%X-0x%X-0x%X" % tuple(message)).encode('ascii') for message in messages]
+    binaryFrames = [codec.encodeBinaryFrame(message) for message in messages]
+
+    report("decode text", framesPerSecond(lambda frame: legacyDecodeLine(frame.decode('utf-8')), textFrames),
+        framesPerSecond(codec.decodeTextFrame, textFrames))
+    report("decode binary", framesPerSecond(lambda frame: legacyDecodeLine(frame.decode('utf-8')), textFrames),
+        framesPerSecond(codec.decodeBinaryFrame, binaryFrames))
+    report("encode text", framesPerSecond(legacyEncodeLine, messages), framesPerSecond(codec.encodeTextFrame, messages))
+    report("encode binary", framesPerSecond(legacyEncodeLine, messages), framesPerSecond(codec.encodeBinaryFrame, messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Time from "alarm" to "ready to play" through DenonClient (denon.py), against a local stand-in for the AVR's web
+# interface that serves formMainZone_MainZoneXml.xml and takes index.put.asp commands, and takes bootSec to come on
+# like the real one does. Doesn't need the AVR. Run from the controller directory:
+#   python3 benchmarks/denonbench.py [bootSec]
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from denon import DenonClient, STATUS_PATH, COMMAND_PATH
+
+STATUS_XML = """<?xml version="1.0" encoding="utf-8" ?>
+<item>
+<Power><value>{power}</value></Power>
+<InputFuncSelectMain><value>{input}</value></InputFuncSelectMain>
+<MasterVolume><value>{volume}</value></MasterVolume>
+</item>
+"""
+
+
+class StandInAvr:
+    #the state a Denon AVR keeps behind its web interface; power on takes bootSec before it is reported
+    def __init__(self, bootSec):
+        self.bootSec = bootSec
+        self.power = "STANDBY"
+        self.input = "TV"
+        self.volume = "-40.0"
+        self.onAt = None
+        self.commands = []
+        self.connections = 0
+
+    def getStatusXml(self):
+        if (self.onAt is not None and time.monotonic() >= self.onAt):
+            self.power = "ON"
+            self.onAt = None
+        return STATUS_XML.format(power=self.power, input=self.input if self.power == "ON" else "TV", volume=self.volume)
+
+    def runCommand(self, command):
+        self.commands.append(command)
+        name, _, value = command.partition("/")
+        if (name == "PutSystem_OnStandby"):
+            if (value == "ON" and self.power != "ON"):
+                self.onAt = time.monotonic() + self.bootSec
+            elif (value == "STANDBY"):
+                self.power = "STANDBY"
+        elif (name == "PutZone_InputFunction"):
+            self.input = value
+        elif (name == "PutMasterVolumeSet"):
+            self.volume = f"{float(value):.1f}"
+
+
+def makeHandler(avr):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" #keep-alive, like the AVR
+
+        def setup(self):
+            super().setup()
+            avr.connections += 1
+
+        def do_GET(self):
+            if (urlparse(self.path).path != STATUS_PATH):
+                self.reply(404, b"")
+                return
+            self.reply(200, avr.getStatusXml().encode())
+
+        def do_POST(self):
+            if (self.path != COMMAND_PATH):
+                self.reply(404, b"")
+                return
+            form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+            for key in sorted(form):
+                avr.runCommand(form[key][0])
+            self.reply(200, b"")
+
+        def reply(self, status, body):
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+def main():
+    bootSec = float(sys.argv[1]) if len(sys.argv) > 1 else 2.5
+    avr = StandInAvr(bootSec)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), makeHandler(avr))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = DenonClient("127.0.0.1", server.server_address[1])
+
+    start = time.perf_counter()
+    state = client.getState()
+    client.powerOn("SAT/CBL")
+    ready = client.waitUntilReady("SAT/CBL", 8)
+    readySec = time.perf_counter() - start
+    client.setVolume(55)
+    afterState = client.getState()
+    client.setVolume(state["volume"])
+    client.powerOff()
+    print(f"start state {state}")
+    print(f"ready {ready} after {readySec:.2f}s with the AVR taking {bootSec}s to come on (fixed sleep before: 8s)")
+    print(f"while playing {afterState}, after restore {client.getState()}")
+    print(f"{client.requestCount} requests over {avr.connections} connection(s)")
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
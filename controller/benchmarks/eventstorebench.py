@@ -0,0 +1,44 @@
+# Sustained insert rate of the events db (eventstore.py), and what EventStore.add() costs the caller (the CAN loop).
+# Run on the Pi from the controller directory, against the same SD card the controller writes to:
+#   python3 benchmarks/eventstorebench.py [events] [db path]
+# Without a db path it writes to a fresh temporary directory (/tmp may well be a tmpfs, not the SD card) and deletes it
+# when done; a db path given is left in place.
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from eventstore import EventStore
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tempDir = None if len(sys.argv) > 2 else tempfile.mkdtemp(prefix="eventstorebench-")
+    path = sys.argv[2] if tempDir is None else os.path.join(tempDir, "bench-events.db")
+    store = EventStore(path, maxEvents=count // 2, sweepEverySec=1)
+    event = {"event": "TRIGGERED-NO-ALARM", "trigger": "0x50", "time": time.strftime('%c') + " LOCAL TIME"}
+
+    start = time.perf_counter()
+    slowestAddSec = 0
+    for i in range(count):
+        addStart = time.perf_counter()
+        store.add(event)
+        slowestAddSec = max(slowestAddSec, time.perf_counter() - addStart)
+    queuedSec = time.perf_counter() - start
+    store.flush()
+    writtenSec = time.perf_counter() - start
+
+    print(f"db: {path}")
+    print(f"add(): {count / queuedSec:,.0f} events/s from the caller's side, mean {queuedSec / count * 1e6:.1f}us, slowest {slowestAddSec * 1e3:.2f}ms")
+    print(f"sustained insert rate: {count / writtenSec:,.0f} events/s ({writtenSec:.2f}s for {count} events)")
+    time.sleep(3) #let the retention sweep catch up
+    print(f"counters: {store.getCounters()}")
+    store.close()
+    if (tempDir is not None):
+        shutil.rmtree(tempDir)
+
+
+if __name__ == "__main__":
+    main()
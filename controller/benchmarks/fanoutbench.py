@@ -0,0 +1,122 @@
+# Status fan-out latency of asyncserver.py: connects clients over socket.io websockets, has the server push a status
+# to all of them (publishStatus, as the engine does on every change), and times how long each client takes to get it.
+# A stand-in engine answers the status call every client makes on connect; no serial port or arduino needed. The
+# clients run in this process too, so on the Pi they share its CPU with the server. Run from the controller directory:
+#   python3 benchmarks/fanoutbench.py [clients] [broadcasts]
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import uvicorn
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import CloseConnection, Ping, Request, TextMessage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asyncserver
+
+STATUS_PADDING = "x" * 1500 #about the size of a real status with a handful of devices
+
+
+class BenchClient:
+    #just enough of a socket.io v5 (engine.io v4) websocket client to connect and take events
+    def __init__(self, port, onStatus):
+        self.port = port
+        self.onStatus = onStatus
+        self.connected = asyncio.Event()
+
+    async def run(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        ws = WSConnection(ConnectionType.CLIENT)
+        writer.write(ws.send(Request(host="127.0.0.1", target="/socket.io/?EIO=4&transport=websocket")))
+        text = ""
+        while True:
+            data = await reader.read(65536)
+            if (not data):
+                return
+            ws.receive_data(data)
+            for event in ws.events():
+                if (isinstance(event, Ping)):
+                    writer.write(ws.send(event.response()))
+                elif (isinstance(event, CloseConnection)):
+                    return
+                elif (isinstance(event, TextMessage)):
+                    text += event.data
+                    if (event.message_finished):
+                        self.onPacket(text, ws, writer)
+                        text = ""
+
+    def onPacket(self, packet, ws, writer):
+        if (packet.startswith("0")): #engine.io open - join the default namespace
+            writer.write(ws.send(TextMessage(data="40")))
+        elif (packet == "2"): #engine.io ping
+            writer.write(ws.send(TextMessage(data="3")))
+        elif (packet.startswith("40")):
+            self.connected.set()
+        elif (packet.startswith("42")):
+            name, body = json.loads(packet[2:])
+            if (name == "postStatus"):
+                self.onStatus(body["message"], time.perf_counter())
+
+
+def standInEngine():
+    while True:
+        message = asyncserver.webserver_message_queue.get()
+        if (message.get("call")):
+            message["call"].respond({"response": json.dumps({"version": 0, "padding": STATUS_PADDING}), "isDelta": False})
+
+
+def startServer():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(asyncserver.app, log_level="warning", ws="wsproto"))
+    threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True).start()
+    while (not server.started):
+        time.sleep(.05)
+    return sock.getsockname()[1]
+
+
+async def main():
+    clientCount = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    broadcasts = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    threading.Thread(target=standInEngine, daemon=True).start()
+    port = startServer()
+
+    received = {} #version -> [receive time per client]
+    clients = [BenchClient(port, lambda status, at: received.setdefault(status["version"], []).append(at)) for i in range(clientCount)]
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(client.run()) for client in clients]
+    await asyncio.gather(*[client.connected.wait() for client in clients])
+    print(f"{clientCount} clients connected in {time.perf_counter() - start:.2f}s")
+    await asyncio.sleep(1) #let the status each one asked for on connect arrive
+
+    lastClientMs = []
+    allMs = []
+    for version in range(1, broadcasts + 1):
+        sentAt = time.perf_counter()
+        asyncserver.publishStatus(version, json.dumps({"version": version, "padding": STATUS_PADDING}), None)
+        deadline = sentAt + 10
+        while (len(received.get(version, [])) < clientCount and time.perf_counter() < deadline):
+            await asyncio.sleep(.005)
+        latencies = [(at - sentAt) * 1000 for at in received.get(version, [])]
+        if (len(latencies) < clientCount):
+            print(f"version {version}: only {len(latencies)} of {clientCount} clients got it")
+        allMs += latencies
+        lastClientMs.append(max(latencies))
+        await asyncio.sleep(.2)
+
+    allMs.sort()
+    print(f"{broadcasts} broadcasts of {len(STATUS_PADDING) + 30} bytes to {clientCount} clients")
+    print(f"per client: median {statistics.median(allMs):.1f}ms, p95 {allMs[int(len(allMs) * .95)]:.1f}ms, max {allMs[-1]:.1f}ms")
+    print(f"until the last client had it: median {statistics.median(lastClientMs):.1f}ms, max {max(lastClientMs):.1f}ms")
+    print(f"engine calls {asyncserver.rpcBridge.getCounters()}")
+    for task in tasks:
+        task.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
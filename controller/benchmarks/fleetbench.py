@@ -0,0 +1,121 @@
+# The engine against simulated fleets of growing size (see fleetsim.py), no arduino needed. For each fleet size:
+# - frames handled per second: a flood of state frames on top of the heartbeats, timed until the engine has handled them
+# - trigger to output: armed, a sensor trips; from its 0xAA frame written to the first 0xBB frame for an alarm output
+#   read back off the port. Also the engine's own share of it (alarm.triggerToOutputTime)
+# - missing-device detection: devices go quiet; from the last frame each sent to the status that lists it missing,
+#   less alarm.deviceAbsenceThresholdSec - the time the engine takes beyond the threshold it is meant to wait
+# Each size runs in a process of its own, the engine's state being module globals. The engine's prints go nowhere.
+# Run from the controller directory:
+#   python3 benchmarks/fleetbench.py [device counts, default 10 50 100 200 240]
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from queue import Queue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fleetsim
+
+FLEET_SIZES = [10, 50, 100, 200, 240] #a CAN id is one byte, and some are taken - 247 devices at most
+TRIGGER_ROUNDS = 5
+FLOOD_FRAMES = 20000
+SILENCED_DEVICES = 3
+
+
+def waitFor(condition, timeoutSec):
+    deadline = time.monotonic() + timeoutSec
+    while (not condition() and time.monotonic() < deadline):
+        time.sleep(.002)
+    return condition()
+
+
+def runFleet(deviceCount): #in the child process -> results dict
+    fleet = fleetsim.getFleet(deviceCount)
+    simulator = fleetsim.FleetSimulator(fleet).start()
+    import alarm
+    alarm.serialPort = simulator.serialPort
+    alarm.initWaitSeconds = 0
+    alarm.eventsDbPath = os.path.join(tempfile.mkdtemp(), "events.db")
+    missingSinceNs = {} #device id -> monotonic ns a status first listed it missing
+    def onStatus(version, status, delta):
+        for deviceId in json.loads(status)["currentMissingDevices"]:
+            missingSinceNs.setdefault(int(deviceId, 16), time.monotonic_ns())
+    alarm.addStatusListener(onStatus)
+    engineQueue = Queue()
+    threading.Thread(target=alarm.run, args=(engineQueue, ), daemon=True).start()
+    waitFor(lambda: len(alarm.memberDevices) >= deviceCount, 10)
+    time.sleep(alarm.timeAllottedToBuildOutMembersSec + 1) #and the power plan that follows
+
+    handledBefore = sum(alarm.framesPerSender)
+    startSec = time.monotonic()
+    simulator.flood(FLOOD_FRAMES)
+    waitFor(lambda: sum(alarm.framesPerSender) - handledBefore >= FLOOD_FRAMES, 60)
+    framesPerSec = (sum(alarm.framesPerSender) - handledBefore) / (time.monotonic() - startSec)
+
+    outputs = set(fleetsim.OUTPUT_DEVICES)
+    sensor = fleetsim.PROFILE_SENSORS[0]
+    triggerMs = []
+    for i in range(TRIGGER_ROUNDS):
+        engineQueue.put({"request": "ENABLE-ALARM", "uuid": "fleetbench"})
+        waitFor(lambda: alarm.armed, 5)
+        waitFor(lambda: len(alarm.memberDevices) >= deviceCount, 5) #arming starts the member list over
+        time.sleep(.5)
+        triggeredNs = simulator.trigger(sensor)
+        outputNs = simulator.waitForFrame(lambda frame: frame[2] == 0xBB and frame[1] in outputs, triggeredNs)
+        if (outputNs is not None):
+            triggerMs.append((outputNs - triggeredNs) / 1e6)
+        simulator.clear(sensor)
+        engineQueue.put({"request": "DISABLE-ALARM", "uuid": "fleetbench"})
+        waitFor(lambda: not alarm.armed, 5)
+        time.sleep(.5)
+
+    silenced = list(fleet)[-SILENCED_DEVICES:]
+    for deviceId in silenced:
+        simulator.silence(deviceId)
+    waitFor(lambda: all(deviceId in missingSinceNs for deviceId in silenced), alarm.deviceAbsenceThresholdSec + 10)
+    missingMs = [(missingSinceNs[deviceId] - simulator.lastSentNs[deviceId]) / 1e6 - alarm.deviceAbsenceThresholdSec * 1000
+        for deviceId in silenced if deviceId in missingSinceNs]
+
+    loopSamples = dict((name, value) for name, labels, value in alarm.loopIterationTime.getSamples("loop") if labels is None)
+    outputSamples = dict((name, value) for name, labels, value in alarm.triggerToOutputTime.getSamples("output") if labels is None)
+    return {
+        "devices": deviceCount,
+        "framesPerSec": framesPerSec,
+        "triggerMs": triggerMs,
+        "engineTriggerMs": outputSamples["output_sum"] / outputSamples["output_count"] * 1000 if outputSamples["output_count"] else None,
+        "missingOvershootMs": missingMs,
+        "loopIterationUs": loopSamples["loop_sum"] / loopSamples["loop_count"] * 1e6 if loopSamples["loop_count"] else None
+    }
+
+
+def formatMs(values):
+    return f"{statistics.median(values):7.1f} / {max(values):7.1f}" if values else "      -  /       -"
+
+
+def main():
+    if (len(sys.argv) > 2 and sys.argv[1] == "--child"):
+        results = runFleet(int(sys.argv[2]))
+        sys.__stderr__.write("RESULT " + json.dumps(results) + "\n")
+        os._exit(0) #the engine's threads don't stop on their own
+    sizes = [int(arg) for arg in sys.argv[1:]] or FLEET_SIZES
+    print(f"{'devices':>8} {'frames/s':>9} {'trigger->0xBB ms':>19} {'of it engine':>13} {'missing beyond threshold ms':>28} {'loop us':>8}")
+    print(f"{'':>8} {'handled':>9} {'median / max':>19} {'mean ms':>13} {'median / max':>28} {'mean':>8}")
+    for size in sizes:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", str(size)], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        lines = [line for line in child.stderr.splitlines() if line.startswith("RESULT ")]
+        if (not lines):
+            print(f"{size:>8} failed:\n{child.stderr[-2000:]}")
+            continue
+        result = json.loads(lines[-1][len("RESULT "):])
+        engineMs = f"{result['engineTriggerMs']:13.2f}" if result["engineTriggerMs"] is not None else f"{'-':>13}"
+        loopUs = f"{result['loopIterationUs']:8.1f}" if result["loopIterationUs"] is not None else f"{'-':>8}"
+        print(f"{size:>8} {result['framesPerSec']:9.0f} {formatMs(result['triggerMs']):>19} {engineMs} {formatMs(result['missingOvershootMs']):>28} {loopUs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# A simulated CAN bus and device fleet, for running the engine without the arduino. A pty stands in for the home base
+# arduino's serial port (point alarm.serialPort at simulator.serialPort); every simulated device sends its state the
+# way controller.ino forwards it - {sender}-{receiver}-{message}-{devicetype} - once per heartbeatSec, the rate a
+# multidevicenode sends each of its devices at. Frames the engine writes are read back and timestamped, so a caller can
+# time how long the engine took to answer something. Devices don't act on what they're sent (power, alarm on/off):
+# sensors keep reporting, as the always-on ones in alwaysKeepOnSet do.
+import os
+import pty
+import random
+import sys
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import codec
+
+SENSOR_TYPE = 0x05 #door open sensor
+BELL_TYPE = 0x03
+VISUAL_TYPE = 0x04
+HOME_BASE_ID = 0x14
+RESERVED_IDS = {0x00, HOME_BASE_ID, 0x17, 0x77, 0xD0, 0xDE, 0xF0, 0xFF} #broadcast, home base, virtual devices, denon, opener, group address
+OUTPUT_DEVICES = {0x99: VISUAL_TYPE, 0x15: BELL_TYPE, 0x10: BELL_TYPE} #the alarm outputs of the profiles in alarmProfiles.json
+PROFILE_SENSORS = [0x50, 0x40, 0x31, 0x30] #sensors that trigger an alarm and count when missing in alarmProfiles.json
+
+
+def getFleet(deviceCount): #-> {device id: device type}: the real outputs and sensors first, then made-up sensors
+    fleet = dict(OUTPUT_DEVICES)
+    fleet.update({deviceId: SENSOR_TYPE for deviceId in PROFILE_SENSORS})
+    spareIds = [deviceId for deviceId in range(1, 256) if deviceId not in RESERVED_IDS and deviceId not in fleet]
+    if (deviceCount > len(fleet) + len(spareIds)):
+        raise ValueError(f"one byte of CAN id only leaves room for {len(fleet) + len(spareIds)} devices")
+    fleet.update({deviceId: SENSOR_TYPE for deviceId in spareIds[:deviceCount - len(fleet)]})
+    return dict(list(fleet.items())[:deviceCount])
+
+
+class FleetSimulator:
+    def __init__(self, fleet, heartbeatSec=1, binaryFraming=False):
+        self.fleet = dict(fleet) #device id -> device type
+        self.heartbeatSec = heartbeatSec
+        self.binaryFraming = binaryFraming #must match alarm.useBinaryFraming
+        self.states = {deviceId: 0x00 for deviceId in self.fleet} #what each device reports: 0x00, or 0xAA while triggered
+        self.silenced = set() #devices that stopped sending
+        self.lastSentNs = {} #device id -> monotonic ns of its last frame
+        self.master, slave = pty.openpty()
+        tty.setraw(self.master)
+        self.serialPort = os.ttyname(slave)
+        self.slave = slave #kept open so the pty stays up between the engine's opens
+        self.writeLock = threading.Lock()
+        self.condition = threading.Condition()
+        self.received = [] #(monotonic ns, [sender, receiver, message, deviceType]) of every frame the engine wrote
+        self.framesSent = 0
+        self.running = False
+
+    def start(self, heartbeats=True): #without heartbeats the caller sends them, e.g. on a virtual clock - see timeouts.py
+        self.running = True
+        if (heartbeats):
+            threading.Thread(target=self.heartbeatThreadMain, daemon=True).start()
+        threading.Thread(target=self.readerThreadMain, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def encode(self, frame):
+        return codec.encodeBinaryFrame(frame) if self.binaryFraming else codec.encodeTextFrame(frame)
+
+    def sendFrames(self, frames): #-> monotonic ns they were written at
+        data = b"".join(self.encode(frame) for frame in frames)
+        with self.writeLock:
+            os.write(self.master, data)
+            self.framesSent += len(frames)
+            return time.monotonic_ns()
+
+    def getStateFrame(self, deviceId):
+        return [deviceId, HOME_BASE_ID, self.states[deviceId], self.fleet[deviceId]]
+
+    def heartbeatThreadMain(self):
+        #each device at its own phase within heartbeatSec, as independent nodes would be; frames due together go in one write
+        phases = {deviceId: random.random() * self.heartbeatSec for deviceId in self.fleet}
+        nextSend = {deviceId: time.monotonic() + phase for deviceId, phase in phases.items()}
+        while self.running:
+            now = time.monotonic()
+            due = [deviceId for deviceId, at in nextSend.items() if at <= now and deviceId not in self.silenced]
+            if (due):
+                sentNs = self.sendFrames([self.getStateFrame(deviceId) for deviceId in due])
+                for deviceId in due:
+                    nextSend[deviceId] = now + self.heartbeatSec
+                    self.lastSentNs[deviceId] = sentNs
+            time.sleep(max(0, min(nextSend.values()) - time.monotonic()) if nextSend else .1)
+
+    def readerThreadMain(self):
+        buffer = b""
+        while self.running:
+            try:
+                data = os.read(self.master, 65536)
+            except OSError:
+                return
+            receivedNs = time.monotonic_ns()
+            buffer += data
+            frames = []
+            if (self.binaryFraming):
+                start = buffer.find(bytes((codec.BINARY_FRAME_SYNC, )))
+                while (start >= 0 and len(buffer) - start >= codec.BINARY_FRAME_LENGTH):
+                    frames.append(codec.decodeBinaryFrame(buffer[start:start + codec.BINARY_FRAME_LENGTH]))
+                    buffer = buffer[start + codec.BINARY_FRAME_LENGTH:]
+                    start = buffer.find(bytes((codec.BINARY_FRAME_SYNC, )))
+            else:
+                *lines, buffer = buffer.split(b"\n")
+                frames = [codec.decodeTextFrame(line) for line in lines if line]
+            with self.condition:
+                self.received += [(receivedNs, frame) for frame in frames]
+                self.condition.notify_all()
+
+    def trigger(self, deviceId): #the sensor trips; -> monotonic ns its 0xAA frame was written
+        self.states[deviceId] = 0xAA
+        return self.sendFrames([self.getStateFrame(deviceId)])
+
+    def clear(self, deviceId):
+        self.states[deviceId] = 0x00
+        return self.sendFrames([self.getStateFrame(deviceId)])
+
+    def silence(self, deviceId): #the device stops sending, as if unplugged; -> monotonic ns of the last frame it sent
+        with self.writeLock: #not halfway through sending its heartbeat
+            self.silenced.add(deviceId)
+        return self.lastSentNs.get(deviceId, time.monotonic_ns())
+
+    def resume(self, deviceId):
+        self.silenced.discard(deviceId)
+
+    def flood(self, frameCount, batchSize=64): #state frames from the whole fleet as fast as the pty takes them
+        deviceIds = list(self.fleet)
+        for start in range(0, frameCount, batchSize):
+            self.sendFrames([self.getStateFrame(deviceIds[i % len(deviceIds)]) for i in range(start, min(start + batchSize, frameCount))])
+
+    def waitForFrame(self, matches, afterNs, timeoutSec=5): #-> monotonic ns of the first frame written after afterNs that matches(frame), None on timeout
+        deadline = time.monotonic() + timeoutSec
+        with self.condition:
+            while True:
+                for receivedNs, frame in self.received:
+                    if (receivedNs >= afterNs and matches(frame)):
+                        return receivedNs
+                remainingSec = deadline - time.monotonic()
+                if (remainingSec <= 0):
+                    return None
+                self.condition.wait(remainingSec)
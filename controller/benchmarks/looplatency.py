@@ -0,0 +1,74 @@
+# Measures how long the alarm engine's main loop takes to pick up web server requests and CAN frames.
+# Runs the engine on a pty standing in for the serial port (see fleetsim.py, here with no devices on it), or on the
+# arduino gateway with --port. Run from the controller directory:
+#   python3 benchmarks/looplatency.py [iterations] [--port /dev/ttyUSB0]
+import argparse
+import os
+import sys
+import time
+from queue import Queue
+from threading import Thread
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import alarm
+import fleetsim
+import rpc
+
+
+def percentile(sortedSamples, fraction):
+    return sortedSamples[min(len(sortedSamples) - 1, int(len(sortedSamples) * fraction))]
+
+
+def printReport(name, samplesNs):
+    samplesMs = sorted(sample / 1e6 for sample in samplesNs)
+    print(f"{name}: n={len(samplesMs)} p50={percentile(samplesMs, .5):.3f}ms p99={percentile(samplesMs, .99):.3f}ms max={samplesMs[-1]:.3f}ms")
+
+
+def timeStatusRequest(rpcBridge):
+    start = time.monotonic_ns()
+    rpcBridge.call(rpc.ALARM_STATUS).result()
+    return time.monotonic_ns() - start
+
+
+def timeFrame(engineQueue, rpcBridge):
+    #a no-op frame from the home base itself (never added as a member), followed by a status request; the status request
+    #cannot be answered until the frame was handled
+    start = time.monotonic_ns()
+    engineQueue.put({"request": "CAN-FRAME", "msg": [0x14, 0x14, 0x00, 0x01], "receivedTimeNs": start})
+    rpcBridge.call(rpc.ALARM_STATUS).result()
+    return time.monotonic_ns() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("iterations", type=int, nargs="?", default=1000)
+    parser.add_argument("--port", help="the arduino gateway's serial port, instead of a pty")
+    args = parser.parse_args()
+    if (args.port):
+        alarm.serialPort = args.port
+    else:
+        simulator = fleetsim.FleetSimulator({}).start(heartbeats=False) #reads back what the engine writes
+        alarm.serialPort = simulator.serialPort
+        alarm.initWaitSeconds = 0
+    iterations = args.iterations
+    engineQueue = Queue()
+    rpcBridge = rpc.RpcBridge(engineQueue)
+    Thread(target = alarm.run, args = (engineQueue, ), daemon = True).start()
+    time.sleep(alarm.initWaitSeconds + 1)
+
+    #idle bus: each request is timed on its own, with a pause in between so the loop is parked in its blocking wait
+    statusSamples = []
+    frameSamples = []
+    for i in range(iterations):
+        statusSamples.append(timeStatusRequest(rpcBridge))
+        time.sleep(.002)
+        frameSamples.append(timeFrame(engineQueue, rpcBridge))
+        time.sleep(.002)
+
+    printReport("web request -> response", statusSamples)
+    printReport("CAN frame -> handled", frameSamples)
+
+
+if __name__ == "__main__":
+    main()
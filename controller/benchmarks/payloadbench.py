@@ -0,0 +1,65 @@
+# Size on the wire and CPU per broadcast of each payload format in payloads.py, for a full status, a status delta and
+# a page of past events shaped like the engine's. The CPU is what a broadcast costs the server before any socket is
+# written to: encoding the payload and the socket.io packet, both done once per format however many clients there are.
+# "object" is how statuses went out before (parse the engine's json, let socket.io encode it again). Run from the
+# controller directory:
+#   python3 benchmarks/payloadbench.py [rounds]
+import json
+import os
+import sys
+import time
+
+from socketio import packet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import payloads
+
+FORMATS = [payloads.LEGACY, "json", "json+deflate", "msgpack", "msgpack+deflate"]
+MEMBERS = ["0x77", "0x99", "0x15", "0x10", "0x80", "0x75", "0x30", "0x31", "0x40", "0x50"]
+
+
+def makeStatus():
+    return json.dumps({
+        "version": 1042, "armStatus": "ARMED", "alarmStatus": "ALARM", "garageOpen": False,
+        "profile": "Night - Office Alarms 10s | All Sensors", "profileNumber": "18",
+        "currentTriggeredDevices": ["0x50"], "currentMissingDevices": [], "everTriggeredWithinAlarmCycle": ["0x50"],
+        "everTriggeredWithinArmCycle": ["0x50", "0x40"], "everMissingWithinArmCycle": [], "everMissingDevices": ["0x75"],
+        "memberCount": len(MEMBERS), "memberDevices": MEMBERS,
+        "memberDevicesReadable": ["SENSOR | FRONT DOOR | " + member for member in MEMBERS],
+        "powerSequence": {"running": False, "done": 9, "total": 9}
+    })
+
+
+def makeDelta():
+    return json.dumps({"version": 1043, "since": 1042, "changed": {"alarmStatus": "NORMAL", "currentTriggeredDevices": []}})
+
+
+def makeEventsPage():
+    events = [json.dumps({"event": "TRIGGERED-ALARM", "trigger": "tripped 0x50", "tripped": ["0x50"], "missing": [], "devices": ["0x50"],
+        "time": "Sun Oct 18 12:17:37 2026 LOCAL TIME", "timestamp": 1792325857 + i, "seq": 5000 + i}) for i in range(200)]
+    return '{"pastEvents": [' + ",".join(events) + '],"latestSeq": 5199,"oldestSeq": 5000,"reset": false}'
+
+
+def encodeBroadcast(jsonString, payloadFormat): #-> what goes on the wire for one client, in bytes
+    encoded = packet.Packet(packet.EVENT, data=["postStatus", {"message": payloads.encodePayload(jsonString, payloadFormat)}]).encode()
+    if (isinstance(encoded, list)): #binary: the packet text, then the attachment
+        return len(encoded[0]) + sum(len(attachment) for attachment in encoded[1:])
+    return len(encoded.encode())
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    if (payloads.msgpack is None):
+        print("msgpack isn't installed - the msgpack formats fall back to json")
+    for name, jsonString in (("status", makeStatus()), ("delta", makeDelta()), ("200 events", makeEventsPage())):
+        print(f"\n{name}: engine json {len(jsonString)} bytes")
+        for payloadFormat in FORMATS:
+            start = time.process_time()
+            for i in range(rounds):
+                size = encodeBroadcast(jsonString, payloadFormat)
+            cpuUs = (time.process_time() - start) / rounds * 1e6
+            print(f"  {payloadFormat:16} {size:7} bytes on the wire  {cpuUs:8.1f}us cpu per broadcast")
+
+
+if __name__ == "__main__":
+    main()
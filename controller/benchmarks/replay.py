@@ -0,0 +1,129 @@
+# Feeds a capture (see capture.py, alarm.captureFile) back into the engine through a pty standing in for the serial
+# port: the frames the arduino sent, either as fast as the engine takes them or at a speed-up of the original timing.
+# The captured web requests go on the engine queue in their place among the frames. The engine runs on a
+# clock.VirtualClock following the capture's timing, so deadlines and alarm timeouts fall among the frames as they did in
+# the house, however fast the replay.
+# Prints what it cost the engine per frame, and writes the events it produced - without their times, which differ from
+# run to run - for a diff against the same capture replayed by another version. The frames the engine sends aren't
+# compared with the captured ones: the transmit thread spaces and coalesces them in real time, so how many go out
+# depends on how fast the replay runs. Run from the controller directory:
+#   python3 benchmarks/replay.py capture.cap [--speed 60] [--from sec] [--to sec] [--events events.jsonl]
+# --speed 0 (the default) is as fast as possible.
+import argparse
+import hashlib
+import json
+import os
+import pty
+import sys
+import tempfile
+import threading
+import time
+import tty
+from queue import Queue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import capture
+from clock import VirtualClock
+
+VARYING_EVENT_FIELDS = ("time", "timestamp", "seq")
+CLOCK_STEP_NS = 1000000 #as fast as possible, frames less than this apart go to the engine together, at the first one's time
+
+
+def drainThreadMain(master): #what the engine writes has to be read, or the pty fills up and it blocks
+    while True:
+        try:
+            os.read(master, 65536)
+        except OSError:
+            return
+
+
+def waitFor(condition, timeoutSec):
+    deadline = time.monotonic() + timeoutSec
+    while (not condition() and time.monotonic() < deadline):
+        time.sleep(.0002)
+    return condition()
+
+
+def main():
+    if (os.environ.get("PYTHONHASHSEED") is None): #the same set iteration order every run, so events list devices alike
+        os.execve(sys.executable, [sys.executable] + sys.argv, {**os.environ, "PYTHONHASHSEED": "0"})
+    parser = argparse.ArgumentParser()
+    parser.add_argument("capture")
+    parser.add_argument("--speed", type=float, default=0, help="speed-up of the captured timing, 0 for as fast as possible")
+    parser.add_argument("--from", dest="fromSec", type=float, default=0)
+    parser.add_argument("--to", dest="toSec", type=float, default=None)
+    parser.add_argument("--events", help="write the events the engine produced here, one json per line")
+    args = parser.parse_args()
+
+    reader = capture.CaptureReader(args.capture)
+    records = list(reader.records(int(args.fromSec * 1e9), int(args.toSec * 1e9) if args.toSec is not None else None))
+    frames = [(timeNs, direction, reader.encodeForWire(frame) if direction == capture.RECEIVED else frame) for timeNs, direction, frame in records if direction != capture.SENT]
+    received = sum(1 for timeNs, direction, frame in frames if direction == capture.RECEIVED)
+    if (not received):
+        print("nothing received in that part of the capture")
+        return
+
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    threading.Thread(target=drainThreadMain, args=(master, ), daemon=True).start()
+    import alarm
+    alarm.serialPort = os.ttyname(slave)
+    alarm.useBinaryFraming = reader.binaryFraming
+    alarm.initWaitSeconds = 0
+    alarm.eventsDbPath = os.path.join(tempfile.mkdtemp(), "events.db")
+    clock = VirtualClock(speedup=args.speed if args.speed > 0 else None, startWallTime=reader.startWallNs / 1e9)
+    alarm.clock = clock
+    threading.Thread(target=alarm.run, args=(Queue(), ), daemon=True).start()
+    waitFor(lambda: alarm.frameReader is not None, 10)
+
+    startSec = time.monotonic()
+    firstNs = frames[0][0]
+    batch = []
+    written = 0 #frames the engine will count as received or malformed, of those written so far
+    handled = lambda: alarm.frameReader.framesReceived + alarm.frameReader.framesMalformed >= written and alarm.engineQueue.empty()
+    clock.setNs(firstNs) #capture time from here on
+    for timeNs, direction, frame in frames:
+        if (args.speed > 0):
+            waitSec = startSec + (timeNs - firstNs) / 1e9 / args.speed - time.monotonic()
+            if (waitSec > 0):
+                os.write(master, b"".join(batch))
+                batch = []
+                time.sleep(waitSec)
+        elif (timeNs >= clock.monotonicNs() + CLOCK_STEP_NS): #the frames so far handled at their time before it moves on
+            os.write(master, b"".join(batch))
+            batch = []
+            waitFor(handled, 60)
+            clock.setNs(timeNs)
+        if (direction == capture.COMMAND): #after every frame before it, as the engine saw them
+            os.write(master, b"".join(batch))
+            batch = []
+            waitFor(handled, 60)
+            alarm.engineQueue.put(json.loads(frame))
+            continue
+        batch.append(frame)
+        written += 1 if frame.strip(b"\r\n") and not frame.startswith(b">>>") else 0 #debug lines aren't counted
+        if (len(batch) >= 256):
+            os.write(master, b"".join(batch))
+            batch = []
+    os.write(master, b"".join(batch))
+    if (not waitFor(handled, 60)):
+        print(f"the engine only took {alarm.frameReader.framesReceived} of {written} frames")
+    wallSec = time.monotonic() - startSec
+    time.sleep(.2) #the last frame's own handling
+
+    loop = {name: value for name, labels, value in alarm.loopIterationTime.getSamples("loop") if labels is None}
+    events = [{key: value for key, value in event.items() if key not in VARYING_EVENT_FIELDS} for event in alarm.eventStore.getEvents()]
+    eventLines = [json.dumps(event, sort_keys=True) for event in events]
+    capturedSec = (frames[-1][0] - firstNs) / 1e9
+    print(f"replayed {received} frames and {len(frames) - received} web requests covering {capturedSec:.1f}s of capture in {wallSec:.2f}s ({capturedSec / max(wallSec, 1e-9):.0f}x)")
+    print(f"engine loop: {loop['loop_count']} iterations, {loop['loop_sum'] / max(loop['loop_count'], 1) * 1e6:.1f}us mean, "
+        f"{loop['loop_sum'] / received * 1e6:.1f}us per frame received")
+    print(f"events: {len(events)}, sha1 {hashlib.sha1(chr(10).join(eventLines).encode()).hexdigest()}")
+    if (args.events):
+        with open(args.events, "w") as file:
+            file.write("\n".join(eventLines) + "\n")
+    os._exit(0) #the engine's threads don't stop on their own
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# The whole bus going silent while armed - a cut cable or a dead home base arduino - on a clock.VirtualClock. The fleet
+# (fleetsim.py) reports until the engine is armed, then nothing at all reaches the engine: no heartbeats, and none of
+# the wake frames timeouts.py sends. The clock is only stepped, to the engine's next timed check each time. Checks that
+# - every device is listed missing deviceAbsenceThresholdSec after the last frame, and the missing alarm goes off then
+# - the engine handled not one frame in the meantime, so it was its own timer that raised the alarm
+# The engine's prints go nowhere. Run from the controller directory:
+#   python3 benchmarks/silentbus.py
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from timeouts import VirtualRun, MIN_STEP_SEC, report, waitFor
+
+
+def reportCount(name, count, expected):
+    ok = count == expected
+    print(f"{'ok  ' if ok else 'FAIL'} {name:<44} {count:9d}  expected {expected}")
+    return ok
+
+
+def getIterations(alarm): #engine loop iterations so far
+    return sum(alarm.loopIterationTime.counts)
+
+
+def stepSilently(run): #the clock to the engine's next timed check, then until the engine has been round its loop
+    iterations = getIterations(run.alarm)
+    run.clock.setNs(int((run.nowSec() + max(run.alarm.getSecondsUntilNextCheck(), MIN_STEP_SEC)) * 1e9))
+    startSec = time.monotonic()
+    waitFor(lambda: getIterations(run.alarm) > iterations, 10)
+    run.realSec += time.monotonic() - startSec
+
+
+def checkSilentBus(run, timeoutSec): #-> (virtual seconds from the last frame to the missing alarm or None, frames handled meanwhile)
+    run.request("ENABLE-ALARM")
+    run.runFor(3) #arming starts the member list over
+    lastFrameSec = run.lastHeartbeatSec
+    handledBefore = sum(run.alarm.framesPerSender)
+    while (not run.alarm.alarmed and run.nowSec() - lastFrameSec < timeoutSec):
+        stepSilently(run)
+    alarmSec = run.nowSec() - lastFrameSec if run.alarm.alarmed else None
+    return alarmSec, sum(run.alarm.framesPerSender) - handledBefore
+
+
+def main():
+    with contextlib.redirect_stdout(io.StringIO()):
+        run = VirtualRun()
+        run.runFor(run.alarm.timeAllottedToBuildOutMembersSec + 2) #members, and the power plan that follows
+        absenceSec = run.alarm.deviceAbsenceThresholdSec
+        alarmSec, framesHandled = checkSilentBus(run, absenceSec * 3)
+        missing = set(run.alarm.missingMembers)
+        events = [event["event"] for event in run.alarm.eventStore.getEvents()]
+    fleet = {hex(deviceId) for deviceId in run.simulator.fleet}
+    #the whole fleet's last heartbeat went at lastHeartbeatSec, and the engine's timer wakes it within MIN_STEP_SEC of a deadline
+    ok = report("missing alarm on a silent bus", alarmSec, absenceSec, MIN_STEP_SEC)
+    ok = reportCount("frames handled while silent", framesHandled, 0) and ok
+    ok = reportCount("devices not listed missing", len(fleet - missing), 0) and ok
+    ok = reportCount("DEVICE-MISSING-ALARM events", events.count("DEVICE-MISSING-ALARM"), 1) and ok
+    virtualSec = run.nowSec()
+    print(f"{virtualSec:.0f}s of virtual time in {run.realSec:.2f}s ({virtualSec / max(run.realSec, 1e-9):.0f}x)")
+    sys.stdout.flush()
+    os._exit(0 if ok else 1) #the engine's threads don't stop on their own
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# The engine's timeouts played out on a clock.VirtualClock moved by hand, some hundreds of times faster than they take
+# for real. A simulated fleet (fleetsim.py) reports once per second of virtual time, its heartbeats sent from here as the
+# clock is stepped - straight to the next heartbeat or the next time the engine would wake up for its timed checks,
+# with a frame to wake it, so it checks exactly when it would have. Checks that
+# - a device that goes quiet is listed missing deviceAbsenceThresholdSec after its last frame
+# - an alarm stops the profile's alarmTimeLengthSec after the trigger that set it off
+# - the wall clock stepping by an hour, as NTP would after a long time offline, changes neither
+# The engine's prints go nowhere. Run from the controller directory:
+#   python3 benchmarks/timeouts.py
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from queue import Queue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fleetsim
+from clock import VirtualClock
+
+FLEET_SIZE = 20
+QUIET_DEVICE = 0x40 #a profile sensor, see fleetsim.PROFILE_SENSORS
+TRIGGER_DEVICE = 0x50
+WALL_CLOCK_STEP_SEC = 3600
+MIN_STEP_SEC = .001
+
+
+def waitFor(condition, timeoutSec):
+    deadline = time.monotonic() + timeoutSec
+    while (not condition() and time.monotonic() < deadline):
+        time.sleep(.0002)
+    return condition()
+
+
+class VirtualRun:
+    def __init__(self):
+        self.clock = VirtualClock()
+        self.simulator = fleetsim.FleetSimulator(fleetsim.getFleet(FLEET_SIZE)).start(heartbeats=False)
+        import alarm
+        self.alarm = alarm
+        alarm.clock = self.clock
+        alarm.serialPort = self.simulator.serialPort
+        alarm.initWaitSeconds = 0
+        alarm.eventsDbPath = os.path.join(tempfile.mkdtemp(), "events.db")
+        self.engineQueue = Queue()
+        threading.Thread(target=alarm.run, args=(self.engineQueue, ), daemon=True).start()
+        waitFor(lambda: alarm.frameReader is not None, 10)
+        self.sentBefore = self.simulator.framesSent
+        self.handledBefore = sum(alarm.framesPerSender)
+        self.nextHeartbeatSec = 0
+        self.lastHeartbeatSec = None
+        self.realSec = 0
+
+    def nowSec(self):
+        return self.clock.monotonicNs() / 1e9
+
+    def settle(self): #until the engine has handled every frame sent, and so run its timed checks after the last one
+        handled = lambda: sum(self.alarm.framesPerSender) - self.handledBefore >= self.simulator.framesSent - self.sentBefore and self.engineQueue.empty()
+        waitFor(handled, 10)
+
+    def step(self):
+        startSec = time.monotonic()
+        untilSec = min(self.nextHeartbeatSec, self.nowSec() + self.alarm.getSecondsUntilNextCheck())
+        self.clock.setNs(int(max(untilSec, self.nowSec() + MIN_STEP_SEC) * 1e9))
+        frames = [[fleetsim.HOME_BASE_ID, fleetsim.HOME_BASE_ID, 0x00, 0x01]] #the home base to itself, which the engine only counts
+        if (self.nowSec() >= self.nextHeartbeatSec):
+            frames += [self.simulator.getStateFrame(deviceId) for deviceId in self.simulator.fleet if deviceId not in self.simulator.silenced]
+            self.lastHeartbeatSec = self.nowSec()
+            self.nextHeartbeatSec += 1
+        self.simulator.sendFrames(frames)
+        self.settle()
+        self.realSec += time.monotonic() - startSec
+
+    def runFor(self, sec):
+        untilSec = self.nowSec() + sec
+        while (self.nowSec() < untilSec):
+            self.step()
+
+    def runUntil(self, condition, timeoutSec): #-> virtual time it happened at, None if it didn't
+        startSec = self.nowSec()
+        while (not condition()):
+            if (self.nowSec() - startSec > timeoutSec):
+                return None
+            self.step()
+        return self.nowSec()
+
+    def request(self, request):
+        self.engineQueue.put({"request": request, "uuid": "timeouts"})
+        self.settle()
+
+
+def checkMissing(run, expectedSec):
+    run.simulator.silence(QUIET_DEVICE)
+    lastSentSec = run.lastHeartbeatSec
+    missingSec = run.runUntil(lambda: hex(QUIET_DEVICE) in run.alarm.missingMembers, expectedSec * 3)
+    run.simulator.resume(QUIET_DEVICE)
+    run.runFor(2)
+    return missingSec - lastSentSec if missingSec is not None else None
+
+
+def checkAlarmLength(run, expectedSec, wallClockStepSec=0):
+    run.request("ENABLE-ALARM")
+    run.runFor(3) #arming starts the member list over
+    triggeredSec = run.nowSec()
+    run.simulator.trigger(TRIGGER_DEVICE)
+    run.settle()
+    if (not run.alarm.alarmed):
+        return None
+    run.runFor(1)
+    run.simulator.clear(TRIGGER_DEVICE)
+    run.clock.jumpWallTime(wallClockStepSec)
+    stoppedSec = run.runUntil(lambda: not run.alarm.alarmed, expectedSec * 3)
+    run.request("DISABLE-ALARM")
+    run.runFor(2)
+    return stoppedSec - triggeredSec if stoppedSec is not None else None
+
+
+def report(name, tookSec, expectedSec, toleranceSec):
+    ok = tookSec is not None and abs(tookSec - expectedSec) <= toleranceSec
+    measured = f"{tookSec:8.2f}s" if tookSec is not None else f"{'never':>9}"
+    print(f"{'ok  ' if ok else 'FAIL'} {name:<44} {measured}  expected {expectedSec}s")
+    return ok
+
+
+def main():
+    with contextlib.redirect_stdout(io.StringIO()):
+        run = VirtualRun()
+        run.runFor(run.alarm.timeAllottedToBuildOutMembersSec + 2) #members, and the power plan that follows
+        absenceSec = run.alarm.deviceAbsenceThresholdSec
+        alarmSec = run.alarm.getCurrentProfileAlarmTime()
+        results = [("quiet device listed missing", checkMissing(run, absenceSec), absenceSec),
+            ("alarm length", checkAlarmLength(run, alarmSec), alarmSec)]
+        run.clock.jumpWallTime(WALL_CLOCK_STEP_SEC)
+        results.append((f"quiet device missing, wall clock +{WALL_CLOCK_STEP_SEC}s", checkMissing(run, absenceSec), absenceSec))
+        results.append((f"alarm length, wall clock -{WALL_CLOCK_STEP_SEC}s", checkAlarmLength(run, alarmSec, -WALL_CLOCK_STEP_SEC), alarmSec))
+        neverMissing = not run.alarm.missingMembers
+    #the alarm timeout is looked at every checkEveryMsec, not to the millisecond
+    toleranceSec = run.alarm.checkEveryMsec / 1000 + MIN_STEP_SEC
+    ok = all([report(name, tookSec, expectedSec, toleranceSec) for name, tookSec, expectedSec in results])
+    ok = report("no device missing after the checks", 0 if neverMissing else None, 0, 0) and ok
+    virtualSec = run.nowSec()
+    print(f"{virtualSec:.0f}s of virtual time in {run.realSec:.2f}s ({virtualSec / max(run.realSec, 1e-9):.0f}x)")
+    sys.stdout.flush()
+    os._exit(0 if ok else 1) #the engine's threads don't stop on their own
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+import struct
+import threading
+import time
+from bisect import bisect_right
+
+#Capture of the serial traffic of alarm.run: every frame received and sent, as the raw bytes on the wire (text frames
+#without their '\n'), with its time in nanoseconds since the capture started. The web requests that change state
+#(arm, disarm, profile...) go in too, as their json, so a replay arms when the house did. Append-only; a crash loses
+#at most the records since the last index entry. benchmarks/replay.py feeds one back into the engine.
+#
+#  file:  HEADER, then RECORD + frame bytes, ...
+#  index: {file}.idx, INDEX_ENTRY per second of capture - the time and file offset of the first record at or after it
+MAGIC = b"BOBIKCAP"
+VERSION = 1
+FLAG_BINARY_FRAMING = 0x01
+HEADER = struct.Struct("<8sBBq") #magic, version, flags, wall clock ns the capture started at
+RECORD = struct.Struct("<qBH") #ns since the capture started, direction, frame length
+INDEX_ENTRY = struct.Struct("<qq") #ns since the capture started, file offset
+RECEIVED = 0
+SENT = 1
+COMMAND = 2 #a web request without an answer, json
+INDEX_EVERY_NS = 1000000000
+
+
+class CaptureWriter:
+    #records come from the serial reader and the transmit thread, hence the lock. The path may hold strftime fields,
+    #so a restart starts a new capture rather than writing over the last one
+    def __init__(self, path, binaryFraming=False):
+        self.path = time.strftime(path)
+        self.file = open(self.path, "xb")
+        self.index = open(self.path + ".idx", "xb")
+        self.lock = threading.Lock()
+        self.startNs = time.monotonic_ns()
+        self.file.write(HEADER.pack(MAGIC, VERSION, FLAG_BINARY_FRAMING if binaryFraming else 0, time.time_ns()))
+        self.offset = HEADER.size
+        self.nextIndexNs = 0
+        self.records = 0
+
+    def recordReceived(self, frame, receivedTimeNs):
+        self.record(RECEIVED, frame, receivedTimeNs)
+
+    def recordSent(self, frame):
+        self.record(SENT, frame, time.monotonic_ns())
+
+    def recordCommand(self, commandJson):
+        self.record(COMMAND, commandJson.encode(), time.monotonic_ns())
+
+    def record(self, direction, frame, timeNs):
+        timeNs -= self.startNs
+        with self.lock:
+            if (self.file.closed):
+                return
+            if (timeNs >= self.nextIndexNs):
+                self.file.flush() #everything the index points before is on disk
+                self.index.write(INDEX_ENTRY.pack(timeNs, self.offset))
+                self.index.flush()
+                self.nextIndexNs = timeNs - timeNs % INDEX_EVERY_NS + INDEX_EVERY_NS
+            self.file.write(RECORD.pack(timeNs, direction, len(frame)))
+            self.file.write(frame)
+            self.offset += RECORD.size + len(frame)
+            self.records += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.index.close()
+
+
+class CaptureReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            magic, version, flags, self.startWallNs = HEADER.unpack(file.read(HEADER.size))
+        if (magic != MAGIC or version != VERSION):
+            raise ValueError(f"{path} is not a version {VERSION} capture")
+        self.binaryFraming = bool(flags & FLAG_BINARY_FRAMING)
+        self.indexTimes = []
+        self.indexOffsets = []
+        if (os.path.exists(path + ".idx")):
+            with open(path + ".idx", "rb") as index:
+                data = index.read()
+            for timeNs, offset in INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % INDEX_ENTRY.size]):
+                self.indexTimes.append(timeNs)
+                self.indexOffsets.append(offset)
+
+    def records(self, fromNs=0, toNs=None): #-> (ns since the capture started, direction, frame bytes), in order
+        position = bisect_right(self.indexTimes, fromNs) - 1
+        with open(self.path, "rb") as file:
+            file.seek(self.indexOffsets[position] if position >= 0 else HEADER.size)
+            while True:
+                header = file.read(RECORD.size)
+                if (len(header) < RECORD.size):
+                    return #the end, or a record cut short by a crash
+                timeNs, direction, length = RECORD.unpack(header)
+                frame = file.read(length)
+                if (len(frame) < length):
+                    return
+                if (toNs is not None and timeNs > toNs):
+                    return
+                if (timeNs >= fromNs):
+                    yield timeNs, direction, frame
+
+    def encodeForWire(self, frame): #a recorded frame as the arduino sent it
+        return frame if self.binaryFraming else frame + b"\n"
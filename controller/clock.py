@@ -0,0 +1,47 @@
+import time
+
+
+class SystemClock:
+    #The engine's time. Everything it times - member deadlines, alarm length, keepalives - is on the monotonic clock,
+    #so NTP stepping the wall clock can't make a device look missing or stretch an alarm. The wall clock is only for
+    #the times it shows and stores (events, lastSeen).
+
+    def monotonicNs(self):
+        return time.monotonic_ns()
+
+    def wallTime(self): #epoch seconds
+        return time.time()
+
+    def toRealSec(self, sec): #how long to really wait for sec of this clock
+        return sec
+
+
+class VirtualClock:
+    #Time the caller moves instead: by hand with advance()/setNs(), or running at speedup times real time. The wall
+    #clock moves with it from startWallTime, plus any jumpWallTime(). Waits are shortened to match; while it is moved by
+    #hand the engine loop polls every POLL_SEC, so an advance is acted on straight away.
+    POLL_SEC = .001
+
+    def __init__(self, speedup=None, startWallTime=None):
+        self.speedup = speedup
+        self.startWallTime = time.time() if startWallTime is None else startWallTime
+        self.realStartNs = time.monotonic_ns()
+        self.offsetNs = 0
+
+    def monotonicNs(self):
+        return self.offsetNs + (int((time.monotonic_ns() - self.realStartNs) * self.speedup) if self.speedup else 0)
+
+    def wallTime(self):
+        return self.startWallTime + self.monotonicNs() / 1e9
+
+    def toRealSec(self, sec):
+        return sec / self.speedup if self.speedup else min(sec, self.POLL_SEC)
+
+    def advance(self, sec):
+        self.offsetNs += int(sec * 1e9)
+
+    def setNs(self, ns): #to ns, if that is later - a monotonic clock doesn't go back
+        self.offsetNs += max(0, ns - self.monotonicNs())
+
+    def jumpWallTime(self, sec): #the wall clock alone, as an NTP step would
+        self.startWallTime += sec
@@ -0,0 +1,49 @@
+#Serial framing between this unit and the home base's arduino (controller.ino), as [sender, receiver, message, deviceType].
+#
+#text framing (default):
+#   {sender hex}-{receiver hex}-{message hex}-{devicetype hex}\n
+#   the arduino prints upper case hex without leading zeros (0xAA, 0x5); this unit sends lower case with a trailing '-'
+#binary framing (BINARY_FRAMING in controller.ino and useBinaryFraming in alarm.py, switched together):
+#   0xA5 {sender} {receiver} {message} {devicetype} {checksum}, checksum = xor of the 5 preceding bytes
+
+BINARY_FRAME_SYNC = 0xA5
+BINARY_FRAME_LENGTH = 6
+
+HEX_IDS = tuple(hex(i) for i in range(256)) #int -> '0xcc', the form device ids are keyed by in alarm.py
+HEX_IDS_VALUES = {hexId: i for i, hexId in enumerate(HEX_IDS)} #'0xcc' -> int
+HEX_TOKENS = tuple(hex(i).encode('ascii') for i in range(256)) #int -> b'0xcc'
+
+#every spelling of a byte that int(token, 16) accepts and that the arduinos produce -> int
+TOKEN_VALUES = {}
+for value in range(256):
+    for digits in {"%x" % value, "%X" % value, "%02x" % value, "%02X" % value}:
+        for prefix in ("0x", "0X", ""):
+            TOKEN_VALUES[(prefix + digits).encode('ascii')] = value
+del value, digits, prefix
+
+
+def decodeTextFrame(frame): #bytes of one line, without the '\n' -> [sender, receiver, message, deviceType]
+    tokens = frame.split(b'-')
+    if (len(tokens) != 4 and (len(tokens) != 5 or tokens[4].strip())):
+        raise ValueError(f"expected 4 fields in frame {frame}")
+    try:
+        return [TOKEN_VALUES[tokens[0]], TOKEN_VALUES[tokens[1]], TOKEN_VALUES[tokens[2]], TOKEN_VALUES[tokens[3].strip()]]
+    except KeyError as error:
+        raise ValueError(f"bad hex byte {error} in frame {frame}")
+
+
+def encodeTextFrame(message): #[sender, receiver, message, deviceType] -> b'0x14-0x0-0xcc-0x1-\n'
+    return b"-".join((HEX_TOKENS[message[0]], HEX_TOKENS[message[1]], HEX_TOKENS[message[2]], HEX_TOKENS[message[3]], b"\n"))
+
+
+def decodeBinaryFrame(frame): #BINARY_FRAME_LENGTH bytes starting with BINARY_FRAME_SYNC -> [sender, receiver, message, deviceType]
+    if (len(frame) != BINARY_FRAME_LENGTH or frame[0] != BINARY_FRAME_SYNC):
+        raise ValueError(f"not a binary frame {frame}")
+    if (frame[0] ^ frame[1] ^ frame[2] ^ frame[3] ^ frame[4] != frame[5]):
+        raise ValueError(f"bad checksum in frame {frame}")
+    return [frame[1], frame[2], frame[3], frame[4]]
+
+
+def encodeBinaryFrame(message): #[sender, receiver, message, deviceType] -> 6 bytes
+    return bytes((BINARY_FRAME_SYNC, message[0], message[1], message[2], message[3],
+        BINARY_FRAME_SYNC ^ message[0] ^ message[1] ^ message[2] ^ message[3]))
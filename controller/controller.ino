@@ -8,6 +8,9 @@ int DISARMED_LED_PIN = 2; //red led
 int ARM_BUTTON_PIN = 9;
 int HOME_BASE_CAN_ID = 0x14;
 int OUTPUT_TO_OLED_EVERY_X_LOOPS = 10;
+const bool BINARY_FRAMING = false; //compact 6 byte frames over serial instead of hex text. Must match useBinaryFraming in alarm.py
+const byte BINARY_FRAME_SYNC = 0xA5;
+const int BINARY_FRAME_LENGTH = 6; //sync, id, addressee, message, deviceType, xor checksum
 String ERROR_NAMES[] = {"OK", "FAIL", "ALLTXBUSY", "FAILINIT", "FAILTX", "NOMSG"};
 /* /CONSTANTS */
 
@@ -28,6 +31,7 @@ MessageStruct parsedIncomingComMessage;
 
 /* VARIABLES */
 String incomingComMessage;
+byte incomingBinaryFrame[BINARY_FRAME_LENGTH];
 int index; //used for message number in testing
 int previousArmButtonState = HIGH;
 int loopIndex = 0;
@@ -127,9 +131,7 @@ void setLedPin(bool value, int pin) { //true for on, false for off
 void loop() {
   //retrieve incoming frames from COM, and send via CAN
   Serial.flush();
-  incomingComMessage = Serial.readStringUntil('\n');
-  if (incomingComMessage.length() > 0) {
-    parsedIncomingComMessage = parseincomingComMessage(incomingComMessage);
+  if (readComMessage(&parsedIncomingComMessage)) {
     processIncomingCanMessage(parsedIncomingComMessage);
     if (parsedIncomingComMessage.addressee != 0xFF) //has to be addressed to not the home base's arduino
       sendMessage(parsedIncomingComMessage.id, parsedIncomingComMessage.addressee, parsedIncomingComMessage.message, parsedIncomingComMessage.deviceType);
@@ -141,16 +143,7 @@ void loop() {
   { // button pressed - send serial armed toggle button press message to raspi
     if (currentArmedButtonState == LOW) {
       previousArmButtonState = LOW;
-      Serial.print("0x");
-      Serial.print(HOME_BASE_CAN_ID, HEX);
-      Serial.print("-0x");
-      Serial.print(HOME_BASE_CAN_ID, HEX);
-      Serial.print("-0x");
-      Serial.print(0xEE, HEX);
-      Serial.print("-0x");
-      Serial.print(0x01, HEX);
-      Serial.print("\n");
-      Serial.flush();
+      writeComMessage(HOME_BASE_CAN_ID, HOME_BASE_CAN_ID, 0xEE, 0x01);
     } else {
       previousArmButtonState = HIGH;
     }
@@ -159,16 +152,7 @@ void loop() {
   canMessageError = mcp2515.readMessage(&incomingCanMessage);
   if (canMessageError == MCP2515::ERROR_OK) {
     //retrieve from CAN frame(s), and send to COM via Serial
-    Serial.print("0x");
-    Serial.print(incomingCanMessage.can_id, HEX);
-    Serial.print("-0x");
-    Serial.print(incomingCanMessage.data[0], HEX);
-    Serial.print("-0x");
-    Serial.print(incomingCanMessage.data[1], HEX);
-    Serial.print("-0x");
-    Serial.print(incomingCanMessage.data[2], HEX);
-    Serial.print("\n");
-    Serial.flush();
+    writeComMessage(incomingCanMessage.can_id, incomingCanMessage.data[0], incomingCanMessage.data[1], incomingCanMessage.data[2]);
 
     //use this structure to access data: incomingCanMessage.data[1]==0xAA
     //maybe delay too??? delay(DELAY_LOOP_TIME);
@@ -200,6 +184,46 @@ void loop() {
 //    Serial.println(" ");
 //}
 
+//COM (serial to raspi) FRAMING
+bool readComMessage(MessageStruct *message) {
+  if (!BINARY_FRAMING) {
+    incomingComMessage = Serial.readStringUntil('\n');
+    if (incomingComMessage.length() == 0) return false;
+    *message = parseincomingComMessage(incomingComMessage);
+    return true;
+  }
+
+  //binary: skip anything that isn't a sync byte, then wait for a whole frame
+  while (Serial.available() > 0 && Serial.peek() != BINARY_FRAME_SYNC) Serial.read();
+  if (Serial.available() < BINARY_FRAME_LENGTH) return false;
+  Serial.readBytes(incomingBinaryFrame, BINARY_FRAME_LENGTH);
+  if ((incomingBinaryFrame[0] ^ incomingBinaryFrame[1] ^ incomingBinaryFrame[2] ^ incomingBinaryFrame[3] ^ incomingBinaryFrame[4]) != incomingBinaryFrame[5]) return false;
+  message->id = incomingBinaryFrame[1];
+  message->addressee = incomingBinaryFrame[2];
+  message->message = incomingBinaryFrame[3];
+  message->deviceType = incomingBinaryFrame[4];
+  return true;
+}
+
+void writeComMessage(int id, int addressee, int message, int deviceType) {
+  if (BINARY_FRAMING) {
+    byte frame[BINARY_FRAME_LENGTH] = {BINARY_FRAME_SYNC, (byte)id, (byte)addressee, (byte)message, (byte)deviceType, 0};
+    frame[5] = frame[0] ^ frame[1] ^ frame[2] ^ frame[3] ^ frame[4];
+    Serial.write(frame, BINARY_FRAME_LENGTH);
+  } else {
+    Serial.print("0x");
+    Serial.print(id, HEX);
+    Serial.print("-0x");
+    Serial.print(addressee, HEX);
+    Serial.print("-0x");
+    Serial.print(message, HEX);
+    Serial.print("-0x");
+    Serial.print(deviceType, HEX);
+    Serial.print("\n");
+  }
+  Serial.flush();
+}
+
 //COMMON
 MessageStruct parseincomingComMessage(String message) {
   MessageStruct messageStruct;
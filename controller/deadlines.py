@@ -0,0 +1,44 @@
+import heapq
+
+
+class DeadlineScheduler:
+    #Per-key expiry deadlines - here, the time each member device counts as missing unless it is heard from again.
+    #Heartbeats only move a key's deadline later, so set() for a key that is already scheduled just records the new
+    #deadline. The heap keeps its old entry, which is pushed again with the current deadline when it reaches the top.
+    #A busy device costs a dict write per frame; pushes and pops are O(log n) in the number of keys.
+
+    def __init__(self):
+        self.deadlines = {} #key -> current deadline
+        self.heap = [] #(deadline, key), at least one entry per scheduled key, possibly stale (earlier than deadlines[key])
+
+    def set(self, key, deadline):
+        current = self.deadlines.get(key)
+        self.deadlines[key] = deadline
+        if (current is None or deadline < current):
+            heapq.heappush(self.heap, (deadline, key))
+
+    def remove(self, key):
+        self.deadlines.pop(key, None) #its heap entry is dropped when it reaches the top
+
+    def clear(self):
+        self.deadlines = {}
+        self.heap = []
+
+    def nextDeadline(self): #earliest time popExpired() could return something, None if nothing is scheduled
+        while (self.heap and self.deadlines.get(self.heap[0][1]) is None):
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def popExpired(self, now): #keys whose deadline is <= now; they are unscheduled until set() again
+        expired = []
+        while (self.heap and self.heap[0][0] <= now):
+            deadline, key = heapq.heappop(self.heap)
+            current = self.deadlines.get(key)
+            if (current is None or current < deadline): #removed, or a duplicate entry left by an earlier deadline
+                continue
+            if (current > now):
+                heapq.heappush(self.heap, (current, key))
+                continue
+            del self.deadlines[key]
+            expired.append(key)
+        return expired
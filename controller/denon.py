@@ -0,0 +1,114 @@
+import http.client
+import time
+import xml.etree.ElementTree as ElementTree
+from threading import Lock
+from urllib.parse import urlencode
+
+STATUS_PATH = "/goform/formMainZone_MainZoneXml.xml"
+COMMAND_PATH = "/MainZone/index.put.asp"
+VOLUME_OFFSET = 81 #the AVR reports/takes dB (-81..+18); volumes here are on the 0..99 scale of its front panel
+
+
+class DenonClient:
+    #Talks to the Denon AVR's web interface (the same endpoints its MainZone web page uses) over keep-alive HTTP
+    #connections that are reused across requests, instead of a curl/wget process and a new TCP connection per call.
+    #Status is always read from the AVR: what the alarm restores afterwards, and whether it is ready to play, both
+    #depend on what it is doing now - someone may have just turned the volume knob.
+
+    def __init__(self, host, port=80, timeoutSec=.5, maxIdleConnections=2):
+        self.host = host
+        self.port = port
+        self.timeoutSec = timeoutSec
+        self.maxIdleConnections = maxIdleConnections
+        self.idleConnections = []
+        self.lock = Lock() #guards idleConnections
+        self.requestCount = 0
+        self.connectCount = 0
+
+    def request(self, method, path, body=None, headers={}):
+        #one request on a pooled connection; a connection the AVR has closed in the meantime is replaced once
+        for attempt in range(2):
+            connection = self.takeConnection()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                if (attempt == 1):
+                    raise
+                continue
+            self.requestCount += 1
+            if (response.will_close):
+                connection.close()
+            else:
+                self.returnConnection(connection)
+            if (response.status != 200):
+                raise http.client.HTTPException(f"denon {method} {path} returned {response.status}")
+            return data
+
+    def takeConnection(self):
+        with self.lock:
+            if (self.idleConnections):
+                return self.idleConnections.pop()
+        self.connectCount += 1
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeoutSec)
+
+    def returnConnection(self, connection):
+        with self.lock:
+            if (len(self.idleConnections) < self.maxIdleConnections):
+                self.idleConnections.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            connections = self.idleConnections
+            self.idleConnections = []
+        for connection in connections:
+            connection.close()
+
+    def getState(self): #{"power": "ON"/"STANDBY", "input": "SAT/CBL", "volume": 0..99}; None if the AVR can't be reached
+        try:
+            return parseStatusXml(self.request("GET", STATUS_PATH))
+        except (http.client.HTTPException, OSError, ElementTree.ParseError) as e:
+            print(f">>>>DENON STATUS FAILED {e}")
+            return None
+
+    def sendCommands(self, *commands): #e.g. "PutMasterVolumeSet/-26" - sent together as cmd0, cmd1, ...
+        body = urlencode({"cmd" + str(index): command for index, command in enumerate(commands)})
+        self.request("POST", COMMAND_PATH, body, {"Content-Type": "application/x-www-form-urlencoded"})
+
+    def powerOn(self, input):
+        self.sendCommands("PutSystem_OnStandby/ON", "aspMainZone_WebUpdateStatus/", "PutZone_InputFunction/" + input)
+
+    def powerOff(self):
+        self.sendCommands("PutSystem_OnStandby/STANDBY", "aspMainZone_WebUpdateStatus/")
+
+    def setInput(self, input):
+        self.sendCommands("PutZone_InputFunction/" + input)
+
+    def setVolume(self, volume):
+        self.sendCommands("PutMasterVolumeSet/" + str(int(volume) - VOLUME_OFFSET))
+
+    def waitUntilReady(self, input, timeoutSec=10, pollEverySec=.25):
+        #polls until the AVR reports power on with the given input; returns whether it got there within timeoutSec
+        deadline = time.monotonic() + timeoutSec
+        while True:
+            state = self.getState()
+            if (state and state["power"] == "ON" and state["input"] == input):
+                return True
+            if (time.monotonic() + pollEverySec > deadline):
+                return False
+            time.sleep(pollEverySec)
+
+
+def parseStatusXml(data): #formMainZone_MainZoneXml.xml -> {"power", "input", "volume"}
+    #the xml declaration line is dropped as the old scripts did (grep -v xml) - the AVR's isn't always well formed
+    item = ElementTree.fromstring(b"\n".join(line for line in data.splitlines() if b"<?xml" not in line))
+    volume = item.findtext("MasterVolume/value", "--").strip()
+    return {
+        "power": item.findtext("Power/value", "").strip(),
+        "input": item.findtext("InputFuncSelectMain/value", "").strip(),
+        "volume": 0 if volume == "--" else int(float(volume) + VOLUME_OFFSET) #"--" is all the way down
+    }
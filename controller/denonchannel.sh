@@ -1,4 +0,0 @@
-#!/bin/bash
-
-wget -O /dev/null denonoffice.lan/MainZone/index.put.asp?cmd0=PutZone_InputFunction%2F$1
-
@@ -0,0 +1,225 @@
+import json
+import os
+import socket
+import threading
+import time
+from queue import Queue
+
+import rpc
+from statusmemory import StatusSegment
+
+# The alarm engine as a process of its own, so the web server's json, TLS and socket.io work for a burst of clients
+# can't take the GIL from CAN frame handling. This process owns the serial port and runs alarm.run on its main thread:
+#   python3 engineprocess.py
+# and the web server (server.py or asyncserver.py with separateEngineProcess = True) talks to it with an EngineLink:
+# - status: the engine writes every new status (and its delta) to a StatusSegment, a file in /dev/shm the web process
+#   reads without a lock, then sends {"statusVersion": n} down the socket so the web side knows to read it
+# - commands: the web process's queue messages go down a unix socket as json lines, {"request", "uuid", ...} as they
+#   would be put on the engine queue, plus "wantsReply" for rpc calls; the answers come back as {"uuid", "response"}
+
+engineSocketPath = "/tmp/bobik-engine.sock"
+statusSegmentPath = "/dev/shm/bobik-status"
+
+
+class EngineConnection:
+    #a web process connected to the engine. Everything it is sent goes through a queue and a thread of its own, so a
+    #web process that stops reading can't hold up the engine thread
+    def __init__(self, connection):
+        self.connection = connection
+        self.outgoing = Queue()
+        self.closed = False
+        threading.Thread(target=self.writerThreadMain, daemon=True).start()
+
+    def send(self, message):
+        if (not self.closed):
+            self.outgoing.put(message)
+
+    def writerThreadMain(self):
+        while True:
+            message = self.outgoing.get()
+            try:
+                self.connection.sendall((json.dumps(message) + "\n").encode())
+            except OSError:
+                self.close()
+                return
+
+    def close(self):
+        self.closed = True
+        try:
+            self.connection.close()
+        except OSError:
+            pass
+
+
+class SocketCall:
+    #the "call" of a request that came over the socket, as rpc.RpcCall is for one from the same process
+    def __init__(self, engineConnection, uuid):
+        self.engineConnection = engineConnection
+        self.uuid = uuid
+
+    def respond(self, response):
+        self.engineConnection.send({"uuid": self.uuid, "response": response})
+
+    def cancelled(self): #the web process keeps its own timeouts; all the engine can tell is that it went away
+        return self.engineConnection.closed
+
+
+class EngineHost:
+    #the engine side: takes commands on engineSocketPath and puts them on the engine queue, and publishes status
+    def __init__(self, engineQueue, getMetricsText, socketPath=engineSocketPath, segmentPath=statusSegmentPath):
+        self.engineQueue = engineQueue
+        self.getMetricsText = getMetricsText
+        self.segment = StatusSegment(segmentPath, create=True)
+        self.connections = []
+        self.connectionsLock = threading.Lock()
+        if (os.path.exists(socketPath)):
+            os.unlink(socketPath)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(socketPath)
+        self.server.listen()
+        threading.Thread(target=self.acceptThreadMain, daemon=True).start()
+
+    def publishStatus(self, version, status, delta): #an alarm status listener, on the engine thread
+        if (self.segment.write(version, status, delta)):
+            with self.connectionsLock:
+                for engineConnection in self.connections:
+                    engineConnection.send({"statusVersion": version})
+
+    def acceptThreadMain(self):
+        while True:
+            connection, address = self.server.accept()
+            engineConnection = EngineConnection(connection)
+            with self.connectionsLock:
+                self.connections.append(engineConnection)
+            threading.Thread(target=self.readerThreadMain, args=(engineConnection, ), daemon=True).start()
+            print("Web process connected to the engine")
+
+    def readerThreadMain(self, engineConnection):
+        try:
+            for line in engineConnection.connection.makefile("r"):
+                message = json.loads(line)
+                if (message.pop("wantsReply", False)):
+                    message["call"] = SocketCall(engineConnection, message["uuid"])
+                if (message["request"] == rpc.GET_METRICS.request): #right here, so a stalled engine loop still shows up in them
+                    message["call"].respond({"response": self.getMetricsText()})
+                    continue
+                self.engineQueue.put(message)
+        except (OSError, ValueError) as e:
+            print(f">>>>ENGINE SOCKET ERROR {e}")
+        engineConnection.close()
+        with self.connectionsLock:
+            self.connections.remove(engineConnection)
+        print("Web process disconnected from the engine")
+
+
+class EngineLink:
+    #The web side: stands in for the engine thread of the in-process setup. It takes the web server's engine queue and
+    #sends what is put on it to the engine process, resolves the rpc bridge's calls with the answers, and calls
+    #onStatus(version, status, delta) - the server's publishStatus - for every status the engine publishes. Status
+    #requests are answered here from the shared status, without going to the engine at all. Reconnects if the engine
+    #process restarts.
+
+    def __init__(self, requestQueue, rpcBridge, onStatus, socketPath=engineSocketPath, segmentPath=statusSegmentPath, reconnectSec=1):
+        self.requestQueue = requestQueue
+        self.rpcBridge = rpcBridge
+        self.onStatus = onStatus
+        self.socketPath = socketPath
+        self.segmentPath = segmentPath
+        self.reconnectSec = reconnectSec
+        self.segment = None
+        self.publishedVersion = None #notifications can come in faster than we read: one read may already be a later one's version
+        self.connection = None
+        self.connected = threading.Event()
+        self.statusAnsweredLocally = 0
+        self.requestsForwarded = 0
+
+    def start(self):
+        threading.Thread(target=self.readerThreadMain, daemon=True).start()
+        threading.Thread(target=self.forwarderThreadMain, daemon=True).start()
+        return self
+
+    def readerThreadMain(self):
+        while True:
+            try:
+                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                connection.connect(self.socketPath)
+                self.segment = StatusSegment(self.segmentPath)
+            except OSError as e:
+                connection.close()
+                print(f">>>>CAN'T CONNECT TO THE ENGINE AT {self.socketPath}: {e}")
+                time.sleep(self.reconnectSec)
+                continue
+            print("Connected to the engine process")
+            self.connection = connection
+            self.connected.set()
+            self.publishedVersion = None #it may be another engine process, its versions unrelated to the last one's
+            self.publishLatestStatus(full=True) #may have changed while we weren't connected: no delta, clients replace what they hold
+            try:
+                for line in connection.makefile("r"):
+                    message = json.loads(line)
+                    if ("statusVersion" in message):
+                        self.publishLatestStatus()
+                    else:
+                        self.rpcBridge.resolve(message["uuid"], message["response"])
+            except (OSError, ValueError) as e:
+                print(f">>>>ENGINE SOCKET ERROR {e}")
+            self.connected.clear()
+            connection.close()
+            print("Lost the engine process, reconnecting")
+            time.sleep(self.reconnectSec)
+
+    def publishLatestStatus(self, full=False):
+        version, status, delta = self.segment.read()
+        if (version >= 0 and version != self.publishedVersion):
+            self.publishedVersion = version
+            self.onStatus(version, status, None if full else delta)
+
+    def forwarderThreadMain(self):
+        while True:
+            message = self.requestQueue.get()
+            call = message.pop("call", None)
+            if (call and call.cancelled()):
+                continue
+            if (call and message["request"] == rpc.ALARM_STATUS.request and self.answerStatus(message, call)):
+                continue
+            self.connected.wait()
+            try:
+                self.connection.sendall((json.dumps({**message, "wantsReply": call is not None}) + "\n").encode())
+                self.requestsForwarded += 1
+            except OSError as e:
+                print(f">>>>COULDN'T SEND {message['request']} TO THE ENGINE: {e}") #an rpc call times out as it would with a stuck engine
+
+    def answerStatus(self, message, call):
+        #the engine's own answer from the shared status: the delta if the client is one version behind, else the full
+        #status. False if there is nothing shared yet
+        if (self.segment is None):
+            return False
+        version, status, delta = self.segment.read()
+        if (version < 0):
+            return False
+        isDelta = delta is not None and message.get("sinceVersion") == version - 1
+        call.respond({"response": delta if isDelta else status, "isDelta": isDelta})
+        self.statusAnsweredLocally += 1
+        return True
+
+    def getCounters(self):
+        return {
+            "connected": self.connected.is_set(),
+            "statusAnsweredLocally": self.statusAnsweredLocally,
+            "requestsForwarded": self.requestsForwarded,
+            "statusReadRetries": self.segment.retries if self.segment else 0
+        }
+
+
+def main():
+    import alarm
+
+    print("Engine process started.")
+    engineQueue = Queue()
+    host = EngineHost(engineQueue, alarm.getMetricsText)
+    alarm.addStatusListener(host.publishStatus)
+    alarm.run(engineQueue)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import json
+import sqlite3
+import time
+from queue import Queue, Empty
+from threading import Thread, Lock, Event
+
+
+class EventStore:
+    #Past events in a WAL-mode SQLite database. add() only hands the event to a background writer thread, which inserts
+    #whatever has queued up in one transaction, so the caller (the CAN loop) never waits on the disk. Events that are
+    #queued but not written yet are still returned by getEvents().
+    #
+    #Every event is also indexed by its type (event["event"]), its device ids (event["devices"]) and its timestamp, for
+    #search() - so finding all TRIGGERED-ALARMs of one sensor in a month doesn't scan the whole history.
+    #
+    #Retention: events older than maxAgeSec and all but the newest maxEvents are deleted by the writer thread, at most
+    #sweepChunk rows at a time, so a large backlog is worked off over several sweeps instead of one long transaction.
+
+    def __init__(self, path, maxAgeSec=None, maxEvents=None, batchSize=500, sweepEverySec=60, sweepChunk=1000):
+        self.path = path
+        self.maxAgeSec = maxAgeSec
+        self.maxEvents = maxEvents
+        self.batchSize = batchSize
+        self.sweepEverySec = sweepEverySec
+        self.sweepChunk = sweepChunk
+        self.queue = Queue()
+        self.lock = Lock() #guards pending, nextSeq and clearedSeq
+        self.pending = {} #seq -> (timestamp, type, devices, event json) added but not committed yet
+        self.readLock = Lock()
+        self.readConnection = self.connect(check_same_thread=False)
+        self.createSchema(self.readConnection)
+        self.nextSeq = self.getHighestSeq(self.readConnection) + 1
+        self.clearedSeq = self.getMeta(self.readConnection, "clearedSeq") #the highest seq when the events were last cleared
+        self.eventsWritten = 0
+        self.eventsSwept = 0
+        self.writerThread = Thread(target=self.writerThreadMain, daemon=True)
+        self.writerThread.start()
+
+    def connect(self, **kwargs):
+        connection = sqlite3.connect(self.path, **kwargs)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA foreign_keys=ON") #event_devices rows go with their event
+        connection.execute("PRAGMA synchronous=NORMAL") #durable across crashes of this process, only a power cut can lose the last commits
+        return connection
+
+    def createSchema(self, connection):
+        connection.execute("CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY, timestamp REAL NOT NULL, type TEXT, event TEXT NOT NULL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS event_devices (seq INTEGER NOT NULL REFERENCES events (seq) ON DELETE CASCADE, device TEXT NOT NULL, timestamp REAL NOT NULL, PRIMARY KEY (seq, device))")
+        if ("type" not in [column[1] for column in connection.execute("PRAGMA table_info(events)")]):
+            self.migrateUnindexedEvents(connection)
+        connection.execute("CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp)")
+        connection.execute("CREATE INDEX IF NOT EXISTS events_type ON events (type, timestamp)")
+        connection.execute("CREATE INDEX IF NOT EXISTS event_devices_device ON event_devices (device, timestamp)")
+        #the highest seq ever handed out, kept through clear() and the sweeps so a restart doesn't hand it out again
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        connection.commit()
+
+    def getHighestSeq(self, connection):
+        return max(self.getMeta(connection, "highestSeq"), connection.execute("SELECT MAX(seq) FROM events").fetchone()[0] or 0)
+
+    def getMeta(self, connection, key):
+        row = connection.execute("SELECT value FROM meta WHERE key = ?", (key, )).fetchone()
+        return row[0] if row else 0
+
+    def setMeta(self, connection, key, value): #never lowers it
+        connection.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)", (key, value))
+
+    def migrateUnindexedEvents(self, connection): #databases written before events had type/devices: fill them in from the stored json
+        connection.execute("ALTER TABLE events ADD COLUMN type TEXT")
+        for seq, timestamp, eventJson in connection.execute("SELECT seq, timestamp, event FROM events").fetchall():
+            event = json.loads(eventJson)
+            connection.execute("UPDATE events SET type = ? WHERE seq = ?", (getEventType(event), seq))
+            connection.executemany("INSERT OR IGNORE INTO event_devices (seq, device, timestamp) VALUES (?, ?, ?)",
+                [(seq, device, timestamp) for device in getEventDevices(event)])
+
+    def add(self, event, timestamp=None):
+        #event gets a "seq" - the cursor for getEventsPage. Increasing, and not handed out again after a clear() or a
+        #restart: the highest one is kept in the meta table with each batch written. Only seqs of events lost before
+        #they reached the disk (a power cut) can come round again
+        if (timestamp is None):
+            timestamp = event.get("timestamp", time.time())
+        with self.lock:
+            seq = self.nextSeq
+            self.nextSeq += 1
+            event["seq"] = seq
+            self.pending[seq] = (timestamp, getEventType(event), getEventDevices(event), json.dumps(event))
+        self.queue.put(seq)
+        return seq
+
+    def clear(self):
+        with self.lock:
+            self.pending = {}
+            self.clearedSeq = self.nextSeq - 1
+        self.queue.put(("CLEAR", self.clearedSeq))
+
+    def flush(self, timeoutSec=None): #waits until everything added so far is on disk
+        done = Event()
+        self.queue.put(done)
+        return done.wait(timeoutSec)
+
+    def close(self):
+        self.flush(5)
+        self.queue.put("STOP")
+        self.writerThread.join(5)
+
+    def getEventsJson(self, since=0, before=None, limit=None, fromOldest=False):
+        #event json strings with since < seq < before, the newest limit of them (the oldest with fromOldest), oldest first
+        return [eventJson for seq, eventJson in self.getEventRows(since, before, limit, fromOldest)]
+
+    def getEventRows(self, since=0, before=None, limit=None, fromOldest=False): #(seq, event json) - see getEventsJson
+        with self.lock:
+            pending = [(seq, eventJson) for seq, (timestamp, eventType, devices, eventJson) in self.pending.items() if seq > since and (before is None or seq < before)]
+        query = ("SELECT seq, event FROM events WHERE seq > ?" + (" AND seq < ?" if before is not None else "")
+            + (" ORDER BY seq" if fromOldest else " ORDER BY seq DESC") + (" LIMIT ?" if limit else ""))
+        parameters = [since] + ([before] if before is not None else []) + ([limit] if limit else [])
+        with self.readLock:
+            rows = self.readConnection.execute(query, parameters).fetchall()
+        #a pending event may have been committed between the two reads - keep one copy
+        events = dict(rows)
+        events.update(pending)
+        seqs = sorted(events, reverse=not fromOldest)
+        seqs = seqs[:limit] if limit else seqs
+        return [(seq, events[seq]) for seq in sorted(seqs)]
+
+    def getEvents(self, since=0, before=None, limit=None): #decoded - the newest limit of them, oldest first, read with LIMIT
+        return [json.loads(eventJson) for eventJson in self.getEventsJson(since, before, limit)]
+
+    def getEventsPage(self, since=None, before=None, limit=200):
+        #a page of events for a client, limit at most: the oldest ones newer than since (catching up on new events, more
+        #set if there are further ones to fetch), or the newest ones older than before (scrolling back), or the newest
+        #ones. latestSeq is the newest seq in the page - what a client catching up asks for events since next time.
+        #If the client's events were cleared (since is at or before the last clear()), or since is ahead of the store
+        #(another db), the newest page is returned with reset set.
+        with self.lock:
+            storeLatestSeq = self.nextSeq - 1
+            clearedSeq = self.clearedSeq
+            oldestPendingSeq = min(self.pending) if self.pending else None
+        with self.readLock:
+            oldestSeq = self.readConnection.execute("SELECT MIN(seq) FROM events").fetchone()[0] or oldestPendingSeq
+        reset = since is not None and (since > storeLatestSeq or 0 < since <= clearedSeq)
+        catchingUp = since is not None and not reset and before is None
+        rows = self.getEventRows(since if catchingUp else 0, before, limit, fromOldest=catchingUp)
+        if (rows):
+            latestSeq = rows[-1][0]
+        else:
+            latestSeq = since if catchingUp else (None if before is not None else storeLatestSeq)
+        return {
+            "eventsJson": [eventJson for seq, eventJson in rows],
+            "latestSeq": latestSeq,
+            "oldestSeq": oldestSeq,
+            "reset": reset,
+            "more": catchingUp and latestSeq < storeLatestSeq
+        }
+
+    def search(self, device=None, eventType=None, start=None, end=None, before=None, limit=200):
+        #events matching all the given filters (device id like "0x50", event type, timestamp range start <= t < end),
+        #the newest limit of them older than seq before, oldest first - same paging as getEventsPage
+        if (device is not None):
+            query = "SELECT events.seq, events.event FROM event_devices JOIN events ON events.seq = event_devices.seq WHERE event_devices.device = ?"
+            parameters = [device]
+            timestampColumn = "event_devices.timestamp"
+        else:
+            query = "SELECT events.seq, events.event FROM events WHERE 1"
+            parameters = []
+            timestampColumn = "events.timestamp"
+        if (eventType is not None):
+            query += " AND events.type = ?"
+            parameters.append(eventType)
+        if (start is not None):
+            query += " AND " + timestampColumn + " >= ?"
+            parameters.append(start)
+        if (end is not None):
+            query += " AND " + timestampColumn + " < ?"
+            parameters.append(end)
+        if (before is not None):
+            query += " AND events.seq < ?"
+            parameters.append(before)
+        query += " ORDER BY events.seq DESC LIMIT ?"
+        parameters.append(limit)
+
+        with self.lock:
+            pending = [(seq, eventJson) for seq, (timestamp, pendingType, devices, eventJson) in self.pending.items()
+                if (device is None or device in devices) and (eventType is None or pendingType == eventType)
+                and (start is None or timestamp >= start) and (end is None or timestamp < end) and (before is None or seq < before)]
+        with self.readLock:
+            rows = self.readConnection.execute(query, parameters).fetchall()
+        events = dict(rows)
+        events.update(pending)
+        seqs = sorted(events, reverse=True)[:limit]
+        return {
+            "eventsJson": [events[seq] for seq in reversed(seqs)],
+            "oldestSeq": seqs[-1] if seqs else None,
+            "more": len(seqs) == limit #probably more matches before oldestSeq
+        }
+
+    def getCounters(self):
+        return {"eventsQueued": self.queue.qsize(), "eventsWritten": self.eventsWritten, "eventsSwept": self.eventsSwept}
+
+    def writerThreadMain(self):
+        connection = self.connect()
+        nextSweep = time.monotonic()
+        while True:
+            try:
+                items = [self.queue.get(timeout=max(0, nextSweep - time.monotonic()))]
+            except Empty:
+                items = []
+            while (items and len(items) < self.batchSize):
+                try:
+                    items.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            batch = []
+            for item in items:
+                if (isinstance(item, int)):
+                    batch.append(item)
+                    continue
+                self.writeBatch(connection, batch) #keep the order of writes relative to clear/flush/stop
+                batch = []
+                if (isinstance(item, tuple) and item[0] == "CLEAR"):
+                    connection.execute("DELETE FROM event_devices")
+                    connection.execute("DELETE FROM events")
+                    self.setMeta(connection, "clearedSeq", item[1])
+                    connection.commit()
+                elif (item == "STOP"):
+                    connection.close()
+                    return
+                else:
+                    item.set()
+            self.writeBatch(connection, batch)
+
+            if (time.monotonic() >= nextSweep):
+                sweptFullChunk = self.sweep(connection)
+                nextSweep = time.monotonic() + (1 if sweptFullChunk else self.sweepEverySec)
+
+    def writeBatch(self, connection, batch):
+        if (not batch):
+            return
+        with self.lock:
+            rows = [(seq,) + self.pending[seq] for seq in batch if seq in self.pending] #cleared ones are gone from pending
+        connection.executemany("INSERT INTO events (seq, timestamp, type, event) VALUES (?, ?, ?, ?)",
+            [(seq, timestamp, eventType, eventJson) for seq, timestamp, eventType, devices, eventJson in rows])
+        connection.executemany("INSERT OR IGNORE INTO event_devices (seq, device, timestamp) VALUES (?, ?, ?)",
+            [(seq, device, timestamp) for seq, timestamp, eventType, devices, eventJson in rows for device in devices])
+        self.setMeta(connection, "highestSeq", max(batch)) #every seq in the batch, also those of events cleared before they were written
+        connection.commit()
+        with self.lock:
+            for seq in batch:
+                self.pending.pop(seq, None)
+        self.eventsWritten += len(rows)
+
+    def sweep(self, connection): #returns True if there is probably more to delete
+        deleted = 0
+        if (self.maxAgeSec):
+            deleted += connection.execute("DELETE FROM events WHERE seq IN (SELECT seq FROM events WHERE timestamp < ? ORDER BY seq LIMIT ?)",
+                (time.time() - self.maxAgeSec, self.sweepChunk)).rowcount
+        if (self.maxEvents):
+            #seqs can have gaps (the age sweep above goes by timestamp, and an event can be added with an older one than
+            #its neighbours), so "all but the newest maxEvents" is everything up to the (maxEvents + 1)th newest seq
+            deleted += connection.execute("DELETE FROM events WHERE seq IN (SELECT seq FROM events WHERE seq <= (SELECT seq FROM events ORDER BY seq DESC LIMIT 1 OFFSET ?) ORDER BY seq LIMIT ?)",
+                (self.maxEvents, self.sweepChunk)).rowcount
+        connection.commit()
+        self.eventsSwept += deleted
+        return deleted >= self.sweepChunk
+
+
+def getEventType(event):
+    return event.get("event")
+
+def getEventDevices(event):
+    #device ids an event is about: its "devices" list, or for events stored before that field existed, the ids in "trigger"
+    if ("devices" in event):
+        return list(event["devices"])
+    return [word for word in str(event.get("trigger", "")).split() if word.startswith("0x")]
@@ -0,0 +1,126 @@
+import time
+from codec import BINARY_FRAME_SYNC, BINARY_FRAME_LENGTH
+
+
+class FrameReader:
+    #Reads everything the arduino gateway has queued on the serial port in bulk, splits it into frames on '\n' (or on
+    #the sync byte with binaryFraming, see codec.py) and hands every decoded frame to onFrame. Nothing is flushed or skipped: a frame is only lost if it is longer than
+    #maxFrameLength (counted in framesDropped) or cannot be decoded (counted in framesMalformed).
+
+    def __init__(self, ser, decodeFrame, onFrame, bufferSize=4096, maxFrameLength=64, binaryFraming=False, onRawFrame=None):
+        self.ser = ser
+        self.decodeFrame = decodeFrame #bytes without the trailing '\n' -> decoded message, raises on malformed input
+        self.onFrame = onFrame #called with (decoded message, receive time in monotonic ns)
+        self.onRawFrame = onRawFrame #called with (frame bytes, receive time in monotonic ns) before decoding, e.g. CaptureWriter.recordReceived
+        self.buffer = bytearray(bufferSize) #reused for the lifetime of the reader; unconsumed bytes live in buffer[start:end]
+        self.bufferView = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.maxFrameLength = maxFrameLength
+        self.binaryFraming = binaryFraming
+        self.discardingOversizedFrame = False
+        self.framesReceived = 0
+        self.framesDropped = 0
+        self.framesMalformed = 0
+        self.bytesReceived = 0
+
+    def getCounters(self):
+        return {
+            "framesReceived": self.framesReceived,
+            "framesDropped": self.framesDropped,
+            "framesMalformed": self.framesMalformed,
+            "bytesReceived": self.bytesReceived
+        }
+
+    def readAvailable(self):
+        #blocks for at most ser.timeout waiting for the first byte, then takes whatever else is already waiting in one read
+        count = self.readInto(max(1, self.ser.in_waiting))
+        if (count and self.ser.in_waiting):
+            count += self.readInto(self.ser.in_waiting)
+        if (count):
+            self.splitFrames(time.monotonic_ns())
+        return count
+
+    def readInto(self, size):
+        if (len(self.buffer) - self.end < size):
+            self.compact()
+        size = min(size, len(self.buffer) - self.end)
+        count = self.ser.readinto(self.bufferView[self.end:self.end + size]) or 0
+        self.end += count
+        self.bytesReceived += count
+        return count
+
+    def feed(self, data):
+        #same as readAvailable, for bytes that did not come from self.ser
+        offset = 0
+        while (offset < len(data)):
+            self.compact()
+            count = min(len(self.buffer) - self.end, len(data) - offset)
+            self.buffer[self.end:self.end + count] = data[offset:offset + count]
+            self.end += count
+            offset += count
+            self.bytesReceived += count
+            self.splitFrames(time.monotonic_ns())
+
+    def compact(self):
+        #move the unterminated tail to the front of the buffer so the next read has room behind it
+        if (self.start == 0):
+            return
+        remaining = self.end - self.start
+        self.buffer[:remaining] = self.buffer[self.start:self.end]
+        self.start = 0
+        self.end = remaining
+
+    def splitFrames(self, receivedTimeNs):
+        if (self.binaryFraming):
+            self.splitBinaryFrames(receivedTimeNs)
+            return
+        while True:
+            newline = self.buffer.find(b'\n', self.start, self.end)
+            if (newline == -1):
+                break
+            if (self.discardingOversizedFrame):
+                self.discardingOversizedFrame = False
+            else:
+                self.handleFrame(bytes(self.bufferView[self.start:newline]), receivedTimeNs)
+            self.start = newline + 1
+
+        if (self.start == self.end):
+            self.start = self.end = 0
+        elif (self.end - self.start > self.maxFrameLength): #no terminator in sight - line noise or a garbled frame
+            if (not self.discardingOversizedFrame):
+                self.framesDropped += 1
+            self.discardingOversizedFrame = True
+            self.start = self.end = 0
+
+    def splitBinaryFrames(self, receivedTimeNs):
+        while (self.end - self.start >= BINARY_FRAME_LENGTH):
+            if (self.buffer[self.start] != BINARY_FRAME_SYNC): #out of step - skip to the next sync byte
+                self.framesDropped += 1
+                sync = self.buffer.find(BINARY_FRAME_SYNC, self.start, self.end)
+                self.start = sync if sync != -1 else self.end
+                continue
+            if (self.handleFrame(bytes(self.bufferView[self.start:self.start + BINARY_FRAME_LENGTH]), receivedTimeNs)):
+                self.start += BINARY_FRAME_LENGTH
+            else: #a sync byte that wasn't the start of a frame, or a corrupted frame - resync from the next byte
+                self.start += 1
+
+        if (self.start == self.end):
+            self.start = self.end = 0
+
+    def handleFrame(self, frame, receivedTimeNs):
+        if (self.onRawFrame):
+            self.onRawFrame(frame, receivedTimeNs)
+        if (not self.binaryFraming):
+            frame = frame.rstrip(b'\r')
+            if (not frame or frame.startswith(b">>>")): #debug lines over serial
+                return True
+        try:
+            msg = self.decodeFrame(frame)
+        except Exception:
+            self.framesMalformed += 1
+            print(f"ERROR WITH PARSING FRAME {frame}, CONTINUING LOOP<<<<<")
+            return False
+        self.framesReceived += 1
+        self.onFrame(msg, receivedTimeNs)
+        return True
@@ -0,0 +1,131 @@
+GROUP_ADDRESS = 0xF0 #addressee of a group frame; the group id goes where the device type would
+JOIN_GROUP = 0xE1 #[sender, device, JOIN_GROUP, group id]
+LEAVE_GROUP = 0xE2 #[sender, device, LEAVE_GROUP, group id]
+CLEAR_GROUPS = 0xE3 #[sender, device, CLEAR_GROUPS, 0x00]
+QUERY_GROUPS = 0xE4 #[sender, device, QUERY_GROUPS, 0x00] - the node answers IN_GROUP per group it holds, then GROUPS_END
+#from the node to the home base:
+IN_GROUP = 0xE5 #[device, home base, IN_GROUP, group id] - answer to a join, or one of the answers to a query
+NOT_IN_GROUP = 0xE6 #[device, home base, NOT_IN_GROUP, group id] - answer to a leave, or to a join it had no room for
+GROUPS_END = 0xE7 #[device, home base, GROUPS_END, number of groups held] - last answer to a query
+GROUP_REPORTS = (IN_GROUP, NOT_IN_GROUP, GROUPS_END)
+
+
+class GroupDirectory:
+    #Runtime CAN groups: a set of devices that acts on one frame [sender, GROUP_ADDRESS, message, group id] instead of a
+    #frame each. A group is allocated per distinct set of devices, so profiles with the same outputs share one. Nodes
+    #keep their groups in EEPROM (multidevicenode.ino, loudspeaker.ino). When a device is discovered, or comes back after
+    #going missing, it is asked which groups it holds, and told to join or leave only where that differs - so EEPROM is
+    #written only for a real change. Every command is answered; one that isn't is sent again every retrySec, up to
+    #maxAttempts times. Only groups a device has confirmed count - anyone else still gets its own frame, and so does a
+    #node whose firmware doesn't answer.
+
+    def __init__(self, senderId, firstGroupId=0x01, maxGroupsPerDevice=8, retrySec=2, maxAttempts=5):
+        #maxGroupsPerDevice must match MAX_GROUPS in the nodes
+        self.senderId = senderId
+        self.nextGroupId = firstGroupId
+        self.maxGroupsPerDevice = maxGroupsPerDevice
+        self.retrySec = retrySec
+        self.maxAttempts = maxAttempts
+        self.groupIds = {} #key describing the devices -> group id
+        self.held = {} #hex device id -> set of group ids it has confirmed holding; missing until it has answered a query
+        self.listing = {} #hex device id -> group ids reported so far in answer to a query
+        self.pending = {} #hex device id -> {(command, group id): [frame, lastSentSec, attempts]} not yet answered
+        self.givenUp = {} #hex device id -> {(command, group id)} it never answered, or refused for lack of room
+        self.holders = {} #group id -> hex device ids that have confirmed holding it
+
+    def getGroupId(self, key): #the group for key (any hashable naming the set of devices), allocated on first use
+        if (key not in self.groupIds):
+            if (self.nextGroupId >= GROUP_ADDRESS):
+                raise ValueError(f"out of group ids for {key}")
+            self.groupIds[key] = self.nextGroupId
+            self.nextGroupId += 1
+        return self.groupIds[key]
+
+    def getJoinFrames(self, deviceId, groupIds, now):
+        #frames that bring deviceId's groups in line with groupIds: a query until it has said what it holds, then a join
+        #or leave per difference, each until it is answered. Unanswered commands are sent again once retrySec has passed.
+        #now - monotonic seconds
+        pending = self.pending.setdefault(deviceId, {})
+        givenUp = self.givenUp.setdefault(deviceId, set())
+        if (deviceId not in self.held):
+            if (not pending and not givenUp):
+                self.addPending(deviceId, QUERY_GROUPS, 0x00)
+        else:
+            held = self.held[deviceId]
+            for groupId in sorted(held - set(groupIds)):
+                if ((LEAVE_GROUP, groupId) not in pending and (LEAVE_GROUP, groupId) not in givenUp):
+                    self.addPending(deviceId, LEAVE_GROUP, groupId)
+            joining = [groupId for command, groupId in pending if command == JOIN_GROUP]
+            for groupId in sorted(set(groupIds) - held):
+                if ((JOIN_GROUP, groupId) in pending or (JOIN_GROUP, groupId) in givenUp):
+                    continue
+                if (len(held) + len(joining) >= self.maxGroupsPerDevice):
+                    self.giveUp(deviceId, (JOIN_GROUP, groupId), "HAS NO ROOM FOR GROUP")
+                    continue
+                self.addPending(deviceId, JOIN_GROUP, groupId)
+                joining.append(groupId)
+        frames = []
+        for key, entry in list(pending.items()):
+            frame, lastSentSec, attempts = entry
+            if (lastSentSec is not None and now - lastSentSec < self.retrySec):
+                continue
+            if (attempts >= self.maxAttempts):
+                self.giveUp(deviceId, key, "NEVER ANSWERED")
+                continue
+            entry[1] = now
+            entry[2] += 1
+            if (key[0] == QUERY_GROUPS):
+                self.listing[deviceId] = set() #answers to an earlier attempt may be part way through
+            frames.append(frame)
+        return frames
+
+    def addPending(self, deviceId, command, groupId):
+        self.pending[deviceId][(command, groupId)] = [[self.senderId, int(deviceId, 16), command, groupId], None, 0]
+
+    def giveUp(self, deviceId, key, reason): #not asked again until the device is forgotten; groups it hasn't confirmed aren't used for it
+        print(f">>>>DEVICE {deviceId} {reason} {hex(key[1]) if key[1] else hex(key[0])}, IT WILL BE ADDRESSED DIRECTLY")
+        self.pending[deviceId].pop(key, None)
+        self.givenUp[deviceId].add(key)
+
+    def onReport(self, deviceId, message, value): #an IN_GROUP, NOT_IN_GROUP or GROUPS_END frame from deviceId
+        pending = self.pending.setdefault(deviceId, {})
+        if ((QUERY_GROUPS, 0x00) in pending):
+            listing = self.listing.setdefault(deviceId, set())
+            if (message == IN_GROUP):
+                listing.add(value)
+            elif (message == GROUPS_END and value == len(listing)): #otherwise an answer went missing - it is asked again
+                del pending[(QUERY_GROUPS, 0x00)]
+                self.setHeld(deviceId, self.listing.pop(deviceId))
+            return
+        if (deviceId not in self.held):
+            return
+        held = set(self.held[deviceId])
+        if (message == IN_GROUP):
+            pending.pop((JOIN_GROUP, value), None)
+            held.add(value)
+        elif (message == NOT_IN_GROUP):
+            pending.pop((LEAVE_GROUP, value), None)
+            if ((JOIN_GROUP, value) in pending): #a join it had no room for
+                self.giveUp(deviceId, (JOIN_GROUP, value), "HAS NO ROOM FOR GROUP")
+            held.discard(value)
+        self.setHeld(deviceId, held)
+
+    def setHeld(self, deviceId, groupIds):
+        for groupId in self.held.get(deviceId, ()):
+            self.holders[groupId].discard(deviceId)
+        self.held[deviceId] = groupIds
+        for groupId in groupIds:
+            self.holders.setdefault(groupId, set()).add(deviceId)
+
+    def forget(self, deviceId): #deviceId is asked what it holds afresh when next seen
+        self.setHeld(deviceId, set())
+        for state in (self.held, self.listing, self.pending, self.givenUp):
+            state.pop(deviceId, None)
+
+    def split(self, groupId, deviceIds): #(hex ids in the group, the rest)
+        #no members at all if a device outside deviceIds still holds the group - it would act on the group frame too
+        holders = self.holders.get(groupId, set())
+        if (not holders <= set(deviceIds)):
+            return [], list(deviceIds)
+        members = [deviceId for deviceId in deviceIds if deviceId in holders]
+        return members, [deviceId for deviceId in deviceIds if deviceId not in members]
@@ -0,0 +1,70 @@
+import math
+import threading
+from bisect import bisect_left
+
+#Just enough of the Prometheus text exposition format (version 0.0.4) for /metrics: histograms kept here, and
+#counters and gauges read from the counters the modules keep anyway, at scrape time.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LOOP_BUCKETS_SEC = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+OUTPUT_BUCKETS_SEC = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+
+
+class Histogram:
+    #observed from the engine and transmit threads, rendered on a web thread
+    def __init__(self, bucketsSec):
+        self.buckets = tuple(bucketsSec)
+        self.counts = [0] * (len(self.buckets) + 1) #the last one is +Inf
+        self.sum = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value) #first bucket with value <= its upper bound
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def getSamples(self, name):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf, ), counts):
+            cumulative += count
+            samples.append((name + "_bucket", {"le": formatValue(bound)}, cumulative))
+        samples.append((name + "_sum", None, total))
+        samples.append((name + "_count", None, cumulative))
+        return samples
+
+
+def renderWebMetrics(rpcCounters, clientCount, engineUp):
+    #the web server's side, after the engine's metrics
+    return "".join([
+        renderMetric("alarm_engine_up", "gauge", "1 if the engine answered this scrape.", [(None, int(engineUp))]),
+        renderMetric("alarm_web_clients", "gauge", "Connected socket.io clients.", [(None, clientCount)]),
+        renderMetric("alarm_rpc_in_flight", "gauge", "Calls to the engine waiting for an answer.", [(None, rpcCounters["inFlight"])]),
+        renderMetric("alarm_rpc_calls_timed_out_total", "counter", "Calls to the engine that got no answer in time.", [(None, rpcCounters["callsTimedOut"])])
+    ])
+
+
+def formatValue(value):
+    if (value == math.inf):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def formatLabels(labels):
+    if (not labels):
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in labels.items()) + "}"
+
+
+def renderMetric(name, metricType, helpText, samples):
+    #samples: [(labels dict or None, value)] for a counter or gauge, a Histogram for a histogram
+    lines = [f"# HELP {name} {helpText}", f"# TYPE {name} {metricType}"]
+    if (isinstance(samples, Histogram)):
+        samples = samples.getSamples(name)
+    else:
+        samples = [(name, labels, value) for labels, value in samples]
+    lines += [f"{sampleName}{formatLabels(labels)} {formatValue(value)}" for sampleName, labels, value in samples]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,85 @@
+import time
+
+ALARM_ON = 0xBB
+ALARM_OFF = 0xCC
+CAN_BITRATE = 125000 #CAN_125KBPS, as set on every node
+BITS_PER_FRAME = 80 #standard id, 3 data bytes, with a typical amount of bit stuffing
+
+
+class OutputManager:
+    #Keeps alarm outputs (bells, lights, the Denon, or everyone by broadcast) at the state the engine wants them in.
+    #A target gets a frame when what it should be doing changes, and otherwise only once its keepalive has run out -
+    #enough for a node that rebooted or missed a frame to catch up, without repeating every output's state on the bus
+    #several times a second. Also counts what the old fixed-interval resend would have sent over the same time, so
+    #bus use can be compared.
+
+    def __init__(self, sendFrame, senderId, getKeepaliveSec, legacyResendSec=.5, getNow=time.monotonic):
+        self.sendFrame = sendFrame #called with ([sender, target, message, 0x01 or group id], pauseBeforeSec)
+        self.senderId = senderId
+        self.getKeepaliveSec = getKeepaliveSec #target -> seconds between refreshes of an unchanged state
+        self.legacyResendSec = legacyResendSec
+        self.getNow = getNow #monotonic seconds - the engine's clock, so keepalives keep its time
+        self.lastSent = {} #target -> (message, time sent)
+        self.startTime = None #of the first frame sent, so a clock swapped in after construction is the one counted on
+        self.lastUpdateTime = None
+        self.legacyFrames = 0
+        self.framesSent = 0
+        self.transitionFrames = 0
+        self.keepaliveFrames = 0
+
+    def update(self, desired, pauseBeforeSec=0, now=None):
+        #desired: {target: ALARM_ON/ALARM_OFF}, target a device id or (GROUP_ADDRESS, group id) - see groups.py
+        #sends what changed or is due. Targets left out are no longer tracked.
+        #pauseBeforeSec - gap on the bus before the first frame sent. now - getNow() if the caller has it already.
+        #Returns how many frames went out.
+        now = self.getNow() if now is None else now
+        if (self.lastUpdateTime is not None):
+            self.legacyFrames += len(desired) * (now - self.lastUpdateTime) / self.legacyResendSec
+        self.lastUpdateTime = now
+        for target in list(self.lastSent):
+            if (target not in desired):
+                del self.lastSent[target]
+        sent = 0
+        for target, message in desired.items():
+            last = self.lastSent.get(target)
+            if (last is not None and last[0] == message and now - last[1] < self.getKeepaliveSec(target)):
+                continue
+            if (last is not None and last[0] == message):
+                self.keepaliveFrames += 1
+            else:
+                self.transitionFrames += 1
+            self.send(target, message, pauseBeforeSec if sent == 0 else 0, now)
+            sent += 1
+        return sent
+
+    def send(self, target, message, pauseBeforeSec=0, now=None): #also for one-off sequences, so update() knows about them
+        if (isinstance(target, tuple)): #the group id goes where the device type would
+            self.sendFrame([self.senderId, target[0], message, target[1]], pauseBeforeSec)
+        else:
+            self.sendFrame([self.senderId, target, message, 0x01], pauseBeforeSec)
+        self.lastSent[target] = (message, self.getNow() if now is None else now)
+        if (self.startTime is None):
+            self.startTime = self.lastSent[target][1]
+        self.framesSent += 1
+
+    def secondsUntilNextRefresh(self): #None if nothing is tracked
+        if (not self.lastSent):
+            return None
+        now = self.getNow()
+        return max(0, min(sentTime + self.getKeepaliveSec(target) - now for target, (message, sentTime) in self.lastSent.items()))
+
+    def getCounters(self):
+        elapsedSec = max(self.getNow() - self.startTime if self.startTime is not None else 0, 1e-9)
+        framesPerSec = self.framesSent / elapsedSec
+        legacyFramesPerSec = self.legacyFrames / elapsedSec
+        return {
+            "targets": len(self.lastSent),
+            "framesSent": self.framesSent,
+            "transitionFrames": self.transitionFrames,
+            "keepaliveFrames": self.keepaliveFrames,
+            "framesPerSec": framesPerSec,
+            "busLoad": framesPerSec * BITS_PER_FRAME / CAN_BITRATE,
+            "legacyFrames": int(self.legacyFrames),
+            "legacyFramesPerSec": legacyFramesPerSec,
+            "legacyBusLoad": legacyFramesPerSec * BITS_PER_FRAME / CAN_BITRATE
+        }
@@ -0,0 +1,42 @@
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError: #optional - clients asking for msgpack get json bytes (the header byte says which) until it's installed
+    msgpack = None
+
+#Payload formats for what the server emits as {'message': ...}. A client picks one in its socket.io connect auth,
+#{"encoding": "json" or "msgpack", "compress": true/false}. Anything but the legacy format is bytes that start with a
+#header byte, so the client can always tell how to decode them:
+LEGACY = "object" #no auth: the message as an object, as before - the server parses the engine's json for socket.io to encode
+HEADER_JSON = 0x00 #utf-8 json, exactly as the engine built it
+HEADER_MSGPACK = 0x02
+HEADER_DEFLATE = 0x01 #or'ed in: the rest is zlib deflated (DecompressionStream("deflate") in a browser)
+COMPRESS_MIN_BYTES = 256 #smaller payloads (most status deltas) are sent as they are - deflate gains nothing on them
+
+
+def getPayloadFormat(auth): #socket.io connect auth -> format name, shared by every client that asked for the same
+    if (not isinstance(auth, dict) or auth.get("encoding") not in ("json", "msgpack")):
+        return LEGACY
+    return auth["encoding"] + ("+deflate" if auth.get("compress") else "")
+
+
+def getRoom(payloadFormat): #socket.io room of the clients that take payloadFormat, for broadcasts
+    return "payload:" + payloadFormat
+
+
+def encodePayload(jsonString, payloadFormat):
+    #the engine's json string in payloadFormat - done once per broadcast and format, the same buffer goes to every client
+    if (payloadFormat == LEGACY):
+        return json.loads(jsonString)
+    if (payloadFormat.startswith("msgpack") and msgpack is not None):
+        header = HEADER_MSGPACK
+        body = msgpack.packb(json.loads(jsonString))
+    else:
+        header = HEADER_JSON
+        body = jsonString.encode()
+    if (payloadFormat.endswith("+deflate") and len(body) >= COMPRESS_MIN_BYTES):
+        header |= HEADER_DEFLATE
+        body = zlib.compress(body, 6)
+    return bytes((header,)) + body
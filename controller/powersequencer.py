@@ -0,0 +1,69 @@
+from threading import Condition, Thread
+
+POWER_ON = 0x0F
+POWER_OFF = 0x01
+
+
+class PowerSequencer:
+    #Runs a plan of power frames in the background, one frame at a time: sendFrame(frame, pauseBeforeSec) returns once
+    #the frame is on the wire. Power-on frames ask for inrushSpacingSec after the frame before them, so relay-gated
+    #PIR/microwave sensors don't all charge their capacitors at once and pull the supply down - the transmit queue
+    #(txqueue.py) does that spacing along with its own, so it isn't added twice. Starting a new plan (arm, disarm,
+    #profile change) drops what is left of the previous one, past the frame being sent.
+    #onProgress(progress) is called from the sequencer thread when a plan completes.
+
+    def __init__(self, sendFrame, onProgress=None, inrushSpacingSec=.07):
+        self.sendFrame = sendFrame #sendFrame(frame, pauseBeforeSec), returning once it is written
+        self.onProgress = onProgress
+        self.inrushSpacingSec = inrushSpacingSec
+        self.condition = Condition()
+        self.plan = []
+        self.planId = 0
+        self.done = 0
+        self.plansCompleted = 0
+        self.plansSuperseded = 0
+        self.sequencerThread = Thread(target=self.sequencerThreadMain, daemon=True)
+        self.sequencerThread.start()
+
+    def start(self, frames): #returns the id of the new plan
+        with self.condition:
+            if (self.done < len(self.plan)):
+                self.plansSuperseded += 1
+            self.planId += 1
+            self.plan = [list(frame) for frame in frames]
+            self.done = 0
+            self.condition.notify_all()
+            return self.planId
+
+    def cancel(self):
+        self.start([])
+
+    def getProgress(self):
+        with self.condition:
+            return self.buildProgress()
+
+    def buildProgress(self): #with condition held
+        return {"planId": self.planId, "running": self.done < len(self.plan), "done": self.done, "total": len(self.plan)}
+
+    def waitUntilDone(self, timeoutSec=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.done >= len(self.plan), timeoutSec)
+
+    def sequencerThreadMain(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.done < len(self.plan))
+                frame = self.plan[self.done]
+                planId = self.planId
+            self.sendFrame(frame, self.inrushSpacingSec if frame[2] == POWER_ON else 0)
+            with self.condition:
+                if (planId != self.planId): #replaced while sending - the new plan starts from its first frame
+                    continue
+                self.done += 1
+                if (self.done < len(self.plan)):
+                    continue
+                self.plansCompleted += 1
+                self.condition.notify_all()
+                progress = self.buildProgress()
+            if (self.onProgress):
+                self.onProgress(progress)
@@ -0,0 +1,116 @@
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from threading import Condition, Thread
+from uuid import uuid4
+
+from deadlines import DeadlineScheduler
+
+RpcCommand = namedtuple("RpcCommand", ["request", "params"]) #engine request name, and the arguments it takes
+
+ALARM_STATUS = RpcCommand("ALARM-STATUS", ("sinceVersion",))
+GET_ALARM_PROFILES = RpcCommand("GET-ALARM-PROFILES", ())
+GET_PAST_EVENTS = RpcCommand("GET-PAST-EVENTS", ("since", "before", "limit"))
+SEARCH_EVENTS = RpcCommand("SEARCH-EVENTS", ("device", "event", "from", "to", "before", "limit"))
+GET_TRACES = RpcCommand("GET-TRACES", ("containing",)) #spans the engine recorded, see tracing.py
+GET_METRICS = RpcCommand("GET-METRICS", ()) #only to a separate engine process, which answers it off the engine thread
+
+
+class RpcCall:
+    #handed to the engine in the request as "call": it answers with respond(), and can skip the work if cancelled()
+    def __init__(self, bridge, uuid):
+        self.bridge = bridge
+        self.uuid = uuid
+
+    def respond(self, response):
+        self.bridge.resolve(self.uuid, response)
+
+    def cancelled(self):
+        return not self.bridge.isPending(self.uuid)
+
+
+class RpcBridge:
+    #Requests from the web server to the alarm engine that want an answer. call() queues the request and returns a
+    #Future straight away; the engine's answer completes it, on the engine thread. A call that isn't answered within
+    #its timeout fails with TimeoutError and is forgotten, as is one that is cancelled - an answer that comes later is
+    #dropped. One thread runs all the timeouts, so callers don't have to wait on the Future to get it cleaned up.
+
+    def __init__(self, requestQueue, defaultTimeoutSec=5):
+        self.requestQueue = requestQueue
+        self.defaultTimeoutSec = defaultTimeoutSec
+        self.condition = Condition()
+        self.pending = {} #uuid -> Future
+        self.deadlines = DeadlineScheduler() #uuid -> time it times out
+        self.callsMade = 0
+        self.callsAnswered = 0
+        self.callsTimedOut = 0
+        self.callsCancelled = 0
+        self.lateResponses = 0
+        self.timeoutThread = Thread(target=self.timeoutThreadMain, daemon=True)
+        self.timeoutThread.start()
+
+    def call(self, command, timeoutSec=None, **args): #-> Future of the engine's response dict
+        unknown = set(args) - set(command.params)
+        if (unknown):
+            raise TypeError(f"{command.request} takes {command.params}, not {sorted(unknown)}")
+        uuid = uuid4().hex
+        future = Future()
+        future.uuid = uuid
+        future.request = command.request
+        with self.condition:
+            self.pending[uuid] = future
+            self.deadlines.set(uuid, time.monotonic() + (self.defaultTimeoutSec if timeoutSec is None else timeoutSec))
+            self.callsMade += 1
+            self.condition.notify_all()
+        future.add_done_callback(lambda future: self.onDone(uuid, future))
+        self.requestQueue.put({"request": command.request, "uuid": uuid, "call": RpcCall(self, uuid), **{param: args.get(param) for param in command.params}})
+        return future
+
+    def resolve(self, uuid, response):
+        with self.condition:
+            future = self.pending.pop(uuid, None)
+            self.deadlines.remove(uuid)
+            if (future is None):
+                self.lateResponses += 1
+                return
+            self.callsAnswered += 1
+        if (future.set_running_or_notify_cancel()): #False if it was cancelled in the meantime
+            future.set_result(response)
+
+    def isPending(self, uuid):
+        with self.condition:
+            return uuid in self.pending
+
+    def cancel(self, futures): #e.g. everything a client that went away had in flight
+        for future in futures:
+            future.cancel()
+
+    def onDone(self, uuid, future): #a cancelled future is forgotten here; answered and timed out ones already are
+        if (not future.cancelled()):
+            return
+        with self.condition:
+            if (self.pending.pop(uuid, None) is not None):
+                self.deadlines.remove(uuid)
+                self.callsCancelled += 1
+
+    def getCounters(self):
+        with self.condition:
+            return {
+                "inFlight": len(self.pending),
+                "callsMade": self.callsMade,
+                "callsAnswered": self.callsAnswered,
+                "callsTimedOut": self.callsTimedOut,
+                "callsCancelled": self.callsCancelled,
+                "lateResponses": self.lateResponses
+            }
+
+    def timeoutThreadMain(self):
+        while True:
+            with self.condition:
+                nextDeadline = self.deadlines.nextDeadline()
+                self.condition.wait(None if nextDeadline is None else max(0, nextDeadline - time.monotonic()))
+                expired = [self.pending.pop(uuid) for uuid in self.deadlines.popExpired(time.monotonic()) if uuid in self.pending]
+                self.callsTimedOut += len(expired)
+            for future in expired:
+                if (future.set_running_or_notify_cancel()):
+                    future.set_exception(TimeoutError(f"no response from the alarm engine to {future.request}"))
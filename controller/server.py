@@ -1,44 +1,78 @@
 import threading
-import alarm
-import json
+import rpc
+import payloads
+import engineprocess
+import metrics
 import os
 from queue import Queue
 import ssl
-from flask import Flask, jsonify
-from flask_socketio import SocketIO, emit
+from flask import Flask, Response, jsonify, request
+from flask_socketio import SocketIO, join_room
 from uuid import uuid4
 
 
 # Create a queue for communication between main program and daemon thread
 webserver_message_queue = Queue()
-responseQueues = {}
+rpcBridge = rpc.RpcBridge(webserver_message_queue) # requests that want an answer from the engine, see rpc.py
+clientCalls = {} # client sid -> futures of its calls still in flight, cancelled if it disconnects
+clientCallsLock = threading.Lock()
+clientFormats = {} # client sid -> the payload format it asked for on connect, see payloads.py
+outgoingQueue = Queue() # (eventName, payload, payloadFormat or None to send payload as is, to) for publishLoop to encode and emit, off the engine thread
 # Set up the Flask web API
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins=["https://bobik.lan:5020", "https://192.168.2.100", "https://192.168.2.100:443", "https://192.168.2.100:5020", "https://192.168.2.100:5010", "http://192.168.2.100:3000", "https://bobik.lan","https://192.168.99.5"], ping_timeout=11, ping_interval=5, async_mode="threading")
-thread = None
-thread_lock = threading.Lock()
-new_client_exists = False
 alarmQueueMessages = {}
 thisDir = os.path.dirname(os.path.abspath(__file__))
 serverKeysDir = thisDir + "/server-keys"
+separateEngineProcess = False # True: the alarm engine runs as its own process (python3 engineprocess.py) that owns the serial port, see engineprocess.py
 print(thisDir)
 
 def main():
-    global responseQueues
     global webserver_message_queue
     global thisDir
 
     print("Main program started.")
 
-    # Create a thread for the raspi alarm python script and pass the global variable and message queue
-    alarm_thread = threading.Thread(target=alarm.run, args=(webserver_message_queue, ), daemon=True)
-    alarm_thread.start()
+    if (separateEngineProcess):
+        # Requests go to the engine process, which pushes status changes through shared memory
+        engineprocess.EngineLink(webserver_message_queue, rpcBridge, publishStatus).start()
+    else:
+        import alarm # only when the engine runs here - the engine process has it otherwise
+
+        # Status changes are pushed by the alarm engine as they happen (no polling)
+        alarm.addStatusListener(publishStatus)
+
+        # Create a thread for the raspi alarm python script and pass the global variable and message queue
+        alarm_thread = threading.Thread(target=alarm.run, args=(webserver_message_queue, ), daemon=True)
+        alarm_thread.start()
+
+    # Pushes and engine answers to clients are encoded and emitted here: the engine thread only queues them
+    socketio.start_background_task(publishLoop)
 
     @app.route('/status', methods=['GET'])
     def get_status():
         status = {"status": "ok"}
         return jsonify(status)
 
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        # prometheus text format: the engine's hot-path counters and latencies, then this server's own
+        engineMetrics = ""
+        try:
+            engineMetrics = rpcBridge.call(rpc.GET_METRICS, timeoutSec=2).result()["response"] if separateEngineProcess else alarm.getMetricsText()
+        except TimeoutError as e:
+            print(">>>>" + str(e))
+        return Response(engineMetrics + metrics.renderWebMetrics(rpcBridge.getCounters(), len(clientFormats), engineMetrics != ""), mimetype=metrics.CONTENT_TYPE)
+
+    @app.route('/traces', methods=['GET'])
+    def get_traces():
+        # spans the engine recorded while tracing is on (see tracing.py); ?containing=alarmTriggered for only the alarms
+        try:
+            response = rpcBridge.call(rpc.GET_TRACES, containing=request.args.get('containing')).result()
+        except TimeoutError as e:
+            return jsonify({"error": str(e)}), 504
+        return Response(response["response"], mimetype='application/json')
+
     @app.after_request
     def add_no_cache_header(response):
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
@@ -48,40 +82,39 @@ def main():
 
 
     @socketio.on('connect')
-    def handle_connect():
+    def handle_connect(auth = None):
         #authenticate()
-        global new_client_exists
-
-        new_client_exists = True
         print('Client connected')
-        global thread
-        with thread_lock:
-            if thread is None:
-                thread = socketio.start_background_task(update_status_thread)
+        clientFormats[request.sid] = payloads.getPayloadFormat(auth)
+        join_room(payloads.getRoom(clientFormats[request.sid]))
+        sendAlarmStatus() # the new client only gets pushes from the next change on, so send it the current status now
 
     @socketio.on('disconnect')
-    def disconnect():
-        global client_count
-        client_count -= 1
-        if (client_count == 0):
-            thread.kill()
+    def disconnect(reason = None):
         print('Disconnected')
+        clientFormats.pop(request.sid, None)
+        with clientCallsLock:
+            futures = clientCalls.pop(request.sid, set())
+        rpcBridge.cancel(futures)
 
     @socketio.on('getPastEvents')
     def getPastEvents(message):
-        global responseQueues
-
-        callUUID = generateUUID()
-        responseQueues[callUUID] = Queue()
-        messageToSend = {"request":"GET-PAST-EVENTS", "uuid": callUUID, "responseQueue": responseQueues[callUUID]}
-        webserver_message_queue.put(messageToSend)
-        response = responseQueues[callUUID].get(True, 5)["response"]
-        del responseQueues[callUUID]
-        emit('postPastEvents', {'message': json.loads(response)})
+        # message may carry {since, before, limit}: events after seq since (new ones) or before seq before (older page)
+        cursor = message.get('message') if isinstance(message, dict) else None
+        cursor = cursor if isinstance(cursor, dict) else {}
+        callEngine(rpc.GET_PAST_EVENTS, lambda response: 'postPastEvents', since=cursor.get('since'), before=cursor.get('before'), limit=cursor.get('limit'))
+
+    @socketio.on('searchEvents')
+    def searchEvents(message):
+        # message carries any of {device, event, from, to} (from/to in epoch seconds) plus before/limit for paging
+        query = message.get('message') if isinstance(message, dict) else None
+        query = query if isinstance(query, dict) else {}
+        callEngine(rpc.SEARCH_EVENTS, lambda response: 'postEventSearch', **{key: query.get(key) for key in rpc.SEARCH_EVENTS.params})
 
     @socketio.on('getStatus')
     def getStatus(message):
-        sendAlarmStatus("something")
+        # message may carry the status version the client already has, to only get what changed since
+        sendAlarmStatus(message.get('message') if isinstance(message, dict) else None)
 
     @socketio.on('arm')
     def arm(message):
@@ -141,15 +174,7 @@ def main():
 
     @socketio.on('getAlarmProfiles')
     def getProfiles(message):
-        global responseQueues
-
-        callUUID = generateUUID()
-        responseQueues[callUUID] = Queue()
-        messageToSend = {"request":"GET-ALARM-PROFILES", "uuid": callUUID, "responseQueue": responseQueues[callUUID] }
-        webserver_message_queue.put(messageToSend)
-        response = responseQueues[callUUID].get(True, 5)["response"]
-        del responseQueues[callUUID]
-        emit('postAlarmProfiles', {'message': json.loads(response)})
+        callEngine(rpc.GET_ALARM_PROFILES, lambda response: 'postAlarmProfiles')
 
     @socketio.on('setAlarmProfile')
     def setAlarmProfile(message):
@@ -169,49 +194,56 @@ def main():
     #socketio.run(app, host='0.0.0.0', port=8080, allow_unsafe_werkzeug=True)
     socketio.run(app, host='0.0.0.0', port=8080, ssl_context=sslContext, allow_unsafe_werkzeug=True)
 
-def update_status_thread():
-    last_status_str = 0
-    while True:    
-        #print(f"before update last_client_count {last_client_count}")
-        last_status_str = sendAlarmStatus(last_status_str)
-        #print(f"updated last_client_count {last_client_count}")
-        socketio.sleep(1)
-
-def getClientCount():
-    global client_count
-    #print('RETURNING CLIENT COUNT ' + str(client_count))
-    return client_count
-
 def generateUUID():
     return uuid4().hex
 
-def sendAlarmStatus (last_status_str):
-    global new_client_exists
-    global responseQueues
-
-    callUUID = generateUUID()
-    responseQueues[callUUID] = Queue()
-    messageToSend = {"request":"ALARM-STATUS", "uuid": callUUID, "responseQueue": responseQueues[callUUID] }
-    webserver_message_queue.put(messageToSend)
-   
-    # TODO: the following code is for debugging a bug whereby after an Arm&Switch
-    # profile button is pressed, no response present on queue after 5 seconds
-    # (tried 10, as well), which gets the server into a bad state, with all clients showing "loading"
-    #
-    # try:
-    #     response = responseQueues[callUUID].get(True, 10)["response"]
-    # except:
-    #     response = last_status_str
-    response = responseQueues[callUUID].get(True, 5)["response"]
-    del responseQueues[callUUID]
-
-    if (response != last_status_str or new_client_exists):
-        print("Sending status to connected clients")
-        socketio.emit('postStatus', {'message': json.loads(response)})
-        new_client_exists = False
-
-    return response
-    
+def publishStatus(version, status, delta):
+    # called on the alarm thread whenever the engine's status changes. Clients holding the previous version apply
+    # the delta; any other client asks for the full status again (getStatus). Only queued here: encoded once per
+    # payload format in use and emitted by publishLoop, so a slow client never holds up the engine
+    print("Sending status version " + str(version) + " to connected clients")
+    eventName, payload = ('postStatusDelta', delta) if delta else ('postStatus', status)
+    for payloadFormat in set(clientFormats.values()):
+        outgoingQueue.put((eventName, payload, payloadFormat, payloads.getRoom(payloadFormat)))
+
+def publishLoop():
+    # encodes and emits what publishStatus and onEngineCallDone queued, in order, on a socket.io background task of its own
+    while True:
+        eventName, payload, payloadFormat, to = outgoingQueue.get()
+        try:
+            socketio.emit(eventName, {'message': payload if payloadFormat is None else payloads.encodePayload(payload, payloadFormat)}, to=to)
+        except Exception as e:
+            print(">>>>ERROR PUBLISHING " + eventName + ": " + str(e))
+
+def sendAlarmStatus(sinceVersion = None):
+    # current status (or the delta from sinceVersion) to the client that caused this call (connect/getStatus)
+    callEngine(rpc.ALARM_STATUS, lambda response: 'postStatusDelta' if response["isDelta"] else 'postStatus', sinceVersion=sinceVersion)
+
+def callEngine(command, getEventName, **args):
+    # sends command to the engine and returns without waiting; its response goes to the client that asked, as the
+    # event getEventName(response) names. A call that times out gets that client an 'rpcError' instead of nothing
+    sid = request.sid
+    future = rpcBridge.call(command, **args)
+    with clientCallsLock:
+        clientCalls.setdefault(sid, set()).add(future)
+    future.add_done_callback(lambda future: onEngineCallDone(sid, future, getEventName))
+
+def onEngineCallDone(sid, future, getEventName):
+    # on the engine thread for an answer, the rpc timeout thread for a timeout, the caller's for a cancel. Whatever
+    # goes to the client is queued for publishLoop, not emitted here
+    with clientCallsLock:
+        clientCalls.get(sid, set()).discard(future)
+        if (not clientCalls.get(sid, True)):
+            del clientCalls[sid]
+    if (future.cancelled()):
+        return
+    if (future.exception()):
+        print(">>>>" + str(future.exception()))
+        outgoingQueue.put(('rpcError', {'request': future.request, 'error': str(future.exception())}, None, sid))
+        return
+    response = future.result()
+    outgoingQueue.put((getEventName(response), response["response"], clientFormats.get(sid, payloads.LEGACY), sid))
+
 
 if __name__ == '__main__':
     main()
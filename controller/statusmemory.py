@@ -0,0 +1,63 @@
+import mmap
+import os
+import struct
+import zlib
+
+HEADER = struct.Struct("<QqIII") #sequence, status version, status length, delta length (NO_DELTA for none), checksum
+FIELDS = struct.Struct("<qII") #the header fields the checksum covers, with the status and delta bytes
+NO_DELTA = 0xFFFFFFFF
+
+
+class StatusSegment:
+    #The engine's latest status (and its delta from the version before) in a file mapped into memory, written by the
+    #engine process and read by the web process without a lock between them. The writer makes the sequence number odd
+    #before it changes anything and even again after; a reader copies the lot and keeps the copy only if the sequence
+    #was the same even number before and after. Nothing orders the two processes' plain memory accesses though (on the
+    #Pi's ARM a reader can see the sequence unchanged around a half-written copy), so the header also carries a crc32
+    #of the version, lengths, status and delta, and a copy that doesn't match it is read again as well. There is one
+    #writer - the engine's status listener.
+
+    def __init__(self, path, create=False, sizeBytes=256 * 1024):
+        if (create): #a new file rather than truncating the old one, which a reader may still have mapped
+            with open(path + ".new", "wb") as file:
+                file.truncate(sizeBytes)
+            os.replace(path + ".new", path)
+        with open(path, "r+b" if create else "rb") as file:
+            self.memory = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE if create else mmap.ACCESS_READ)
+        self.path = path
+        self.retries = 0 #reads that raced a write and had to copy again
+
+    def write(self, version, status, delta): #status and delta are json strings, delta may be None
+        statusBytes = status.encode()
+        deltaBytes = delta.encode() if delta else b""
+        if (HEADER.size + len(statusBytes) + len(deltaBytes) > len(self.memory)):
+            print(f">>>>STATUS OF {len(statusBytes)} BYTES DOESN'T FIT IN {self.path}")
+            return False
+        sequence = HEADER.unpack_from(self.memory)[0]
+        struct.pack_into("<Q", self.memory, 0, sequence + 1) #odd: being written
+        self.memory[HEADER.size:HEADER.size + len(statusBytes)] = statusBytes
+        self.memory[HEADER.size + len(statusBytes):HEADER.size + len(statusBytes) + len(deltaBytes)] = deltaBytes
+        deltaLength = len(deltaBytes) if delta else NO_DELTA
+        HEADER.pack_into(self.memory, 0, sequence + 1, version, len(statusBytes), deltaLength, getChecksum(version, len(statusBytes), deltaLength, statusBytes + deltaBytes))
+        struct.pack_into("<Q", self.memory, 0, sequence + 2) #even: done
+        return True
+
+    def read(self): #-> (version, status json, delta json or None); version -1 before the engine has written anything
+        while True:
+            sequence, version, statusLength, deltaLength, checksum = HEADER.unpack_from(self.memory)
+            if (sequence == 0):
+                return -1, None, None
+            if (sequence % 2 == 0 and HEADER.size + statusLength + (0 if deltaLength == NO_DELTA else deltaLength) <= len(self.memory)):
+                data = self.memory[HEADER.size:HEADER.size + statusLength + (0 if deltaLength == NO_DELTA else deltaLength)]
+                if (struct.unpack_from("<Q", self.memory)[0] == sequence and getChecksum(version, statusLength, deltaLength, data) == checksum):
+                    break
+            self.retries += 1
+            os.sched_yield()
+        return version, data[:statusLength].decode(), None if deltaLength == NO_DELTA else data[statusLength:].decode()
+
+    def close(self):
+        self.memory.close()
+
+
+def getChecksum(version, statusLength, deltaLength, data):
+    return zlib.crc32(data, zlib.crc32(FIELDS.pack(version, statusLength, deltaLength)))
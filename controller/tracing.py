@@ -0,0 +1,93 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class NoSpan:
+    #what span() returns while tracing is off - one shared object, entering and leaving it does nothing
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NO_SPAN = NoSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, traceId, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.traceId = traceId
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.previousTraceId = self.tracer.getTrace()
+        self.tracer.setTrace(self.traceId)
+        self.startNs = time.monotonic_ns()
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        if (excType is not None):
+            self.attributes["error"] = excType.__name__
+        self.tracer.record(self.name, self.startNs, time.monotonic_ns(), self.traceId, **self.attributes)
+        self.tracer.setTrace(self.previousTraceId)
+        return False
+
+    def set(self, **attributes): #attributes only known partway through the span
+        self.attributes.update(attributes)
+
+
+class Tracer:
+    #Timed spans of the alarm path - engine loop, alarm outputs, transmit thread, denon thread - kept in a ring buffer of
+    #the last capacity spans for export on demand. Spans of one trace share its id: a thread carries the id of the trace
+    #it is working on (startTrace/setTrace), so work handed to another thread is tied back by passing the id along.
+    #Times are time.monotonic_ns(), the clock frame receive times are taken with. Off unless enabled, and then
+    #span() is an attribute check returning NO_SPAN.
+
+    def __init__(self, capacity=4096, enabled=False):
+        self.enabled = enabled
+        self.spans = deque(maxlen=capacity) #appends and copies are atomic, no lock needed
+        self.traceIds = itertools.count(1)
+        self.local = threading.local()
+
+    def startTrace(self): #a new trace for what this thread does next; None while off
+        traceId = next(self.traceIds) if self.enabled else None
+        self.local.traceId = traceId
+        return traceId
+
+    def getTrace(self):
+        return getattr(self.local, "traceId", None)
+
+    def setTrace(self, traceId): #continue traceId on this thread, e.g. one started by the thread that handed over the work
+        self.local.traceId = traceId
+
+    def span(self, name, **attributes):
+        if (not self.enabled):
+            return NO_SPAN
+        return Span(self, name, self.getTrace(), attributes)
+
+    def record(self, name, startNs, endNs, traceId=None, **attributes): #a span timed elsewhere, e.g. a frame's wait in a queue
+        if (self.enabled):
+            self.spans.append({"trace": traceId, "name": name, "thread": threading.current_thread().name,
+                "startNs": startNs, "durationUs": (endNs - startNs) // 1000, **attributes})
+
+    def export(self, containing=None):
+        #[{"trace", "startNs", "spans"}] oldest first, spans in start order; containing - only traces with a span of that name
+        traces = {}
+        for span in list(self.spans):
+            traces.setdefault(span["trace"], []).append(span)
+        exported = []
+        for traceId, spans in traces.items():
+            if (containing is None or any(span["name"] == containing for span in spans)):
+                spans.sort(key=lambda span: span["startNs"])
+                exported.append({"trace": traceId, "startNs": spans[0]["startNs"], "spans": spans})
+        return sorted(exported, key=lambda trace: trace["startNs"])
+
+    def clear(self):
+        self.spans.clear()
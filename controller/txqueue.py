@@ -0,0 +1,130 @@
+import heapq
+import time
+from threading import Condition, Thread
+
+from groups import GROUP_ADDRESS
+
+PRIORITY_ALARM = 0 #alarm on/off
+PRIORITY_POWER = 1 #sensor power, and anything not listed below
+PRIORITY_DISPLAY = 2 #arm LED and OLED updates on the home base's arduino
+
+MESSAGE_PRIORITIES = {
+    0xBB: PRIORITY_ALARM, 0xCC: PRIORITY_ALARM,
+    0x0F: PRIORITY_POWER, 0x01: PRIORITY_POWER,
+    0xD1: PRIORITY_DISPLAY, 0xD0: PRIORITY_DISPLAY, 0xA0: PRIORITY_DISPLAY, 0xB0: PRIORITY_DISPLAY, 0xC0: PRIORITY_DISPLAY
+}
+
+#seconds to leave after the previous frame before sending one of this class - the CAN side drops frames sent in rapid
+#succession, and relay-gated sensors powering up together pull the supply down
+DEFAULT_SPACING_SEC = {PRIORITY_ALARM: .05, PRIORITY_POWER: .07, PRIORITY_DISPLAY: .05}
+BROADCAST_ADDRESS = 0x00
+
+
+def getReceiverKey(frame): #what a frame is addressed to: a device id, or (broadcast/group address, group id)
+    return (frame[1], frame[3]) if frame[1] in (BROADCAST_ADDRESS, GROUP_ADDRESS) else frame[1]
+
+
+class TransmitQueue:
+    #Frames for the serial port, sent by a thread of their own so that the caller (the engine loop) never waits on the
+    #port or on the spacing between frames. The most urgent class goes first, FIFO within a class. A frame identical to
+    #the newest one still waiting for the same receiver is dropped rather than sent twice - not one with something else
+    #queued for that receiver in between (0xBB, 0xCC, 0xBB must end with 0xBB). A broadcast or group frame can undo
+    #any device's, so nothing queued after one is coalesced with a frame from before it.
+
+    def __init__(self, writeFrame, spacingSec=DEFAULT_SPACING_SEC):
+        self.writeFrame = writeFrame #called with [sender, receiver, message, deviceType] on the sender thread
+        self.spacingSec = dict(spacingSec)
+        self.condition = Condition()
+        self.heap = [] #(priority, seq, frame, pauseBeforeSec, queuedTime)
+        self.newestQueued = {} #receiver key -> (seq, tuple(frame)) of the newest frame for it still in heap, for coalescing
+        self.nextSeq = 0
+        self.unsentSeqs = set() #seqs queued and not written yet, for sendAndWait
+        self.lastSentTime = 0
+        self.sending = False
+        self.framesQueued = 0
+        self.framesSent = 0
+        self.framesCoalesced = 0
+        self.sendErrors = 0
+        self.maxQueueDepth = 0
+        self.totalLatencySec = 0
+        self.maxLatencySec = 0
+        self.senderThread = Thread(target=self.senderThreadMain, daemon=True)
+        self.senderThread.start()
+
+    def send(self, frame, pauseBeforeSec=0):
+        #queue a frame; pauseBeforeSec holds it until at least that long after the frame before it went out, instead of
+        #its class's spacing if that is longer. False if it was coalesced with one already queued
+        with self.condition:
+            return self.queue(frame, pauseBeforeSec)[1]
+
+    def sendAndWait(self, frame, pauseBeforeSec=0, timeoutSec=None):
+        #send(), then wait until the frame - or the identical one it was coalesced with - has been written. False on timeout
+        with self.condition:
+            seq = self.queue(frame, pauseBeforeSec)[0]
+            return self.condition.wait_for(lambda: seq not in self.unsentSeqs, timeoutSec)
+
+    def queue(self, frame, pauseBeforeSec): #with condition held; -> (seq of the frame queued, whether this one was queued)
+        key = tuple(frame)
+        receiver = getReceiverKey(frame)
+        newest = self.newestQueued.get(receiver)
+        if (newest is not None and newest[1] == key):
+            self.framesCoalesced += 1
+            return newest[0], False
+        seq = self.nextSeq
+        self.nextSeq += 1
+        priority = MESSAGE_PRIORITIES.get(frame[2], PRIORITY_POWER)
+        heapq.heappush(self.heap, (priority, seq, list(frame), pauseBeforeSec, time.monotonic()))
+        if (isinstance(receiver, tuple)):
+            self.newestQueued.clear()
+        self.newestQueued[receiver] = (seq, key)
+        self.unsentSeqs.add(seq)
+        self.framesQueued += 1
+        self.maxQueueDepth = max(self.maxQueueDepth, len(self.heap))
+        self.condition.notify_all()
+        return seq, True
+
+    def drain(self, timeoutSec=None): #waits until everything queued so far has been sent
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.heap and not self.sending, timeoutSec)
+
+    def getCounters(self):
+        with self.condition:
+            return {
+                "queueDepth": len(self.heap),
+                "maxQueueDepth": self.maxQueueDepth,
+                "framesQueued": self.framesQueued,
+                "framesSent": self.framesSent,
+                "framesCoalesced": self.framesCoalesced,
+                "sendErrors": self.sendErrors,
+                "averageSendLatencySec": self.totalLatencySec / self.framesSent if self.framesSent else 0,
+                "maxSendLatencySec": self.maxLatencySec
+            }
+
+    def senderThreadMain(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.heap)
+                priority, seq, frame, pauseBeforeSec, queuedTime = self.heap[0]
+                waitSec = self.lastSentTime + max(self.spacingSec[priority], pauseBeforeSec) - time.monotonic()
+                if (waitSec > 0):
+                    self.condition.wait(waitSec) #a more urgent frame queued meanwhile is picked up on the next pass
+                    continue
+                heapq.heappop(self.heap)
+                receiver = getReceiverKey(frame)
+                if (self.newestQueued.get(receiver, (None, ))[0] == seq):
+                    del self.newestQueued[receiver]
+                self.sending = True
+            try:
+                self.writeFrame(frame)
+            except Exception as e:
+                print(f">>>>ERROR SENDING FRAME {frame} {e}")
+                self.sendErrors += 1
+            with self.condition:
+                self.unsentSeqs.discard(seq)
+                self.lastSentTime = time.monotonic()
+                latencySec = self.lastSentTime - queuedTime
+                self.framesSent += 1
+                self.totalLatencySec += latencySec
+                self.maxLatencySec = max(self.maxLatencySec, latencySec)
+                self.sending = False
+                self.condition.notify_all()
@@ -1,6 +1,7 @@
 import { createSlice } from '@reduxjs/toolkit'
 
 export type PastEvent = {
+    seq: number; //increasing, never reused by the controller
     event: string;
     time: string;
     trigger?: string;
@@ -9,6 +10,26 @@ export type PastEvent = {
   
 export type PastEventsResponse = {
     pastEvents: PastEvent[];
+    latestSeq?: number; //newest event in the page - new events are asked for from here
+    oldestSeq?: number | null; //oldest event the controller still keeps - older pages can be loaded down to it
+    reset?: boolean; //the controller's events were cleared since the last request - replace, don't merge
+    more?: boolean; //there are newer events than this page held, fetch again from latestSeq
+    error?: string;
+}
+
+export type EventSearchQuery = {
+    device?: string; //hex id, e.g. 0x50
+    event?: string; //event type, e.g. TRIGGERED-ALARM
+    from?: number; //epoch seconds, inclusive
+    to?: number; //epoch seconds, exclusive
+    before?: number; //seq - only events older than this (next page)
+}
+
+export type EventSearchResponse = {
+    events: PastEvent[];
+    oldestSeq?: number | null;
+    more?: boolean; //there are probably more matches older than oldestSeq
+    error?: string; //the controller couldn't search for what was asked, e.g. a device that isn't a hex id
 }
 
 export type AlarmProfile = {
@@ -27,6 +48,7 @@ export type AlarmProfilesResponse = {
 };
 
 export type StatusResponse = {
+    version: number; //incremented by the controller on every status change; a restarted controller carries on above the old one
     armStatus: string;
     alarmStatus: string;
     garageOpen: boolean;
@@ -41,11 +63,25 @@ export type StatusResponse = {
     memberCount: number;
     memberDevices: string[];
     memberDevicesReadable: string[];
+    powerSequence?: PowerSequenceStatus;
+}
+
+export type PowerSequenceStatus = {
+    running: boolean; //sensors are still being powered on/off one by one
+    done: number;
+    total: number;
+}
+
+export type StatusDelta = {
+    version: number;
+    since: number;
+    changed: Partial<StatusResponse>;
 }
 
 export interface AppState {
     status: StatusResponse;
     pastEvents: PastEventsResponse;
+    eventSearch: EventSearchResponse;
     alarmProfiles: AlarmProfilesResponse;
     isConnected: boolean;
     isError: boolean;
@@ -58,6 +94,7 @@ export type AppStateSlice = {
 
 const initialState: AppState = {
   status: {
+    version: 0,
     armStatus: "",
     alarmStatus: "",
     garageOpen: false,
@@ -76,6 +113,9 @@ const initialState: AppState = {
   pastEvents: {
     pastEvents: []
   },
+  eventSearch: {
+    events: []
+  },
   alarmProfiles: {
     profiles: []
   },
@@ -91,9 +131,28 @@ export const AppStateSlice = createSlice({
     setStatus: (state, action) => {
       state.status = action.payload
     },
+    applyStatusDelta: (state, action) => {
+      state.status = {...state.status, ...action.payload.changed, version: action.payload.version}
+    },
     setPastEvents: (state, action) => {
         state.pastEvents = action.payload
     },
+    mergePastEvents: (state, action) => { //a page of new or older events
+        const page: PastEventsResponse = action.payload;
+        const events = page.reset ? [] : state.pastEvents.pastEvents;
+        const knownSeqs = new Set(events.map((event) => event.seq));
+        const merged = events.concat(page.pastEvents.filter((event) => !knownSeqs.has(event.seq)));
+        merged.sort((a, b) => a.seq - b.seq);
+        const latestSeq = merged.length ? merged[merged.length - 1].seq : page.latestSeq;
+        state.pastEvents = { pastEvents: merged, latestSeq: latestSeq, oldestSeq: page.oldestSeq };
+    },
+    setEventSearch: (state, action) => {
+        state.eventSearch = action.payload
+    },
+    mergeOlderEventSearch: (state, action) => { //next page of the same search, older than what is shown
+        const page: EventSearchResponse = action.payload;
+        state.eventSearch = { events: page.events.concat(state.eventSearch.events), oldestSeq: page.oldestSeq, more: page.more };
+    },
     setAlarmProfiles: (state, action) => {
         state.alarmProfiles = action.payload
     },
@@ -110,6 +169,6 @@ export const AppStateSlice = createSlice({
 })
 
 // Action creators are generated for each case reducer function
-export const { setStatus, setPastEvents, setAlarmProfiles, setIsConnected, setIsError, setIsLoaded } = AppStateSlice.actions
+export const { setStatus, applyStatusDelta, setPastEvents, mergePastEvents, setEventSearch, mergeOlderEventSearch, setAlarmProfiles, setIsConnected, setIsError, setIsLoaded } = AppStateSlice.actions
 
 export default AppStateSlice.reducer
\ No newline at end of file
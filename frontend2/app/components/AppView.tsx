@@ -1,6 +1,6 @@
 "use client";
 
-import { initializeWebSocket } from "@src/WebSocketService";
+import { initializeWebSocket, emitGetOlderPastEvents } from "@src/WebSocketService";
 import TopPanel from "@components/TopPanel";
 import IndicatorPanel from "@components/IndicatorPanel";
 import ButtonWithDrawer from "@components/ButtonWithDrawer";
@@ -8,6 +8,7 @@ import GarageDoorButton from "@/app/components/GarageDoorButton";
 import UnavailableOverlay from "@components/UnavailableOverlay";
 import ArmButtonList from "@components/ArmButtonList";
 import SpecialFunctions from "@components/SpecialFunctions";
+import EventSearch from "@components/EventSearch";
 import TopPanelSpacer from "@components/TopPanelSpacer";
 import Button from "@components/Button";
 import Image from "next/image";
@@ -28,6 +29,8 @@ const AppView: React.FC = () => {
     
     const serviceAvailable = appState.isConnected && !appState.isError && appState.isLoaded;
     const alarmTriggered = appState.status.alarmStatus === 'ALARM';
+    const oldestPastEventSeq = appState.pastEvents.oldestSeq;
+    const hasOlderPastEvents = appState.pastEvents.pastEvents.length > 0 && oldestPastEventSeq != null && appState.pastEvents.pastEvents[0].seq > oldestPastEventSeq;
     const unavailableContent = <div style={{display: "flex", flexDirection: "column", alignItems: "center"}}>
             Service Unavailable
             <Image className="fadeoutImageRound" src={"/assets/dogsleep.jpg"} width="150" height="150" alt=""></Image>
@@ -79,9 +82,11 @@ const AppView: React.FC = () => {
                             <div style={{display: "flex", gap: 10}}>
                                 <Button onClick={(e) => {scrollToBottom("eventsContainer")}} className="scrollToBottomBtn scroll-btn">Bottom</Button>
                                 <Button onClick={(e) => {scrollToTop("eventsContainer")}}  className="scrollToTopBtn scroll-btn">Top</Button>
+                                {hasOlderPastEvents && <Button onClick={(e) => {emitGetOlderPastEvents(appState.pastEvents.pastEvents[0].seq)}} className="scroll-btn">Older</Button>}
                             </div>
                             <pre id="eventsContainer" className="dimmable">{JSON.stringify(appState.pastEvents, null, 2)}</pre>
                         </ButtonWithDrawer>
+                        <ButtonWithDrawer flexDirection="column" justifyContent="flex-start" buttonText="Search Events" containsScrollable><EventSearch></EventSearch></ButtonWithDrawer>
                         <ButtonWithDrawer flexDirection="column" justifyContent="flex-start" buttonText="Profiles" containsScrollable>
                             <div style={{display: "flex", gap: 10}}>
                                 <Button onClick={(e) => {scrollToBottom("profilesContainer")}} className="scrollToBottomBtn scroll-btn">Bottom</Button>
@@ -0,0 +1,68 @@
+"use client";
+import React, { MouseEventHandler } from "react";
+import styled from "styled-components";
+import Button from "./Button";
+import { emitSearchEvents, emitSearchOlderEvents } from "@src/WebSocketService";
+import Panel from "./Panel";
+import { AppState, AppStateSlice } from "./AppStateSlice";
+import { useSelector } from "react-redux";
+import { PanelSizeStyle, PanelLayoutStyle } from "./SpecialFunctions";
+
+const EventSearchStyle = styled.div`
+    ${PanelSizeStyle}
+    ${PanelLayoutStyle}
+    flex-direction: column;
+`;
+
+const getFieldValue = (id: string): string => {
+    return (document?.getElementById(id) as HTMLInputElement)?.value.trim() ?? "";
+};
+
+const getDateFieldSec = (id: string, addDays: number): number | undefined => { //date inputs are local days; "to" includes the whole day
+    const value = (document?.getElementById(id) as HTMLInputElement)?.valueAsDate;
+    return value ? value.getTime() / 1000 + value.getTimezoneOffset() * 60 + addDays * 86400 : undefined;
+};
+
+const searchHandler : MouseEventHandler<HTMLButtonElement> = function(event) {
+    emitSearchEvents({
+        device: getFieldValue('search-device-field') || undefined,
+        event: getFieldValue('search-event-field') || undefined,
+        from: getDateFieldSec('search-from-field', 0),
+        to: getDateFieldSec('search-to-field', 1)
+    });
+};
+
+const EventSearch: React.FC<{
+    className?: string
+}> = ({ className }) => {
+    const appState: AppState = useSelector((state: AppStateSlice) => state.appState);
+    const eventSearch = appState.eventSearch;
+
+    return (
+        <EventSearchStyle className={className}>
+            <Panel>
+            <div className="input-wrapper" style={{position: "relative", display: "inline-block"}}>
+                <input type="text" id="search-device-field" className="dimmable input-field" name="device" placeholder="0x50" />
+                <span className="input-hint" style={{position: "absolute", right: 7}}>DEVICE</span>
+            </div>
+            <div className="input-wrapper" style={{position: "relative", display: "inline-block"}}>
+                <input type="text" id="search-event-field" className="dimmable input-field" name="event" placeholder="TRIGGERED-ALARM" />
+                <span className="input-hint" style={{position: "absolute", right: 7}}>EVENT</span>
+            </div>
+            <div className="input-wrapper" style={{position: "relative", display: "inline-block"}}>
+                <input type="date" id="search-from-field" className="dimmable input-field" name="from" />
+                <span className="input-hint" style={{position: "absolute", right: 7}}>FROM</span>
+            </div>
+            <div className="input-wrapper" style={{position: "relative", display: "inline-block"}}>
+                <input type="date" id="search-to-field" className="dimmable input-field" name="to" />
+                <span className="input-hint" style={{position: "absolute", right: 7}}>TO</span>
+            </div>
+            <Button id="search-events" className="smallbutton gray dimmable" onClick={searchHandler}>search</Button>
+            {eventSearch.more && eventSearch.oldestSeq != null && <Button id="search-events-older" className="smallbutton gray dimmable" onClick={(e) => {emitSearchOlderEvents(eventSearch.oldestSeq as number)}}>older</Button>}
+            </Panel>
+            <pre id="eventSearchContainer" className="dimmable">{JSON.stringify(eventSearch, null, 2)}</pre>
+        </EventSearchStyle>
+    );
+};
+
+export default EventSearch;
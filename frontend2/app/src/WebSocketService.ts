@@ -1,9 +1,11 @@
 import * as Comlink from "comlink";
 import { ComWorkerAPI } from "@/app/workers/ComWorker";
-import { setStatus, setPastEvents, setAlarmProfiles, setIsConnected, setIsError, setIsLoaded } from "@components/AppStateSlice";
+import { setStatus, applyStatusDelta, mergePastEvents, setEventSearch, mergeOlderEventSearch, setAlarmProfiles, setIsConnected, setIsError, setIsLoaded, StatusResponse, StatusDelta, PastEventsResponse, EventSearchQuery } from "@components/AppStateSlice";
 
 let comAPI: Comlink.Remote<ComWorkerAPI> | null = null;
 let lastClickTime: EpochTimeStamp = 0;
+let newestEventSeq: number | undefined = undefined; //newest past event held, only newer ones are requested
+let lastEventSearch: EventSearchQuery = {}; //the search shown, for fetching its older pages
 const timeout: number = 2500;
 
 export const initializeWebSocket = (dispatch: (action: any) => void) => {
@@ -12,31 +14,69 @@ export const initializeWebSocket = (dispatch: (action: any) => void) => {
   let firstLoad = true;
 
   let getPastEventsTimeout: undefined | NodeJS.Timeout = undefined;
+  let statusVersion = -1; //version of the status currently held in the store
 
   const statusHandler = (message: object): void => {
+	statusVersion = (message as StatusResponse).version;
 	dispatch(setStatus(message));
-	
+	schedulePastEventsFetch();
+  };
+
+  const statusDeltaHandler = (message: object): void => {
+	const delta = message as StatusDelta;
+	if (delta.since !== statusVersion) { //missed an update - ask for the whole status instead
+	  comAPI?.emitEvent('getStatus', { message: undefined });
+	  return;
+	}
+	statusVersion = delta.version;
+	dispatch(applyStatusDelta(delta));
+	schedulePastEventsFetch();
+  };
+
+  const schedulePastEventsFetch = (): void => {
 	if (getPastEventsTimeout) { clearTimeout(getPastEventsTimeout); }
 	getPastEventsTimeout = setTimeout(() => {
 		dispatch(setIsLoaded(true));
-		comAPI?.emitEvent('getPastEvents', { message: undefined });
+		comAPI?.emitEvent('getPastEvents', { message: { since: newestEventSeq } });
 	  if (getPastEventsTimeout) clearTimeout(getPastEventsTimeout);
 	  firstLoad = false;
 	}, firstLoad ? 1 : 3000);
   };
 
   const pastEventsHandler = (message: object): void => {
-	dispatch(setPastEvents(message));
+	const page = message as PastEventsResponse;
+	if (page.reset || newestEventSeq === undefined || (page.latestSeq ?? 0) > newestEventSeq) {
+	  newestEventSeq = page.latestSeq;
+	}
+	dispatch(mergePastEvents(page));
+	if (page.more && newestEventSeq !== undefined) { //more than a page behind - keep going from where this one ended
+	  comAPI?.emitEvent('getPastEvents', { message: { since: newestEventSeq } });
+	}
+  };
+
+  const eventSearchHandler = (message: object): void => {
+	dispatch(lastEventSearch.before === undefined ? setEventSearch(message) : mergeOlderEventSearch(message));
   };
 
   const alarmProfilesHandler = (message: object): void => {
 	dispatch(setAlarmProfiles(message));
   };
 
+  const rpcErrorHandler = (message: object): void => { //the server gave up waiting on the alarm engine for a request of ours
+	const error = message as { request: string, error: string };
+	console.log(`request ${error.request} failed: ${error.error}`);
+	if (error.request === 'ALARM-STATUS') { //don't sit on "loading" - ask again
+	  setTimeout(() => comAPI?.emitEvent('getStatus', { message: undefined }), 1000);
+	}
+  };
+
   const handlerMappings: Record<string, (data: object) => void> = {
 	'postStatus': statusHandler,
+	'postStatusDelta': statusDeltaHandler,
 	'postPastEvents': pastEventsHandler,
-	'postAlarmProfiles': alarmProfilesHandler
+	'postEventSearch': eventSearchHandler,
+	'postAlarmProfiles': alarmProfilesHandler,
+	'rpcError': rpcErrorHandler
   };
 
   const socketIOErrorHandler = (error: Error): void => {
@@ -61,7 +101,8 @@ export const initializeWebSocket = (dispatch: (action: any) => void) => {
 	Object.keys(handlerMappings),
 	Comlink.proxy(socketIOMessageHandler),
 	Comlink.proxy(socketIOErrorHandler),
-	Comlink.proxy(socketIOConnectHandler)
+	Comlink.proxy(socketIOConnectHandler),
+	{ encoding: 'json', compress: localStorage.getItem('compressPayloads') === 'true' } //opt in per device, e.g. phones on the VPN
   );
 
   return () => {
@@ -69,6 +110,26 @@ export const initializeWebSocket = (dispatch: (action: any) => void) => {
   };
 };
 
+export const emitGetOlderPastEvents = (oldestHeldSeq: number) => {
+  if (comAPI) {
+	comAPI.emitEvent('getPastEvents', {message: { before: oldestHeldSeq }});
+  }
+};
+
+export const emitSearchEvents = (query: EventSearchQuery) => {
+  if (comAPI) {
+	lastEventSearch = {...query, before: undefined};
+	comAPI.emitEvent('searchEvents', {message: lastEventSearch});
+  }
+};
+
+export const emitSearchOlderEvents = (oldestShownSeq: number) => {
+  if (comAPI) {
+	lastEventSearch = {...lastEventSearch, before: oldestShownSeq};
+	comAPI.emitEvent('searchEvents', {message: lastEventSearch});
+  }
+};
+
 export const emitGarageDoorToggleEvent = () => {
   if (comAPI) {
 	comAPI.emitEvent('toggleGarageDoorState', {message: undefined});
@@ -1,20 +1,41 @@
 import * as Comlink from 'comlink';
 import { io, Socket } from 'socket.io-client';
 
+export type PayloadOptions = {
+	encoding: 'json', //how the server should send message payloads - see controller/payloads.py
+	compress: boolean //deflate large payloads, for slow links (VPN on mobile)
+};
+
 export type ComWorkerAPI = {
 	setupWebSockets(
 		eventNames: Array<string>,
 		handlerFunction: (data: any) => void,
 		errorHandlerFunction: (data: Error) => void,
-		connectHandlerFunction: () => void ): void;
+		connectHandlerFunction: () => void,
+		payloadOptions: PayloadOptions ): void;
 	emitEvent(eventName: string, data: object): void;
 };
 
+const HEADER_DEFLATE = 0x01; //header byte flags of binary payloads, as in controller/payloads.py
+const HEADER_MSGPACK = 0x02;
+
 let socket: Socket | null = null;
+let decoding: Promise<void> = Promise.resolve(); //payloads are decoded one after the other so events keep their order
+
+async function decodePayload(message: unknown): Promise<unknown> {
+	if (!(message instanceof ArrayBuffer)) return message; //sent as an object (e.g. rpcError)
+	const bytes = new Uint8Array(message);
+	if (bytes[0] & HEADER_MSGPACK) throw new Error('msgpack payload received, but only json was asked for');
+	let body: ArrayBuffer = bytes.slice(1).buffer;
+	if (bytes[0] & HEADER_DEFLATE) {
+		body = await new Response(new Blob([body]).stream().pipeThrough(new DecompressionStream('deflate'))).arrayBuffer();
+	}
+	return JSON.parse(new TextDecoder().decode(body));
+}
 
 const api: ComWorkerAPI = {
-	setupWebSockets(eventNames, handlerFunction, errorHandlerFunction, connectHandlerFunction): void {
-		socket = io('https://bobik.lan:8080');
+	setupWebSockets(eventNames, handlerFunction, errorHandlerFunction, connectHandlerFunction, payloadOptions): void {
+		socket = io('https://bobik.lan:8080', { auth: payloadOptions });
 
 		socket.on('connect', function() {
 			console.warn('Connected to server');
@@ -35,7 +56,11 @@ const api: ComWorkerAPI = {
 		};
 
 		eventNames.forEach((eventName: string) => {
-			socket?.on(eventName, (data: object): void => {handlerFunction({data: data, eventName: eventName})});
+			socket?.on(eventName, (data: { message: unknown }): void => {
+				decoding = decoding
+					.then(async () => handlerFunction({data: {message: await decodePayload(data.message)}, eventName: eventName}))
+					.catch((err: Error) => console.error('Could not decode ' + eventName + ': ' + err));
+			});
 		});
 	},
 	emitEvent(eventName, data): void {
@@ -1,3 +1,5 @@
 #!/bin/bash
-apt-get install mpg123 python3 libxml2-utils
+apt-get install mpg123 python3 python3-pip libxml2-utils
+#asyncio web tier (controller/asyncserver.py) and msgpack payloads (controller/payloads.py)
+pip3 install python-socketio uvicorn msgpack
 #used voicegenerator.io - shelley, kathy, sandy voices
@@ -17,6 +17,7 @@
 #include <Adafruit_VS1053.h>
 #include <SD.h>
 #include <mcp2515.h>
+#include <EEPROM.h>
 
 // define the pins used
 //#define CLK 13       // SPI Clock, shared with SD card
@@ -55,6 +56,18 @@ long sendEveryXLoops = 10000; //tied to loopIndexMax
 int deviceType = 3;
 bool isAlarmed = false;
 const int BROADCAST_ADDR = 0x00;
+const int GROUP_ADDR = 0xF0; //addressee of a group frame; the group id is in data[2]
+const int COMMAND_JOIN_GROUP = 0xE1; //data[2] = group id
+const int COMMAND_LEAVE_GROUP = 0xE2; //data[2] = group id
+const int COMMAND_CLEAR_GROUPS = 0xE3;
+const int COMMAND_QUERY_GROUPS = 0xE4; //answered with REPORT_IN_GROUP per group held, then REPORT_GROUPS_END
+const int REPORT_IN_GROUP = 0xE5; //to the home base, data[2] = group id
+const int REPORT_NOT_IN_GROUP = 0xE6; //to the home base, data[2] = group id
+const int REPORT_GROUPS_END = 0xE7; //to the home base, data[2] = number of groups held
+const int MAX_GROUPS = 8; //must match maxGroupsPerDevice in groups.py
+const int NO_GROUP = 0x00; //free slot
+const int EEPROM_GROUPS_MAGIC = 0x47; //at EEPROM address 0; anything else means the group table was never written
+byte myGroups[MAX_GROUPS]; //groups this bell is in, kept in EEPROM from address 1 on so they survive a reset
 const int DELAY_LOOP_TIME = 50;
 MCP2515::ERROR canMessageError;
 long loopIndex = 0;
@@ -75,6 +88,8 @@ void setup() {
      while (1);
   }
   Serial.println(F("VS1053 found {Serial}"));
+
+  loadGroups();
   
   if (!SD.begin(CARDCS)) {
     Serial.println(F("SD failed, or not present"));
@@ -118,7 +133,17 @@ void loop() {
   canMessageError = mcp2515.readMessage(&incomingCanMsg);
 
   if (canMessageError == MCP2515::ERROR_OK) {
-    if (incomingCanMsg.can_id == 0x14 && (incomingCanMsg.data[0] == 0x00 || incomingCanMsg.data[0] == myCanId)) { //if home base addresses to me/broadcasts a reset trip signal, stand down
+    bool addressedToMe = incomingCanMsg.data[0] == BROADCAST_ADDR || incomingCanMsg.data[0] == myCanId;
+    if (incomingCanMsg.can_id == 0x14 && addressedToMe && incomingCanMsg.data[1] == COMMAND_JOIN_GROUP) { //every group command is answered, so the home base knows it took
+      sendMessage(joinGroup(incomingCanMsg.data[2]) ? REPORT_IN_GROUP : REPORT_NOT_IN_GROUP, 0x14, myCanId, incomingCanMsg.data[2]);
+    } else if (incomingCanMsg.can_id == 0x14 && addressedToMe && incomingCanMsg.data[1] == COMMAND_LEAVE_GROUP) {
+      leaveGroup(incomingCanMsg.data[2]);
+      sendMessage(REPORT_NOT_IN_GROUP, 0x14, myCanId, incomingCanMsg.data[2]);
+    } else if (incomingCanMsg.can_id == 0x14 && addressedToMe && incomingCanMsg.data[1] == COMMAND_CLEAR_GROUPS) {
+      clearGroups();
+    } else if (incomingCanMsg.can_id == 0x14 && addressedToMe && incomingCanMsg.data[1] == COMMAND_QUERY_GROUPS) {
+      reportGroups();
+    } else if (incomingCanMsg.can_id == 0x14 && (addressedToMe || (incomingCanMsg.data[0] == GROUP_ADDR && isInGroup(incomingCanMsg.data[2])))) { //if home base addresses to me/my group/broadcasts a reset trip signal, stand down
       if (incomingCanMsg.data[1] == 0xBB) {
         isAlarmed = true;    
         currentStatus = 0xBB;
@@ -170,6 +195,65 @@ void playMusic() {
   }
 }
 
+//GROUPS
+void loadGroups() {
+  if (EEPROM.read(0) != EEPROM_GROUPS_MAGIC) {
+    clearGroups();
+    EEPROM.update(0, EEPROM_GROUPS_MAGIC);
+    return;
+  }
+  for (int slot = 0; slot < MAX_GROUPS; slot++) {
+    myGroups[slot] = EEPROM.read(1 + slot);
+  }
+}
+
+void setGroupSlot(int slot, byte groupId) {
+  myGroups[slot] = groupId;
+  EEPROM.update(1 + slot, groupId); //only writes if changed
+}
+
+bool isInGroup(byte groupId) {
+  for (int slot = 0; slot < MAX_GROUPS; slot++) {
+    if (groupId != NO_GROUP && myGroups[slot] == groupId) return true;
+  }
+  return false;
+}
+
+bool joinGroup(byte groupId) { //-> whether it is in the group now
+  if (groupId == NO_GROUP) return false;
+  if (isInGroup(groupId)) return true;
+  for (int slot = 0; slot < MAX_GROUPS; slot++) {
+    if (myGroups[slot] == NO_GROUP) {
+      setGroupSlot(slot, groupId);
+      return true;
+    }
+  }
+  return false; //no free slot - the home base keeps addressing this bell directly
+}
+
+void leaveGroup(byte groupId) {
+  for (int slot = 0; slot < MAX_GROUPS; slot++) {
+    if (myGroups[slot] == groupId) setGroupSlot(slot, NO_GROUP);
+  }
+}
+
+void clearGroups() {
+  for (int slot = 0; slot < MAX_GROUPS; slot++) {
+    setGroupSlot(slot, NO_GROUP);
+  }
+}
+
+void reportGroups() { //what is in EEPROM, so the home base only sends joins and leaves for what differs
+  int held = 0;
+  for (int slot = 0; slot < MAX_GROUPS; slot++) {
+    if (myGroups[slot] != NO_GROUP) {
+      sendMessage(REPORT_IN_GROUP, 0x14, myCanId, myGroups[slot]);
+      held++;
+    }
+  }
+  sendMessage(REPORT_GROUPS_END, 0x14, myCanId, held);
+}
+
 //COMMON
 MessageStruct parseIncomingCanMessage() {
   MessageStruct messageStruct;
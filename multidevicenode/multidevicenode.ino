@@ -1,5 +1,6 @@
 #include <SPI.h>
 #include <mcp2515.h>
+#include <EEPROM.h>
 
 const bool debugOutput = false;
 const long toneInterval = 50;	 // Interval between frequency changes (ms)
@@ -31,6 +32,17 @@ const int ALARM_STATUS_OK = 0x00;
 const int ALARM_STATUS_TRIGGERED = 0xBB;
 const int MOMENTARY_SWITCH_STATUS_OK = 0x00;
 const int MOMENTARY_SWITCH_TIMEOUT_MS = 500;
+const int GROUP_ADDR = 0xF0;			  // addressee of a group frame; the group id is in data[2]
+const int COMMAND_JOIN_GROUP = 0xE1;	  // data[2] = group id
+const int COMMAND_LEAVE_GROUP = 0xE2;	  // data[2] = group id
+const int COMMAND_CLEAR_GROUPS = 0xE3;
+const int COMMAND_QUERY_GROUPS = 0xE4;	  // answered with REPORT_IN_GROUP per group held, then REPORT_GROUPS_END
+const int REPORT_IN_GROUP = 0xE5;		  // to the home base, data[2] = group id
+const int REPORT_NOT_IN_GROUP = 0xE6;	  // to the home base, data[2] = group id
+const int REPORT_GROUPS_END = 0xE7;		  // to the home base, data[2] = number of groups held
+const int MAX_GROUPS = 8;				  // per device. must match maxGroupsPerDevice in groups.py
+const int NO_GROUP = 0x00;				  // free slot
+const int EEPROM_GROUPS_MAGIC = 0x47;	  // at EEPROM address 0; anything else means the group table was never written
 
 enum TYPE {
 	MOMENTARY_SWITCH = 1,  // garage door opener, etc
@@ -101,6 +113,7 @@ Device devices[] = {
 	}};
 
 const int numDevices = sizeof(devices) / sizeof(devices[0]); /* num connected devices */
+byte deviceGroups[numDevices][MAX_GROUPS];	// groups each device is in, kept in EEPROM from address 1 on so they survive a reset
 
 struct can_frame incomingCanMsg;
 String ERROR_NAMES[] = {"OK", "FAIL", "ALLTXBUSY", "FAILINIT", "FAILTX", "NOMSG"};
@@ -111,6 +124,7 @@ int sendEveryMillis = 1000 / numDevices;
 /// MSG FORMAT: [0] TO (1 byte, number = specific ID OR 00 = broadcast)
 ///             [1] MSG (1 byte)
 ///             [2] DEVICETYPE (1 byte)
+/// GROUP FRAMES: [0] GROUP_ADDR, [1] MSG, [2] GROUP ID - acted on by every device here that has joined that group
 /// SENSOR MESSAGE DICTIONARY (00 - enabled and status ok, AA - enabled and status alarmed, BB - trigger alarm device, CC - reset alarm, FF - disabled)
 
 // enum ERROR {
@@ -178,6 +192,86 @@ void setup() {
 
 		delay(100);	 // wait for relays to init (actually click into place) to avoid false alarms
 	}
+
+	loadGroups();
+}
+
+void loadGroups() {
+	if (EEPROM.read(0) != EEPROM_GROUPS_MAGIC) {
+		for (int i = 0; i < numDevices; i++) {
+			clearGroups(i);
+		}
+		EEPROM.update(0, EEPROM_GROUPS_MAGIC);
+		return;
+	}
+	for (int i = 0; i < numDevices; i++) {
+		for (int slot = 0; slot < MAX_GROUPS; slot++) {
+			deviceGroups[i][slot] = EEPROM.read(1 + i * MAX_GROUPS + slot);
+		}
+	}
+}
+
+void setGroupSlot(int deviceNum, int slot, byte groupId) {
+	deviceGroups[deviceNum][slot] = groupId;
+	EEPROM.update(1 + deviceNum * MAX_GROUPS + slot, groupId);	// only writes if changed
+}
+
+bool isInGroup(int deviceNum, byte groupId) {
+	for (int slot = 0; slot < MAX_GROUPS; slot++) {
+		if (groupId != NO_GROUP && deviceGroups[deviceNum][slot] == groupId) {
+			return true;
+		}
+	}
+	return false;
+}
+
+bool joinGroup(int deviceNum, byte groupId) {	// -> whether it is in the group now
+	if (groupId == NO_GROUP) {
+		return false;
+	}
+	if (isInGroup(deviceNum, groupId)) {
+		return true;
+	}
+	for (int slot = 0; slot < MAX_GROUPS; slot++) {
+		if (deviceGroups[deviceNum][slot] == NO_GROUP) {
+			setGroupSlot(deviceNum, slot, groupId);
+			return true;
+		}
+	}
+	return false;  // no free slot - the home base keeps addressing this device directly
+}
+
+void leaveGroup(int deviceNum, byte groupId) {
+	for (int slot = 0; slot < MAX_GROUPS; slot++) {
+		if (deviceGroups[deviceNum][slot] == groupId) {
+			setGroupSlot(deviceNum, slot, NO_GROUP);
+		}
+	}
+}
+
+void clearGroups(int deviceNum) {
+	for (int slot = 0; slot < MAX_GROUPS; slot++) {
+		setGroupSlot(deviceNum, slot, NO_GROUP);
+	}
+}
+
+void reportGroups(int deviceNum) {	// what is in EEPROM, so the home base only sends joins and leaves for what differs
+	int held = 0;
+	for (int slot = 0; slot < MAX_GROUPS; slot++) {
+		if (deviceGroups[deviceNum][slot] != NO_GROUP) {
+			sendGroupReport(deviceNum, REPORT_IN_GROUP, deviceGroups[deviceNum][slot]);
+			held++;
+		}
+	}
+	sendGroupReport(deviceNum, REPORT_GROUPS_END, held);
+}
+
+void sendGroupReport(int deviceNumber, int report, byte value) {	// [device, home base, report, value] - value where the device type would be
+	myCanMessage.can_id = devices[deviceNumber].myCanId;
+	myCanMessage.data[0] = HOME_BASE_CAN_ID;
+	myCanMessage.data[1] = report;
+	myCanMessage.data[2] = value;
+	mcp2515.sendMessage(&myCanMessage);
 }
 
 // for SENSOR type devices only
@@ -250,6 +344,7 @@ bool readIncomingCanMessage() {
 
 /*
  *  returns -1000 for broadcast,
+ *  returns -2000 for a group frame (see isInGroup for which devices it is for),
  *  returns -1 for not matched,
  *  returns id of device in devices array. id is in range [0, numDevices)
  */
@@ -260,6 +355,9 @@ int matchMessageToThisDevice() {
 		{
 			return -1000;  // broadcast
 		}
+		if (incomingCanMsg.data[0] == GROUP_ADDR) {
+			return -2000;  // group
+		}
 		for (int i = 0; i < numDevices; i++) {
 			if (incomingCanMsg.data[0] == devices[i].myCanId) {	 // received message has recipient specified as one of the devices in "devices"
 				return i;										 // device array index in devices
@@ -280,6 +378,13 @@ void processIncomingCanMessage() {
 		for (int i = 0; i < numDevices; i++) {
 			setStateAccordingToMessage(i);
 		}
+	} else if (deviceNum == -2000) {
+		debugMessage = ">>>>>>>>>>>MESSAGE MATCHED TO GROUP " + String(incomingCanMsg.data[2], HEX) + ">>>>>>>>>>>";
+		for (int i = 0; i < numDevices; i++) {
+			if (isInGroup(i, incomingCanMsg.data[2])) {
+				setStateAccordingToMessage(i);
+			}
+		}
 	} else {
 		debugMessage = ">>>>>>>>>>>MESSAGE MATCHED TO DEVICE " + String(devices[deviceNum].myCanId, HEX) + ">>>>>>>>>>>";
 		setStateAccordingToMessage(deviceNum);
@@ -294,6 +399,21 @@ void processIncomingCanMessage() {
 void setStateAccordingToMessage(int deviceNum) {
 	bool newState;	//true = enabled; false = disabled
 
+	if (incomingCanMsg.data[1] == COMMAND_JOIN_GROUP) {	 // group membership, for any type of device. answered, so the home base knows it took
+		sendGroupReport(deviceNum, joinGroup(deviceNum, incomingCanMsg.data[2]) ? REPORT_IN_GROUP : REPORT_NOT_IN_GROUP, incomingCanMsg.data[2]);
+		return;
+	} else if (incomingCanMsg.data[1] == COMMAND_LEAVE_GROUP) {
+		leaveGroup(deviceNum, incomingCanMsg.data[2]);
+		sendGroupReport(deviceNum, REPORT_NOT_IN_GROUP, incomingCanMsg.data[2]);
+		return;
+	} else if (incomingCanMsg.data[1] == COMMAND_CLEAR_GROUPS) {
+		clearGroups(deviceNum);
+		return;
+	} else if (incomingCanMsg.data[1] == COMMAND_QUERY_GROUPS) {
+		reportGroups(deviceNum);
+		return;
+	}
+
 	if (devices[deviceNum].type == SENSOR) {
 		if (incomingCanMsg.data[1] == COMMAND_ENABLE_DEVICE) {	// enable
 			newState = true;